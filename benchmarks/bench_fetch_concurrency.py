@@ -0,0 +1,30 @@
+"""
+Compares sequential and concurrent dialog history fetching against a fake client.
+
+Usage: python -m benchmarks.bench_fetch_concurrency [--latency 0.05] [--chats 100]
+"""
+import argparse
+import asyncio
+import time
+
+from main import get_recent_client_chats
+from replay import FakeTelegramClient
+
+
+async def run(chats: int, latency: float, concurrency_levels):
+    for concurrency in concurrency_levels:
+        client = FakeTelegramClient(dialog_count=chats, latency=latency)
+        started = time.perf_counter()
+        result = await get_recent_client_chats(client, chat_limit=chats, concurrency=concurrency)
+        elapsed = time.perf_counter() - started
+        print(f"concurrency={concurrency:<3} chats={len(result):<5} "
+              f"requests={client.requests:<5} time={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+    asyncio.run(run(args.chats, args.latency, args.concurrency))
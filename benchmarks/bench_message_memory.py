@@ -0,0 +1,66 @@
+"""
+Compares the memory held by fetched histories as Telethon Message objects and as MessageRecord.
+
+Messages carry the fields Telegram usually sends for private chats (entities, reply headers).
+Real fetched messages hold even more, e.g. references to the client and cached senders.
+
+Usage: python -m benchmarks.bench_message_memory [--messages 200000]
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from telethon.tl.types import Message, MessageEntityBold, MessageEntityUrl, MessageReplyHeader, PeerUser
+
+from message_record import to_records
+
+MANAGER_ID = 1
+
+
+def make_messages(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for message_id in range(1, count + 1):
+        date += timedelta(seconds=rng.randint(10, 3600))
+        text = rng.choice(["Hello, what is the price?", "Sure, see https://example.com/catalog", "Thanks!"])
+        messages.append(Message(
+            id=message_id,
+            peer_id=PeerUser(1000),
+            date=date,
+            message=text,
+            out=rng.random() < 0.5,
+            from_id=PeerUser(rng.choice([MANAGER_ID, 1000])),
+            reply_to=MessageReplyHeader(reply_to_msg_id=message_id - 1) if rng.random() < 0.2 else None,
+            entities=[MessageEntityUrl(offset=9, length=27), MessageEntityBold(offset=0, length=4)]
+            if "https" in text else None,
+        ))
+    return messages
+
+
+def main(count: int):
+    gc.collect()
+    tracemalloc.start()
+    messages = make_messages(count)
+    message_bytes = tracemalloc.get_traced_memory()[0]
+
+    # Converted at fetch time, the Telethon objects are dropped right away
+    records = to_records(messages)
+    del messages
+    gc.collect()
+    record_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{len(records)} messages")
+    print(f"Telethon Message objects: {message_bytes / 2 ** 20:.1f} MiB ({message_bytes / count:.0f} B per message)")
+    print(f"MessageRecord:            {record_bytes / 2 ** 20:.1f} MiB ({record_bytes / count:.0f} B per message)")
+    print(f"saved: {1 - record_bytes / message_bytes:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+    main(args.messages)
@@ -0,0 +1,99 @@
+"""
+Measures the promise pre-filter against promise verdicts it had no part in producing.
+
+Today every conversation is sent to the LLM for the promise check. The pre-filter skips the
+ones it considers promise-free: the benchmark reports how many checks are saved, which
+conversations with an unfinished promise would be skipped by mistake and the filtering throughput.
+
+Verdicts come either from a hand-labelled corpus of English and Russian chats
+(benchmarks/data/promise_labels.jsonl, one {"conversation": ..., "has_unfinished_promises": ...}
+object per line), or from the LLM answers of a run recorded with `python main.py --record DIR`.
+Record such runs with PROMISE_PREFILTER=false, otherwise the LLM was never asked about the chats
+the pre-filter skipped. Conversations whose prompts aren't in the recording are left out.
+
+Usage: python -m benchmarks.bench_promise_prefilter [--labels PATH] [--recording DIR] [--repeat 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List, Tuple
+
+from promise_prefilter import PromisePrefilter
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(__file__), "data", "promise_labels.jsonl")
+
+
+def load_labels(path: str) -> List[Tuple[str, bool]]:
+    corpus = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                corpus.append((record['conversation'], bool(record['has_unfinished_promises'])))
+    return corpus
+
+
+async def label_recording(recording_dir: str) -> List[Tuple[str, bool]]:
+    """Conversations of a recorded run with the promise verdicts the LLM gave for them"""
+    from main import create_gemini_wrapper, format_conversation_to_strings, get_recent_client_chats
+    from replay import FakeTelegramClient, ReplayGenerativeModel
+    from settings import TelegramScrapingSettings
+
+    # Same settings as the recorded run, minus the local stores and the pre-filter being measured
+    settings = TelegramScrapingSettings().model_copy(update={
+        'message_store_path': "", 'gemini_cache_path': "", 'promise_prefilter': False, 'gemini_max_attempts': 1,
+    })
+    gemini = create_gemini_wrapper(settings, lambda name: ReplayGenerativeModel(
+        os.path.join(recording_dir, "gemini.jsonl"), model_name=name))
+    client = FakeTelegramClient.from_recording(os.path.join(recording_dir, "telegram.json"))
+
+    async with client:
+        my_id = (await client.get_me()).id
+        chats = await get_recent_client_chats(client, chat_limit=settings.chat_limit, now=client.now)
+
+    corpus = []
+    for dialog, messages in chats:
+        conversation = "\n".join(format_conversation_to_strings(dialog, messages, my_id))
+        try:
+            analysis = await gemini.async_analyze_conversation(conversation)
+        except Exception:
+            continue  # not recorded with these settings
+        corpus.append((conversation, analysis['has_unfinished_promises']))
+    return corpus
+
+
+def run(corpus: List[Tuple[str, bool]], repeat: int):
+    prefilter = PromisePrefilter()
+    verdicts = [prefilter.may_contain_promise(text) for text, _ in corpus]
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, _ in corpus:
+            prefilter.may_contain_promise(text)
+    elapsed = time.perf_counter() - started
+
+    chats = len(corpus)
+    promises = sum(1 for _, has_promise in corpus if has_promise)
+    skipped = verdicts.count(False)
+    missed = [text for (text, has_promise), verdict in zip(corpus, verdicts) if has_promise and not verdict]
+    print(f"chats={chats} with unfinished promises={promises}")
+    print(f"all-LLM promise checks: {chats}, with pre-filter: {chats - skipped} "
+          f"({skipped / chats if chats else 0:.1%} saved)")
+    print(f"promises missed: {len(missed)} (recall {1 - len(missed) / promises if promises else 1:.2%}), "
+          f"precision of skips: {(skipped - len(missed)) / skipped if skipped else 1:.2%}")
+    for text in missed:
+        print("  missed: " + text.replace("\n", " | "))
+    if chats and repeat:
+        print(f"filter time: {elapsed / (chats * repeat) * 1e6:.1f}us per chat")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", default=DEFAULT_LABELS)
+    parser.add_argument("--recording", help="Directory of a run recorded with PROMISE_PREFILTER=false")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+    corpus = asyncio.run(label_recording(args.recording)) if args.recording else load_labels(args.labels)
+    run(corpus, args.repeat)
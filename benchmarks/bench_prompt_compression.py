@@ -0,0 +1,67 @@
+"""
+Measures how much prompt compression shrinks noisy synthetic chats before they are sent to Gemini.
+
+Chats mix real questions and answers with repeated greetings, emoji-only messages,
+acknowledgements and a long price list pasted several times, as client chats often do.
+
+Usage: python -m benchmarks.bench_prompt_compression [--chats 1000] [--seed 0]
+"""
+import argparse
+import random
+import time
+
+from conversation_chunking import estimate_tokens
+from prompt_compression import ConversationCompressor
+
+CLIENT_LINES = [
+    "Hello, what's the price of the premium plan?", "Is delivery available to Berlin?", "Do you have it in blue?",
+    "Здравствуйте, сколько стоит доставка?", "Есть ли скидки?", "Где мой заказ?",
+]
+MANAGER_LINES = [
+    "The premium plan costs 20 euros per month", "Delivery to Berlin takes three days",
+    "I'll send you the invoice by the end of the day", "Доставка стоит 300 рублей", "Уточню у склада и напишу",
+]
+NOISE_LINES = ["Hello!", "Ok", "Thanks!", "👍", "🙏🙏", "Спасибо", "ок", "...", "Hello!"]
+PRICE_LIST = "\n".join(f"{index}. Model {index} widget, color {color}, {10 + index * 3} EUR, in stock"
+                       for index, color in enumerate(["red", "blue", "green", "black", "white"] * 8))
+
+
+def make_chat(rng: random.Random) -> str:
+    lines = []
+    for index in range(rng.randint(10, 120)):
+        minute = f"[06/{10 + index // 60:02d} {10 + index // 60 % 10:02d}:{index % 60:02d}]"
+        roll = rng.random()
+        if roll < 0.3:
+            lines.append(f"{minute} {rng.choice(['Client', 'Manager'])}: {rng.choice(NOISE_LINES)}")
+        elif roll < 0.35:
+            lines.append(f"{minute} Manager: {PRICE_LIST}")
+        elif index % 2 == 0:
+            lines.append(f"{minute} Client: {rng.choice(CLIENT_LINES)}")
+        else:
+            lines.append(f"{minute} Manager: {rng.choice(MANAGER_LINES)}")
+    return "\n".join(lines)
+
+
+def run(chats: int, seed: int):
+    rng = random.Random(seed)
+    corpus = [make_chat(rng) for _ in range(chats)]
+    compressor = ConversationCompressor()
+
+    started = time.perf_counter()
+    compressed = [compressor.compress(text) for text in corpus]
+    elapsed = time.perf_counter() - started
+
+    print(f"chats={chats}")
+    print(f"estimated tokens: {compressor.tokens_before} -> {compressor.tokens_after} "
+          f"({compressor.tokens_saved / compressor.tokens_before:.1%} saved)")
+    largest = max(range(chats), key=lambda index: len(corpus[index]))
+    print(f"largest chat: {estimate_tokens(corpus[largest])} -> {estimate_tokens(compressed[largest])} tokens")
+    print(f"compression time: {elapsed * 1000:.1f}ms ({elapsed / chats * 1e6:.1f}us per chat)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.chats, args.seed)
@@ -0,0 +1,56 @@
+"""
+Compares ManagerPerformanceAnalyzer with the vectorized engine on synthetic messages.
+
+Usage: python -m benchmarks.bench_vectorized_analyzer [--messages 1000000] [--chats 1000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from manager_performance import ManagerPerformanceAnalyzer
+from message_record import MessageRecord
+from vectorized_performance import analyze_frame, build_message_frame
+
+MANAGER_ID = 1
+
+
+def make_chats(message_count: int, chat_count: int, seed: int = 0):
+    rng = random.Random(seed)
+    per_chat = message_count // chat_count
+    chats = []
+    for index in range(chat_count):
+        client = 1000 + index
+        date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        messages = []
+        for message_id in range(per_chat):
+            date += timedelta(seconds=rng.randint(10, 3600))
+            messages.append(MessageRecord(message_id, date, MANAGER_ID if rng.random() < 0.5 else client, "text"))
+        chats.append((f"client {index}", messages))
+    return chats
+
+
+def main(message_count: int, chat_count: int):
+    chats = make_chats(message_count, chat_count)
+    print(f"{message_count} messages in {chat_count} chats")
+
+    started = time.perf_counter()
+    for _, messages in chats:
+        ManagerPerformanceAnalyzer(messages, MANAGER_ID).analyze()
+    print(f"ManagerPerformanceAnalyzer: {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    frame = build_message_frame(chats, MANAGER_ID)
+    built = time.perf_counter()
+    analyze_frame(frame)
+    finished = time.perf_counter()
+    print(f"vectorized: {finished - started:.2f}s "
+          f"(frame build {built - started:.2f}s, analysis {finished - built:.2f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.messages, args.chats)
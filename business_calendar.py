@@ -0,0 +1,142 @@
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+SECONDS_PER_MINUTE = 60
+# UTC offsets of all timezones are multiples of 15 minutes
+SECONDS_PER_QUARTER_HOUR = 15 * SECONDS_PER_MINUTE
+# Extra days covered around requested dates, so that tables are rebuilt rarely
+TABLE_PADDING = timedelta(days=31)
+
+DEFAULT_SHIFTS = {weekday: [(time(9), time(18))] for weekday in range(5)}
+
+
+def parse_shifts(business_days: Iterable[int], shifts: Iterable[str]) -> Dict[int, List[Tuple[time, time]]]:
+    """
+    Builds a weekday to shifts mapping from "HH:MM-HH:MM" strings, applied to every business day.
+
+    A shift ending at or before its start ends on the next day, e.g. "22:00-06:00".
+    """
+    parsed = []
+    for shift in shifts:
+        start, end = shift.split("-")
+        parsed.append((time.fromisoformat(start.strip()), time.fromisoformat(end.strip())))
+    return {weekday: list(parsed) for weekday in business_days}
+
+
+class BusinessCalendar:
+    """
+    Working time of a manager: shifts per weekday in a timezone, minus holidays.
+
+    Working minutes are precomputed into a minute-level table in UTC together with their
+    running total, so whether a moment is working time and how much working time passed
+    between two moments are O(1) lookups, also vectorized over numpy arrays of unix timestamps.
+    Tables grow on demand to cover the requested dates.
+    """
+
+    def __init__(self,
+                 timezone: str = "UTC",
+                 shifts: Dict[int, List[Tuple[time, time]]] = None,
+                 holidays: Iterable[date] = ()):
+        """
+        Args:
+            timezone: IANA name of the timezone the shifts are in
+            shifts: Weekday (0 is Monday) to (start, end) local times, defaults to Mon-Fri 9:00-18:00
+            holidays: Local dates without work
+        """
+        self.timezone = ZoneInfo(timezone)
+        self.shifts = DEFAULT_SHIFTS if shifts is None else shifts
+        self.holidays = set(holidays)
+        self._origin = 0  # unix time of the first minute of the table
+        self._working = np.zeros(0, dtype=np.int8)  # 1 for working minutes
+        self._cumulative = np.zeros(1, dtype=np.int64)  # working minutes before each minute
+
+    @classmethod
+    def from_settings(cls, settings, timezone: str = None) -> 'BusinessCalendar':
+        return cls(timezone or settings.business_timezone,
+                   parse_shifts(settings.business_days, settings.business_shifts),
+                   settings.business_holidays)
+
+    def _covers(self, first: int, last: int) -> bool:
+        return self._origin <= first and last < self._origin + len(self._working) * SECONDS_PER_MINUTE
+
+    def _build(self, first: int, last: int):
+        """Rebuilds the tables to cover unix times `first` to `last` (inclusive) and the current range"""
+        if len(self._working):
+            first = min(first, self._origin)
+            last = max(last, self._origin + len(self._working) * SECONDS_PER_MINUTE - 1)
+        padding = int(TABLE_PADDING.total_seconds())
+        origin = (first - padding) // SECONDS_PER_MINUTE * SECONDS_PER_MINUTE
+        minutes = (last + padding - origin) // SECONDS_PER_MINUTE + 1
+        working = np.zeros(minutes, dtype=np.int8)
+
+        # Shifts of the day before the range may run past midnight into it
+        day = datetime.fromtimestamp(origin, self.timezone).date() - timedelta(days=1)
+        end_day = datetime.fromtimestamp(origin + minutes * SECONDS_PER_MINUTE, self.timezone).date()
+        while day <= end_day:
+            if day not in self.holidays:
+                for shift_start, shift_end in self.shifts.get(day.weekday(), []):
+                    start = datetime.combine(day, shift_start, self.timezone)
+                    end_date = day if shift_end > shift_start else day + timedelta(days=1)
+                    end = datetime.combine(end_date, shift_end, self.timezone)
+                    start_minute = max(0, (int(start.timestamp()) - origin) // SECONDS_PER_MINUTE)
+                    end_minute = min(minutes, (int(end.timestamp()) - origin) // SECONDS_PER_MINUTE)
+                    if start_minute < end_minute:
+                        working[start_minute:end_minute] = 1
+            day += timedelta(days=1)
+
+        self._origin = origin
+        self._working = working
+        self._cumulative = np.concatenate(([0], np.cumsum(working, dtype=np.int64)))
+
+    def _minutes(self, timestamps: np.ndarray) -> np.ndarray:
+        if len(timestamps):
+            first, last = int(timestamps.min()), int(timestamps.max())
+            if not self._covers(first, last):
+                self._build(first, last)
+        return (timestamps - self._origin) // SECONDS_PER_MINUTE
+
+    def is_working_array(self, timestamps: np.ndarray) -> np.ndarray:
+        """Whether each unix timestamp falls into working time"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        minutes = self._minutes(timestamps)
+        return self._working[minutes].astype(bool)
+
+    def _working_seconds_before(self, timestamps: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+        seconds_into_minute = timestamps - self._origin - minutes * SECONDS_PER_MINUTE
+        return self._cumulative[minutes] * SECONDS_PER_MINUTE + self._working[minutes] * seconds_into_minute
+
+    def working_minutes_array(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Working time in minutes elapsed between pairs of unix timestamps"""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        # Build once for both ends
+        self._minutes(np.concatenate((starts, ends)))
+        start_minutes = self._minutes(starts)
+        end_minutes = self._minutes(ends)
+        elapsed = self._working_seconds_before(ends, end_minutes) - self._working_seconds_before(starts, start_minutes)
+        return elapsed / SECONDS_PER_MINUTE
+
+    def local_weekday_hour_array(self, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Local weekday (0 is Monday) and hour of each unix timestamp"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        # All moments of a quarter hour share the local hour, so only distinct quarters are converted
+        quarters, inverse = np.unique(timestamps // SECONDS_PER_QUARTER_HOUR, return_inverse=True)
+        moments = [datetime.fromtimestamp(quarter * SECONDS_PER_QUARTER_HOUR, self.timezone)
+                   for quarter in quarters.tolist()]
+        weekdays = np.array([moment.weekday() for moment in moments], dtype=np.int64)
+        hours = np.array([moment.hour for moment in moments], dtype=np.int64)
+        return weekdays[inverse], hours[inverse]
+
+    def is_working(self, moment: datetime) -> bool:
+        return bool(self.is_working_array(np.array([int(moment.timestamp())]))[0])
+
+    def working_minutes(self, start: datetime, end: datetime) -> float:
+        return float(self.working_minutes_array(np.array([int(start.timestamp())]),
+                                                np.array([int(end.timestamp())]))[0])
+
+
+# Monday to Friday, 9 AM to 6 PM in UTC
+DEFAULT_CALENDAR = BusinessCalendar()
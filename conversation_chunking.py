@@ -0,0 +1,145 @@
+import math
+import re
+from typing import Iterable, List
+
+# "[MM/DD HH:MM] Role: " prefix written by main.format_message
+MESSAGE_PREFIX = re.compile(r"^\[([^\]]*)\] (Manager|Client): ")
+SEVERITY_ORDER = ["none", "low", "medium", "high"]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a round trip to the API.
+
+    Latin text averages about 4 characters per token, other scripts (e.g. Cyrillic) about 2.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+
+def group_messages(lines: Iterable[str]) -> List[str]:
+    """Joins formatted lines into messages, lines without a prefix continue the message before them"""
+    messages = []
+    for line in lines:
+        if messages and not MESSAGE_PREFIX.match(line):
+            messages[-1] += "\n" + line
+        else:
+            messages.append(line)
+    return messages
+
+
+def truncate_to_tokens(line: str, max_tokens: int) -> str:
+    """Cuts a single line so that its estimate does not exceed `max_tokens`"""
+    if estimate_tokens(line) <= max_tokens:
+        return line
+    low, high = 0, len(line)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(line[:middle]) + 1 <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return line[:low] + "…"
+
+
+class ConversationChunker:
+    """
+    Splits conversations that don't fit into one prompt.
+
+    Strategies:
+        windows: consecutive windows of at most `max_tokens`, neighbouring windows share
+            about `overlap_tokens` of messages so that a promise and its fulfilment are seen together
+        tail: only the latest `max_tokens` of the conversation
+    """
+
+    def __init__(self, max_tokens: int = 8000, overlap_tokens: int = 500, strategy: str = "windows"):
+        if strategy not in ("windows", "tail"):
+            raise ValueError(f"Unknown chunking strategy: {strategy}")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.strategy = strategy
+
+    def fits(self, text: str) -> bool:
+        return estimate_tokens(text) <= self.max_tokens
+
+    def split(self, lines: List[str]) -> List[List[str]]:
+        """Splits formatted conversation messages into windows, oldest first, see `group_messages`"""
+        # "+ 1" accounts for the newline joining the lines
+        lines = [truncate_to_tokens(line, self.max_tokens - 1) for line in lines]
+        costs = [estimate_tokens(line) + 1 for line in lines]
+
+        if self.strategy == "tail":
+            return [self._tail(lines, costs)] if lines else []
+
+        windows = []
+        start = 0
+        while start < len(lines):
+            end = start
+            used = 0
+            while end < len(lines) and used + costs[end] <= self.max_tokens:
+                used += costs[end]
+                end += 1
+            windows.append(lines[start:end])
+            if end == len(lines):
+                break
+
+            # Step back to overlap with the previous window, but always move forward
+            next_start = end
+            overlap = 0
+            while next_start - 1 > start and overlap + costs[next_start - 1] <= self.overlap_tokens:
+                next_start -= 1
+                overlap += costs[next_start]
+            start = next_start
+        return windows
+
+    def _tail(self, lines: List[str], costs: List[int]) -> List[str]:
+        start = len(lines)
+        used = 0
+        while start > 0 and used + costs[start - 1] <= self.max_tokens:
+            start -= 1
+            used += costs[start]
+        return lines[start:]
+
+
+def merge_window_analyses(analyses: List[dict]) -> dict:
+    """
+    Merges {'has_unfinished_promises', 'quality_analysis'} results of the windows of one conversation.
+
+    Promise verdicts are resolved in window order: a window that fulfills a promise
+    ('fulfills_promise') settles the ones left open before it, and a window with an unfinished
+    promise leaves one open. So a promise kept in a later window isn't reported. An issue found
+    in any window is reported, issue lists are combined and the highest severity wins.
+    """
+    if len(analyses) == 1:
+        return analyses[0]
+
+    unfinished_promises = False
+    issues = []
+    severity = "none"
+    summaries = []
+    for analysis in analyses:
+        if analysis.get('fulfills_promise'):
+            unfinished_promises = False
+        if analysis['has_unfinished_promises']:
+            unfinished_promises = True
+
+        quality = analysis['quality_analysis']
+        for issue in quality.get('issues_found', []):
+            if issue not in issues:
+                issues.append(issue)
+        window_severity = quality.get('severity', "none")
+        if window_severity in SEVERITY_ORDER and \
+                SEVERITY_ORDER.index(window_severity) > SEVERITY_ORDER.index(severity):
+            severity = window_severity
+        if quality.get('summary'):
+            summaries.append(quality['summary'])
+
+    return {
+        'has_unfinished_promises': unfinished_promises,
+        'quality_analysis': {
+            "has_issues": any(analysis['quality_analysis']['has_issues'] for analysis in analyses),
+            "issues_found": issues,
+            "severity": severity,
+            "summary": " ".join(summaries)
+        }
+    }
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional
+
+from telethon import events, utils
+from telethon.tl.types import Message, User
+
+from business_calendar import BusinessCalendar
+from gemini_wrapper import GeminiWrapper
+from instrumentation import instrumentation
+from manager_performance import IncrementalPerformanceAnalyzer
+from message_record import MessageRecord
+from response_aggregates import ResponseAggregate, TeamRollup
+from settings import TelegramScrapingSettings
+
+logger = logging.getLogger(__name__)
+
+
+class LiveChat:
+    """Running metrics and recent messages of one chat watched by the daemon"""
+
+    def __init__(self,
+                 dialog_id: int,
+                 name: str,
+                 manager_id: int,
+                 calendar: BusinessCalendar = None,
+                 aggregate: ResponseAggregate = None):
+        self.dialog_id = dialog_id
+        self.name = name
+        self.analyzer = IncrementalPerformanceAnalyzer(manager_id, calendar, aggregate)
+        # Messages within the history depth, oldest first, and the formatted lines of those with text
+        self.messages: Deque[MessageRecord] = deque()
+        self.lines: List[str] = []
+        self.last_message_id = 0
+        # Incremented on every message, so that a slow analysis never overwrites a newer one
+        self.version = 0
+        self.analyzed_version = 0
+        self.analysis = None
+
+
+class LiveMetricsDaemon:
+    """
+    Keeps the Telegram client connected and updates the metrics of chats as messages arrive.
+
+    After a full fetch of the recent chats, every new private message updates the
+    IncrementalPerformanceAnalyzer of its chat. Messages arriving during the fetch are
+    buffered and applied after it. Gemini re-analysis of a chat is started `debounce` seconds
+    after its last message, so a burst of messages costs one request, and a failed one is
+    retried after `report_interval`. Reports are rewritten every `report_interval` seconds if
+    anything changed, after messages older than `history_depth` are forgotten.
+    """
+
+    def __init__(self,
+                 client,
+                 settings: TelegramScrapingSettings,
+                 gemini_wrapper: GeminiWrapper,
+                 debounce: float = 60.0,
+                 report_interval: float = 300.0,
+                 history_depth: timedelta = timedelta(days=30)):
+        self.client = client
+        self.settings = settings
+        self.gemini_wrapper = gemini_wrapper
+        self.debounce = debounce
+        self.report_interval = report_interval
+        self.history_depth = history_depth
+        self.manager_id = None
+        self.calendar = BusinessCalendar.from_settings(settings)
+        # Response times of all chats, updated with every message
+        self.rollup = TeamRollup()
+        self.aggregate = self.rollup.aggregate(settings.client_name)
+        self.chats: Dict[int, LiveChat] = {}
+        self.changed = False
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks = set()
+        # Events received while bootstrapping, None once they are handled as they arrive
+        self._pending_events: Optional[List] = None
+
+    async def bootstrap(self):
+        """Fetches the recent chats once and schedules their first analysis"""
+        from main import get_recent_client_chats
+        from message_store import MessageStore
+
+        me = await self.client.get_me()
+        self.manager_id = me.id
+
+        store = MessageStore(self.settings.message_store_path) if self.settings.message_store_path else None
+        client_chats = await get_recent_client_chats(self.client, chat_limit=self.settings.chat_limit,
+                                                     history_depth=self.history_depth,
+                                                     concurrency=self.settings.fetch_concurrency, store=store)
+        if store:
+            store.close()
+
+        for dialog, messages in client_chats:
+            chat = self._chat(dialog.id, dialog.name or f"Client_{dialog.id}")
+            for message in messages:
+                self._add(chat, message)
+            self._start_analysis(dialog.id)
+
+    def _chat(self, dialog_id: int, name: str) -> LiveChat:
+        if dialog_id not in self.chats:
+            self.chats[dialog_id] = LiveChat(dialog_id, name, self.manager_id, self.calendar, self.aggregate)
+        return self.chats[dialog_id]
+
+    def _add(self, chat: LiveChat, message: MessageRecord):
+        from main import format_message
+
+        chat.analyzer.update(message)
+        chat.messages.append(message)
+        chat.last_message_id = max(chat.last_message_id, message.id)
+        line = format_message(message, self.manager_id)
+        if line is not None:
+            chat.lines.append(line)
+        chat.version += 1
+        self.changed = True
+
+    def prune(self, now: datetime = None):
+        """
+        Forgets messages older than `history_depth`, chats left without messages are dropped.
+
+        Metrics of the remaining messages are recomputed. Response times already added to
+        the rollup stay there, it covers everything seen since the start.
+        """
+        from main import format_message
+
+        since = (now or datetime.now(timezone.utc)) - self.history_depth
+        for dialog_id, chat in list(self.chats.items()):
+            if not chat.messages or chat.messages[0].date >= since:
+                continue
+            while chat.messages and chat.messages[0].date < since:
+                chat.messages.popleft()
+            self.changed = True
+
+            if not chat.messages:
+                del self.chats[dialog_id]
+                timer = self._timers.pop(dialog_id, None)
+                if timer:
+                    timer.cancel()
+                continue
+
+            analyzer = IncrementalPerformanceAnalyzer(self.manager_id, self.calendar)
+            for message in chat.messages:
+                analyzer.update(message)
+            analyzer.aggregate = self.aggregate
+            chat.analyzer = analyzer
+            chat.lines = [line for line in (format_message(message, self.manager_id) for message in chat.messages)
+                          if line is not None]
+            chat.version += 1
+
+    def _schedule_analysis(self, dialog_id: int, delay: float):
+        timer = self._timers.pop(dialog_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[dialog_id] = asyncio.get_running_loop().call_later(delay, self._start_analysis, dialog_id)
+
+    def handle_message(self, dialog_id: int, name: str, message: Message):
+        """Updates the metrics of the chat and (re)starts the debounce timer of its analysis"""
+        chat = self.chats.get(dialog_id)
+        if chat is not None and message.id <= chat.last_message_id:
+            # Already fetched, e.g. an event received during the bootstrap
+            return
+        instrumentation.count('live_messages')
+        self._add(self._chat(dialog_id, name), MessageRecord.from_message(message))
+        self._schedule_analysis(dialog_id, self.debounce)
+
+    async def _on_new_message(self, event):
+        if self._pending_events is not None:
+            self._pending_events.append(event)
+        else:
+            await self._handle_event(event)
+
+    async def _handle_event(self, event):
+        if not event.is_private:
+            return
+        dialog_id = event.chat_id
+        name = self.chats[dialog_id].name if dialog_id in self.chats else None
+        if name is None:
+            entity = await event.get_chat()
+            if not isinstance(entity, User) or entity.bot or entity.is_self:
+                return
+            name = utils.get_display_name(entity) or f"Client_{dialog_id}"
+        self.handle_message(dialog_id, name, event.message)
+
+    def _start_analysis(self, dialog_id: int):
+        self._timers.pop(dialog_id, None)
+        if dialog_id not in self.chats:
+            return  # pruned in the meantime
+        task = asyncio.create_task(self._analyze(self.chats[dialog_id]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _analyze(self, chat: LiveChat):
+        version = chat.version
+        instrumentation.count('live_reanalyses')
+        try:
+            analysis = await self.gemini_wrapper.async_analyze_conversation("\n".join(chat.lines))
+        except Exception:
+            logger.exception("Analysis of %s failed, retrying in %s seconds", chat.name, self.report_interval)
+            instrumentation.count('live_reanalysis_failures')
+            # A newer message has already scheduled the next analysis
+            if chat.dialog_id not in self._timers and self.chats.get(chat.dialog_id) is chat:
+                self._schedule_analysis(chat.dialog_id, self.report_interval)
+            return
+        if version > chat.analyzed_version:
+            chat.analyzed_version = version
+            chat.analysis = analysis
+            self.changed = True
+
+    async def wait_for_analyses(self):
+        """Waits for the running analyses, pending debounce timers are not fired"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Analytics of all analyzed chats, in the format of main.collect_analytics"""
+        return {
+            chat.name: {'performance': chat.analyzer.result(), **chat.analysis}
+            for chat in self.chats.values() if chat.analysis is not None
+        }
+
+    def write_reports(self):
+        from main import report_results
+
+        self.changed = False
+        # Snapshots overlap, only runs are recorded in the history
+        report_results(self.snapshot(), self.settings, self.rollup, record_history=False)
+
+    async def run(self):
+        """Runs until the client disconnects"""
+        # Registered before the fetch, so that no message sent meanwhile is missed
+        self._pending_events = []
+        self.client.add_event_handler(self._on_new_message, events.NewMessage())
+        try:
+            await self.bootstrap()
+            # Events keep being buffered until the earlier ones are handled, to keep their order
+            while self._pending_events:
+                await self._handle_event(self._pending_events.pop(0))
+            self._pending_events = None
+
+            while self.client.is_connected():
+                await asyncio.sleep(self.report_interval)
+                self.prune()
+                if self.changed:
+                    self.write_reports()
+        finally:
+            self.client.remove_event_handler(self._on_new_message)
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
@@ -1,36 +1,22 @@
+import asyncio
 import json
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List
 
-import google.generativeai as genai
-
+from conversation_chunking import ConversationChunker, group_messages, merge_window_analyses
+from instrumentation import instrumentation
+from llm_cache import LLMResultCache
+from model_scheduler import ModelScheduler
+from promise_prefilter import PromisePrefilter
+from prompt_compression import ConversationCompressor
 from settings import TelegramScrapingSettings
 
-settings = TelegramScrapingSettings()
-
-genai.configure(api_key=settings.gemini_key)
-
+DEFAULT_MODEL = "gemini-1.5-flash-latest"
 
-class GeminiWrapper:
-    def __init__(self):
-        self.model = genai.GenerativeModel("gemini-1.5-flash-latest")
-        self.used_models = []
-
-    def query(self, query: str) -> str:
-        while True:
-            try:
-                response = self.model.generate_content(query)
-                return response.text
-            except Exception as e:
-                self.used_models.append(self.model.model_name)
-                models = genai.list_models()
-                for model in models:
-                    if 'generateContent' in model.supported_generation_methods:
-                        if model not in self.used_models:
-                            self.model = genai.GenerativeModel(model.name)
-                self.used_models = []
-                raise e
 
-    def check_unfinished_promises(self, conversation_text: str) -> bool:
-        prompt = """
+UNFINISHED_PROMISES_PROMPT = """
         Analyze this conversation and determine if:
         1. The manager promised to do something by the end of the day
         2. The promise wasn't fulfilled in the conversation
@@ -39,13 +25,9 @@ class GeminiWrapper:
 
         Conversation:
         {conversation}
-        """.format(conversation=conversation_text)
-
-        result = self.query(prompt)
-        return result.lower().strip() == "true"
+        """
 
-    def analyze_conversation_quality(self, conversation_text: str) -> dict:
-        prompt = """You are a JSON response generator. You must respond with ONLY valid JSON, no other text.
+CONVERSATION_QUALITY_PROMPT = """You are a JSON response generator. You must respond with ONLY valid JSON, no other text.
         Rules:
         1. Return ONLY the JSON object, no explanations or additional text
         2. The response must be parseable by json.loads()
@@ -67,17 +49,380 @@ class GeminiWrapper:
 
         Conversation to analyze:
         {conversation}
-        """.format(conversation=conversation_text)
+        """
+
+COMBINED_ANALYSIS_PROMPT = """You are a JSON response generator. You must respond with ONLY valid JSON, no other text.
+        Analyze this conversation between a manager and a client and generate a JSON response with this exact structure:
+        {{
+            "has_unfinished_promises": boolean,
+            "quality_analysis": {{
+                "has_issues": boolean,
+                "issues_found": string[],
+                "severity": "low" | "medium" | "high",
+                "summary": string
+            }}
+        }}
+
+        "has_unfinished_promises" is true only if:
+        1. The manager promised to do something by the end of the day
+        2. The promise wasn't fulfilled in the conversation
+
+        "quality_analysis" criteria:
+        - Emotional negativity or customer dissatisfaction
+        - Poor quality of manager's consultation
+        - Unresponsive or passive manager behavior
+        - Communication errors or misunderstandings
+
+        Conversation to analyze:
+        {conversation}
+        """
+
+# Windows of conversations too long for one prompt also report whether a promise is kept in them,
+# which may settle a promise of an earlier window
+WINDOW_PROMISES_PROMPT = """You are a JSON response generator. You must respond with ONLY valid JSON, no other text.
+        This is one part of a longer conversation between a manager and a client, the parts before and
+        after it are analyzed separately. Generate a JSON response with this exact structure:
+        {{
+            "has_unfinished_promises": boolean,
+            "fulfills_promise": boolean
+        }}
+
+        "has_unfinished_promises" is true only if:
+        1. The manager promised to do something by the end of the day in this part
+        2. The promise wasn't fulfilled later in this part
+
+        "fulfills_promise" is true if the manager does something promised in this part or before it,
+        e.g. sends the promised document or reports the promised task done
+
+        Conversation part to analyze:
+        {conversation}
+        """
+
+COMBINED_WINDOW_ANALYSIS_PROMPT = """You are a JSON response generator. You must respond with ONLY valid JSON, no other text.
+        This is one part of a longer conversation between a manager and a client, the parts before and
+        after it are analyzed separately. Generate a JSON response with this exact structure:
+        {{
+            "has_unfinished_promises": boolean,
+            "fulfills_promise": boolean,
+            "quality_analysis": {{
+                "has_issues": boolean,
+                "issues_found": string[],
+                "severity": "low" | "medium" | "high",
+                "summary": string
+            }}
+        }}
+
+        "has_unfinished_promises" is true only if:
+        1. The manager promised to do something by the end of the day in this part
+        2. The promise wasn't fulfilled later in this part
+
+        "fulfills_promise" is true if the manager does something promised in this part or before it,
+        e.g. sends the promised document or reports the promised task done
+
+        "quality_analysis" criteria:
+        - Emotional negativity or customer dissatisfaction
+        - Poor quality of manager's consultation
+        - Unresponsive or passive manager behavior
+        - Communication errors or misunderstandings
+
+        Conversation part to analyze:
+        {conversation}
+        """
+
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+
+class RequestRateLimiter:
+    """Allows at most `requests_per_minute` requests to start within any 60 second window"""
 
+    def __init__(self, requests_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self._started = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.requests_per_minute <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._started and now - self._started[0] >= 60:
+                    self._started.popleft()
+                if len(self._started) < self.requests_per_minute:
+                    self._started.append(now)
+                    return
+                await asyncio.sleep(60 - (now - self._started[0]))
+
+
+class GeminiWrapper:
+    def __init__(self,
+                 max_concurrency: int = 4,
+                 requests_per_minute: int = 15,
+                 combined_analysis: bool = True,
+                 cache: LLMResultCache = None,
+                 chunker: ConversationChunker = None,
+                 scheduler: ModelScheduler = None,
+                 prefilter: PromisePrefilter = None,
+                 compressor: ConversationCompressor = None):
+        """
+        Args:
+            max_concurrency: Maximum number of LLM requests in flight at once
+            requests_per_minute: Request budget, 0 disables rate limiting
+            combined_analysis: Request both analyses of a conversation in a single call
+                instead of two separate prompts
+            cache: Optional persistent cache of LLM results
+            chunker: Optional splitter of conversations too long for a single prompt
+            scheduler: Retry and model fallback policy, defaults to DEFAULT_MODEL with discovered fallbacks
+                and the API key from the settings
+            prefilter: Optional local check skipping the promise analysis of conversations
+                in which the manager promised nothing
+            compressor: Optional deduplication and shortening of conversations before they are prompted
+        """
+        self.scheduler = scheduler or ModelScheduler([DEFAULT_MODEL], api_key=TelegramScrapingSettings().gemini_key)
+        self.combined_analysis = combined_analysis
+        self.cache = cache
+        self.chunker = chunker
+        self.prefilter = prefilter
+        self.compressor = compressor
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.rate_limiter = RequestRateLimiter(requests_per_minute)
+
+    @asynccontextmanager
+    async def _request_slot(self):
+        async with self.semaphore:
+            await self.rate_limiter.acquire()
+            yield
+
+    def query(self, query: str, generation_config: dict = None) -> str:
+        return self.scheduler.generate(query, generation_config)
+
+    async def async_query(self, query: str, generation_config: dict = None) -> str:
+        """Non-blocking version of `query`, bounded by the concurrency cap and the requests-per-minute budget"""
+        return await self.scheduler.generate_async(query, generation_config, slot=self._request_slot)
+
+    def _cached_query(self, template: str, conversation_text: str, parse: Callable,
+                      generation_config: dict = None):
+        """
+        Queries the model with `template` filled with the conversation and returns the parsed result.
+
+        Raw responses are cached only once `parse` accepted them, so malformed output is retried next time.
+        """
+        key = self.cache.make_key(template, self.scheduler.primary_model_name, conversation_text) if self.cache else None
+        result = self.cache.get(key) if key else None
+        if result is not None:
+            return parse(result)
+
+        result = self.query(template.format(conversation=conversation_text), generation_config)
+        parsed = parse(result)
+        if key:
+            self.cache.set(key, result)
+        return parsed
+
+    async def _async_cached_query(self, template: str, conversation_text: str, parse: Callable,
+                                  generation_config: dict = None):
+        """Async version of `_cached_query`"""
+        key = self.cache.make_key(template, self.scheduler.primary_model_name, conversation_text) if self.cache else None
+        result = self.cache.get(key) if key else None
+        if result is not None:
+            return parse(result)
+
+        result = await self.async_query(template.format(conversation=conversation_text), generation_config)
+        parsed = parse(result)
+        if key:
+            self.cache.set(key, result)
+        return parsed
+
+    @staticmethod
+    def _parse_unfinished_promises(result: str) -> bool:
+        return result.lower().strip() == "true"
+
+    @staticmethod
+    def _quality_error(error: Exception) -> dict:
+        return {
+            "has_issues": False,
+            "issues_found": [],
+            "severity": "none",
+            "summary": f"Error analyzing conversation: {str(error)}"
+        }
+
+    @classmethod
+    def analysis_error(cls, error: Exception) -> dict:
+        """Result of a conversation whose analysis failed even after retries"""
+        return {
+            'has_unfinished_promises': False,
+            'quality_analysis': cls._quality_error(error)
+        }
+
+    @staticmethod
+    def _parse_combined_analysis(result: str) -> dict:
+        data = json.loads(result)
+        quality = data['quality_analysis']
+        return {
+            'has_unfinished_promises': bool(data['has_unfinished_promises']),
+            'quality_analysis': {
+                "has_issues": bool(quality['has_issues']),
+                "issues_found": list(quality.get('issues_found', [])),
+                "severity": quality.get('severity', "none"),
+                "summary": quality.get('summary', "")
+            }
+        }
+
+    @classmethod
+    def _parse_combined_window_analysis(cls, result: str) -> dict:
+        return {**cls._parse_combined_analysis(result),
+                'fulfills_promise': bool(json.loads(result).get('fulfills_promise', False))}
+
+    @staticmethod
+    def _parse_window_promises(result: str) -> dict:
+        data = json.loads(result)
+        return {
+            'has_unfinished_promises': bool(data['has_unfinished_promises']),
+            'fulfills_promise': bool(data.get('fulfills_promise', False))
+        }
+
+    def check_unfinished_promises(self, conversation_text: str) -> bool:
+        return self._cached_query(UNFINISHED_PROMISES_PROMPT, conversation_text, self._parse_unfinished_promises)
+
+    def analyze_conversation_quality(self, conversation_text: str) -> dict:
+        try:
+            return self._cached_query(CONVERSATION_QUALITY_PROMPT, conversation_text, json.loads)
+        except Exception as e:
+            return self._quality_error(e)
+
+    async def async_check_unfinished_promises(self, conversation_text: str) -> bool:
+        return await self._async_cached_query(UNFINISHED_PROMISES_PROMPT, conversation_text,
+                                              self._parse_unfinished_promises)
+
+    async def async_analyze_conversation_quality(self, conversation_text: str) -> dict:
         try:
-            result = self.query(prompt)
-            return json.loads(result)
+            return await self._async_cached_query(CONVERSATION_QUALITY_PROMPT, conversation_text, json.loads)
         except Exception as e:
+            return self._quality_error(e)
+
+    def analyze_conversation(self, conversation_text: str) -> dict:
+        """
+        Runs both analyses of one conversation.
+
+        Conversations longer than the chunker allows are analyzed window by window, every window
+        also reports whether it fulfills a promise, and the verdicts are merged in window order.
+
+        Returns:
+            {'has_unfinished_promises': bool, 'quality_analysis': dict}
+        """
+        conversation_text = self._compress(conversation_text)
+        # Decided for the whole conversation, a window without a promise may still fulfill an earlier one
+        check_promises = not self._skips_promise_check(conversation_text)
+        windows = self._split(conversation_text)
+        return merge_window_analyses([self._analyze_window(window, check_promises, len(windows) > 1)
+                                      for window in windows])
+
+    async def async_analyze_conversation(self, conversation_text: str) -> dict:
+        """Async version of `analyze_conversation`, windows and separate prompts run concurrently"""
+        conversation_text = self._compress(conversation_text)
+        check_promises = not self._skips_promise_check(conversation_text)
+        windows = self._split(conversation_text)
+        analyses = await asyncio.gather(*(self._async_analyze_window(window, check_promises, len(windows) > 1)
+                                          for window in windows))
+        return merge_window_analyses(list(analyses))
+
+    def _compress(self, conversation_text: str) -> str:
+        if self.compressor is None:
+            return conversation_text
+        tokens_saved = self.compressor.tokens_saved
+        with instrumentation.stage('prompt_compression'):
+            conversation_text = self.compressor.compress(conversation_text)
+        instrumentation.count('prompt_tokens_saved', self.compressor.tokens_saved - tokens_saved)
+        return conversation_text
+
+    def _split(self, conversation_text: str) -> List[str]:
+        if not self.chunker or self.chunker.fits(conversation_text):
+            return [conversation_text]
+        # Windows start and end on message boundaries, a multi-line message is never cut apart
+        messages = group_messages(conversation_text.splitlines())
+        return ["\n".join(window) for window in self.chunker.split(messages)] or [conversation_text]
+
+    def _skips_promise_check(self, conversation_text: str) -> bool:
+        if self.prefilter is None or self.prefilter.may_contain_promise(conversation_text):
+            return False
+        instrumentation.count('promise_checks_skipped')
+        return True
+
+    def _analyze_window(self, conversation_text: str, check_promises: bool = True, windowed: bool = False) -> dict:
+        """
+        Args:
+            check_promises: False when the pre-filter found no possible promise in the conversation
+            windowed: Whether this is one of several windows, which then also report 'fulfills_promise'
+        """
+        if not check_promises:
             return {
-                "has_issues": False,
-                "issues_found": [],
-                "severity": "none",
-                "summary": f"Error analyzing conversation: {str(e)}"
+                'has_unfinished_promises': False,
+                'quality_analysis': self.analyze_conversation_quality(conversation_text)
             }
 
+        if self.combined_analysis:
+            template, parse = (COMBINED_WINDOW_ANALYSIS_PROMPT, self._parse_combined_window_analysis) if windowed \
+                else (COMBINED_ANALYSIS_PROMPT, self._parse_combined_analysis)
+            try:
+                return self._cached_query(template, conversation_text, parse, JSON_GENERATION_CONFIG)
+            except (ValueError, KeyError, TypeError):
+                # Malformed structured output, fall back to the separate prompts
+                pass
+
+        if windowed:
+            promises = self._cached_query(WINDOW_PROMISES_PROMPT, conversation_text, self._parse_window_promises,
+                                          JSON_GENERATION_CONFIG)
+        else:
+            promises = {'has_unfinished_promises': self.check_unfinished_promises(conversation_text)}
+        return {**promises, 'quality_analysis': self.analyze_conversation_quality(conversation_text)}
+
+    async def _async_analyze_window(self, conversation_text: str, check_promises: bool = True,
+                                    windowed: bool = False) -> dict:
+        if not check_promises:
+            return {
+                'has_unfinished_promises': False,
+                'quality_analysis': await self.async_analyze_conversation_quality(conversation_text)
+            }
+
+        if self.combined_analysis:
+            template, parse = (COMBINED_WINDOW_ANALYSIS_PROMPT, self._parse_combined_window_analysis) if windowed \
+                else (COMBINED_ANALYSIS_PROMPT, self._parse_combined_analysis)
+            try:
+                return await self._async_cached_query(template, conversation_text, parse, JSON_GENERATION_CONFIG)
+            except (ValueError, KeyError, TypeError):
+                # Malformed structured output, fall back to the separate prompts
+                pass
+
+        if windowed:
+            promises, quality_analysis = await asyncio.gather(
+                self._async_cached_query(WINDOW_PROMISES_PROMPT, conversation_text, self._parse_window_promises,
+                                         JSON_GENERATION_CONFIG),
+                self.async_analyze_conversation_quality(conversation_text)
+            )
+        else:
+            has_unfinished_promises, quality_analysis = await asyncio.gather(
+                self.async_check_unfinished_promises(conversation_text),
+                self.async_analyze_conversation_quality(conversation_text)
+            )
+            promises = {'has_unfinished_promises': has_unfinished_promises}
+        return {**promises, 'quality_analysis': quality_analysis}
+
+    async def async_analyze_conversations(self, conversations: Dict[str, str]) -> Dict[str, dict]:
+        """
+        Analyzes many conversations concurrently.
+
+        Args:
+            conversations: Mapping of client name to conversation text
 
+        Returns:
+            Mapping of client name to {'has_unfinished_promises': bool, 'quality_analysis': dict}
+        """
+        names = list(conversations)
+        results = await asyncio.gather(
+            *(self.async_analyze_conversation(conversations[name]) for name in names),
+            return_exceptions=True
+        )
+        # A chat whose requests failed even after retries must not abort the whole batch
+        return {
+            name: result if not isinstance(result, Exception) else self.analysis_error(result)
+            for name, result in zip(names, results)
+        }
@@ -0,0 +1,194 @@
+import cProfile
+import json
+import math
+import os
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Upper bounds of the latency buckets in seconds, Prometheus style
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def merge(self, data: Dict):
+        """Adds the observations of another histogram, given as its `to_dict`"""
+        self.count += data['count']
+        self.total += data['total_seconds']
+        self.max = max(self.max, data['max_seconds'])
+        for index, bound in enumerate(self.buckets):
+            self.bucket_counts[index] += data['buckets'].get("+Inf" if math.isinf(bound) else str(bound), 0)
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'mean_seconds': self.total / self.count if self.count else 0,
+            'max_seconds': self.max,
+            'buckets': {
+                ("+Inf" if math.isinf(bound) else str(bound)): count
+                for bound, count in zip(self.buckets, self.bucket_counts)
+            }
+        }
+
+
+class Instrumentation:
+    """
+    Collects per-stage latency histograms and counters of a run.
+
+    Stages may overlap, e.g. concurrent requests are timed individually.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {}
+        self.counters = Counter()
+        self.started_at = time.perf_counter()
+
+    def reset(self):
+        self.stages = {}
+        self.counters = Counter()
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def observe(self, name: str, seconds: float):
+        if name not in self.stages:
+            self.stages[name] = LatencyHistogram()
+        self.stages[name].observe(seconds)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] += value
+
+    def merge(self, data: Dict):
+        """
+        Adds the counters and stage latencies of another process, given as its `to_dict`.
+
+        Wall time and peak memory stay those of this process.
+        """
+        self.counters.update(data['counters'])
+        for name, histogram in data['stages'].items():
+            if name not in self.stages:
+                self.stages[name] = LatencyHistogram()
+            self.stages[name].merge(histogram)
+
+    @staticmethod
+    def peak_memory_bytes() -> int:
+        """Peak resident set size of the process, or the tracemalloc peak where the former is unavailable"""
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if os.uname().sysname == "Darwin" else peak * 1024
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[1]
+        return 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'wall_time_seconds': time.perf_counter() - self.started_at,
+            'peak_memory_bytes': self.peak_memory_bytes(),
+            'counters': dict(self.counters),
+            'stages': {name: histogram.to_dict() for name, histogram in sorted(self.stages.items())}
+        }
+
+    def to_prometheus(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format"""
+        lines: List[str] = [
+            "# TYPE analyzer_wall_time_seconds gauge",
+            f"analyzer_wall_time_seconds {time.perf_counter() - self.started_at}",
+            "# TYPE analyzer_peak_memory_bytes gauge",
+            f"analyzer_peak_memory_bytes {self.peak_memory_bytes()}",
+        ]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE analyzer_{name}_total counter")
+            lines.append(f"analyzer_{name}_total {value}")
+
+        lines.append("# TYPE analyzer_stage_duration_seconds histogram")
+        for name, histogram in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                cumulative += count
+                label = "+Inf" if math.isinf(bound) else str(bound)
+                lines.append(f'analyzer_stage_duration_seconds_bucket{{stage="{name}",le="{label}"}} {cumulative}')
+            lines.append(f'analyzer_stage_duration_seconds_sum{{stage="{name}"}} {histogram.total}')
+            lines.append(f'analyzer_stage_duration_seconds_count{{stage="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str):
+        """Writes metrics.json and metrics.prom into `directory`"""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "metrics.json"), "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        with open(os.path.join(directory, "metrics.prom"), "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+
+
+@contextmanager
+def profiling(mode: str, directory: str):
+    """
+    Optionally profiles the enclosed code.
+
+    Args:
+        mode: "cprofile" writes profile.pstats, "tracemalloc" writes the top allocation
+            sites to tracemalloc.txt, an empty string disables profiling
+        directory: Where the profile is written
+    """
+    if not mode:
+        yield
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(directory, "profile.pstats"))
+    elif mode == "tracemalloc":
+        tracemalloc.start(25)
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(os.path.join(directory, "tracemalloc.txt"), "w", encoding="utf-8") as file:
+                file.write(f"current: {current} bytes, peak: {peak} bytes\n\n")
+                for statistic in snapshot.statistics("lineno")[:50]:
+                    file.write(f"{statistic}\n")
+    else:
+        raise ValueError(f"Unknown profile mode: {mode}")
+
+
+# Shared by all modules of a run
+instrumentation = Instrumentation()
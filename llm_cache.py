@@ -0,0 +1,108 @@
+import hashlib
+import os
+import sqlite3
+import time
+from datetime import timedelta
+from typing import Optional
+
+
+class LLMResultCache:
+    """
+    Disk-backed cache of LLM responses keyed by a hash of the prompt template,
+    the model name and the conversation text.
+
+    Entries expire after `ttl`; once the cache holds more than `max_entries`
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, ttl: timedelta = timedelta(days=7), max_entries: int = 50000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Several worker processes may share the cache file, wait for their write locks
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(template: str, model_name: str, conversation: str) -> str:
+        digest = hashlib.sha256()
+        for part in (template, model_name, conversation):
+            encoded = part.encode("utf-8")
+            # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = self._connection.execute(
+            "SELECT value, created_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        value, created_at = row
+        if now - created_at > self.ttl.total_seconds():
+            self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._connection.commit()
+            self.evictions += 1
+            self.misses += 1
+            return None
+
+        self._connection.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        self._connection.commit()
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, value, now, now)
+        )
+        self._evict(now)
+        self._connection.commit()
+
+    def _evict(self, now: float):
+        expired = self._connection.execute(
+            "DELETE FROM results WHERE created_at < ?", (now - self.ttl.total_seconds(),)
+        ).rowcount
+
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY accessed_at ASC LIMIT ?)", (overflow,)
+            )
+        self.evictions += expired + max(overflow, 0)
+
+    def stats(self) -> dict:
+        (size,) = self._connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': size
+        }
+
+    def close(self):
+        self._connection.close()
@@ -1,20 +1,37 @@
+import argparse
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Tuple, Dict
+import os
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, List, Optional, Tuple, Dict
 
 from telethon import TelegramClient
-from telethon.tl.types import User, Dialog, Message
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Dialog
 
+from business_calendar import BusinessCalendar
+from conversation_chunking import ConversationChunker
+from daemon import LiveMetricsDaemon
 from gemini_wrapper import GeminiWrapper
-from manager_performance import ManagerPerformanceAnalyzer, PerformanceReporter
+from instrumentation import instrumentation, profiling
+from llm_cache import LLMResultCache
+from manager_performance import IncrementalPerformanceAnalyzer, PerformanceReporter
+from message_record import MessageRecord, to_records
+from message_store import MessageStore
+from model_scheduler import ModelScheduler, configure_gemini
+from multi_account import analyze_accounts
+from promise_prefilter import PromisePrefilter
+from prompt_compression import ConversationCompressor
+from response_aggregates import ResponseAggregate, TeamRollup, append_history, load_history, trend
+from replay import FakeTelegramClient, RecordingGenerativeModel, RecordingTelegramClient, ReplayGenerativeModel
 from settings import TelegramScrapingSettings
+from vectorized_performance import analyze_chats
 
 
-async def create_client() -> TelegramClient:
+async def create_client(settings: TelegramScrapingSettings = None) -> TelegramClient:
     """
     Creates and configures a new Telegram client instance using settings from environment variables.
     """
-    settings = TelegramScrapingSettings()
+    settings = settings or TelegramScrapingSettings()
 
     api_id = settings.api_id
     api_hash = settings.api_hash
@@ -23,54 +40,175 @@ async def create_client() -> TelegramClient:
     return client
 
 
+async def fetch_dialog_history(client: TelegramClient,
+                               dialog: Dialog,
+                               since_date: datetime,
+                               semaphore: asyncio.Semaphore,
+                               max_flood_retries: int = 3,
+                               store: MessageStore = None) -> List[MessageRecord]:
+    """
+    Fetches the history of a single dialog as message records, waiting out Telegram FloodWait errors.
+
+    Telethon sleeps through short flood waits itself (see `flood_sleep_threshold`),
+    longer ones are raised and retried here up to `max_flood_retries` times.
+
+    With a `store`, only messages newer than the last stored one are downloaded
+    and the stored history since `since_date` is returned.
+    """
+    request = {'offset_date': since_date}
+    if store:
+        last_message = store.last_message(dialog.id)
+        if last_message:
+            last_id, last_date = last_message
+            if dialog.date <= last_date:
+                # Nothing was written to the dialog since the previous run
+                return store.load_messages(dialog.id, since_date)
+            request = {'min_id': last_id}
+
+    attempt = 0
+    while True:
+        async with semaphore:
+            try:
+                instrumentation.count('telegram_requests')
+                with instrumentation.stage('get_messages'):
+                    messages = to_records(await client.get_messages(
+                        dialog,
+                        limit=None,
+                        reverse=True,
+                        **request
+                    ))
+                break
+            except FloodWaitError as e:
+                attempt += 1
+                if attempt > max_flood_retries:
+                    raise
+                wait_seconds = e.seconds
+        # Sleep outside the semaphore so other dialogs are not blocked by our wait
+        await asyncio.sleep(wait_seconds)
+
+    if not store:
+        return messages
+
+    store.save_messages(dialog.id, messages)
+    return store.load_messages(dialog.id, since_date)
+
+
+def is_client_dialog(dialog) -> bool:
+    """Private chats with users that are not bots"""
+    return dialog.is_user and not dialog.entity.bot
+
+
+async def get_candidate_dialogs(client: TelegramClient,
+                                history_depth: timedelta,
+                                max_dialog_age: timedelta,
+                                store: MessageStore = None,
+                                now: datetime = None) -> Tuple[List[Dialog], datetime]:
+    """
+    Lists private chats with non-bot users active within `max_dialog_age`, most recently active first.
+
+    Dialogs are iterated newest first (after the pinned ones), so the iteration stops at the
+    first dialog older than `max_dialog_age`. With a `store`, it already stops at dialogs
+    not updated since the previous run and the rest is taken from the stored dialog list.
+
+    Args:
+        now: Reference time the ages are measured from, defaults to the current time
+
+    Returns:
+        Candidate dialogs and the date history should be fetched from
+    """
+    # Telegram dates are in UTC
+    now = now or datetime.now(timezone.utc)
+    since_date = now - history_depth
+    min_dialog_date = now - max_dialog_age
+
+    known_until = store.newest_dialog_date() if store else None
+    stop_date = max(min_dialog_date, known_until) if known_until else min_dialog_date
+
+    candidates = {}
+    with instrumentation.stage('dialog_discovery'):
+        async for dialog in client.iter_dialogs():
+            instrumentation.count('dialogs_scanned')
+            # Pinned dialogs are listed first regardless of their date
+            if not dialog.pinned and dialog.date < stop_date:
+                break
+            if dialog.date >= min_dialog_date and is_client_dialog(dialog):
+                candidates[dialog.id] = dialog
+
+    if store:
+        store.save_dialogs(list(candidates.values()))
+        store.prune_dialogs(min_dialog_date)
+        for dialog in store.load_dialogs(min_dialog_date):
+            candidates.setdefault(dialog.id, dialog)
+
+    return sorted(candidates.values(), key=lambda dialog: dialog.date, reverse=True), since_date
+
+
 async def get_recent_client_chats(client: TelegramClient, 
                                   chat_limit: int = 10,
                                   history_depth: timedelta = timedelta(days=30),
-                                  max_dialog_age: timedelta = timedelta(days=365)
-                                  ) -> List[Tuple[Dialog, List]]:
+                                  max_dialog_age: timedelta = timedelta(days=365),
+                                  concurrency: int = 1,
+                                  store: MessageStore = None,
+                                  now: datetime = None
+                                  ) -> List[Tuple[Dialog, List[MessageRecord]]]:
     """
     Fetches recent client chat histories.
+
+    Args:
+        client: Connected Telegram client
+        chat_limit: Maximum number of non-empty chats to return
+        history_depth: How far back to fetch messages of each chat
+        max_dialog_age: Dialogs without activity for longer than this are skipped
+        concurrency: Maximum number of dialog histories fetched at the same time
+        store: Optional local message store for incremental synchronisation
+        now: Reference time of `history_depth` and `max_dialog_age`, defaults to the current time
     """
 
-    # Use the timezone from Telegram's messages
-    dialogs = await client.get_dialogs(limit=1)
-    if not dialogs:
-        return []
+    candidates, since_date = await get_candidate_dialogs(client, history_depth, max_dialog_age, store, now)
 
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    client_chats = []
+    position = 0
 
-    reference_date = dialogs[0].date
-    now = datetime.now(reference_date.tzinfo)
-    since_date = now - history_depth
-    min_dialog_date = now - max_dialog_age
+    # Fetch only as many dialogs as are still missing to reach chat_limit, so that
+    # dialog order and the number of fetched histories match the sequential mode
+    while position < len(candidates) and len(client_chats) < chat_limit:
+        batch = candidates[position:position + chat_limit - len(client_chats)]
+        position += len(batch)
 
-    dialogs = await client.get_dialogs(limit=1000)
+        histories = await asyncio.gather(*(
+            fetch_dialog_history(client, dialog, since_date, semaphore, store=store) for dialog in batch
+        ))
 
-    client_chats = []
+        for dialog, messages in zip(batch, histories):
+            if messages:
+                client_chats.append((dialog, messages))
 
-    for dialog in dialogs:
-        if dialog.date < min_dialog_date:
-            continue
+    if store:
+        store.prune(since_date)
 
-        if not isinstance(dialog.entity, User) or dialog.entity.bot:
-            continue
+    return client_chats[:chat_limit]
 
-        messages = await client.get_messages(
-            dialog,
-            limit=None,
-            offset_date=since_date,
-            reverse=True
-        )
 
-        if messages:
-            client_chats.append((dialog, messages))
+def format_message(message: MessageRecord, my_id: int) -> Optional[str]:
+    """
+    Formats a single message as "[MM/DD HH:MM] Role: Message", None for messages without text.
+    """
+    # Skip empty messages
+    if not message.text:
+        return None
 
-        if len(client_chats) >= chat_limit:
-            break
+    # Get message time
+    time_str = message.date.strftime("%m/%d %H:%M")
 
-    return client_chats[:chat_limit]
+    # Determine sender role
+    sender_role = "Manager" if message.sender_id == my_id else "Client"
+
+    # Format the message
+    return f"[{time_str}] {sender_role}: {message.text}"
 
 
-def format_conversation_to_strings(dialog: Dialog, messages: List[Message], my_id: int) -> List[str]:
+def format_conversation_to_strings(dialog: Dialog, messages: List[MessageRecord], my_id: int) -> List[str]:
     """
     Formats a Telegram conversation into a list of formatted strings.
 
@@ -85,24 +223,14 @@ def format_conversation_to_strings(dialog: Dialog, messages: List[Message], my_i
     formatted_messages = []
 
     for message in messages:
-        # Skip empty messages
-        if not message.message:
-            continue
-
-        # Get message time
-        time_str = message.date.strftime("%m/%d %H:%M")
-
-        # Determine sender role
-        sender_role = "Manager" if message.from_id and message.from_id.user_id == my_id else "Client"
-
-        # Format the message
-        formatted_line = f"[{time_str}] {sender_role}: {message.message}"
-        formatted_messages.append(formatted_line)
+        formatted_line = format_message(message, my_id)
+        if formatted_line is not None:
+            formatted_messages.append(formatted_line)
 
     return formatted_messages
 
 
-async def format_all_conversations(client_chats: List[Tuple[Dialog, List[Message]]], my_id: int) -> Dict[
+async def format_all_conversations(client_chats: List[Tuple[Dialog, List[MessageRecord]]], my_id: int) -> Dict[
     str, List[str]]:
     """
     Formats all conversations into strings.
@@ -120,7 +248,8 @@ async def format_all_conversations(client_chats: List[Tuple[Dialog, List[Message
     return formatted_dialogs
 
 
-async def get_conversions_for_analysis(client: TelegramClient, client_chats: List[Tuple[Dialog, List[Message]]] = None):
+async def get_conversions_for_analysis(client: TelegramClient,
+                                       client_chats: List[Tuple[Dialog, List[MessageRecord]]] = None):
     # Get manager's ID
     me = await client.get_me()
     my_id = me.id
@@ -131,58 +260,398 @@ async def get_conversions_for_analysis(client: TelegramClient, client_chats: Lis
     return formatted_conversations
 
 
-async def main_func():
+async def stream_client_chats(client: TelegramClient,
+                              my_id: int,
+                              chat_limit: int = 10,
+                              history_depth: timedelta = timedelta(days=30),
+                              max_dialog_age: timedelta = timedelta(days=365),
+                              max_flood_retries: int = 3,
+                              calendar: BusinessCalendar = None,
+                              aggregate: ResponseAggregate = None,
+                              now: datetime = None
+                              ) -> AsyncIterator[Tuple[Dialog, Dict, List[str]]]:
     """
-    Main function that handles the Telegram client connection
+    Streams recent client chats without keeping message objects in memory.
+
+    Messages are consumed one by one from `client.iter_messages`, feeding an
+    IncrementalPerformanceAnalyzer and the formatter, so only running metrics and
+    the formatted text of the current chat are held.
+
+    Yields:
+        Dialog, its performance metrics and its formatted messages
     """
-    client = await create_client()
+    candidates, since_date = await get_candidate_dialogs(client, history_depth, max_dialog_age, now=now)
 
-    async with client:
-        # Get manager's ID
-        me = await client.get_me()
-        my_id = me.id
+    emitted = 0
+    for dialog in candidates:
+        if emitted >= chat_limit:
+            break
 
-        # Get recent chats
-        client_chats = await get_recent_client_chats(client)
-        all_analytics = {}
+        analyzer = IncrementalPerformanceAnalyzer(my_id, calendar, aggregate)
+        formatted_messages = []
+        request = {'offset_date': since_date}
+        attempt = 0
+        while True:
+            try:
+                instrumentation.count('telegram_requests')
+                with instrumentation.stage('iter_messages'):
+                    async for message in client.iter_messages(dialog, reverse=True, **request):
+                        message = MessageRecord.from_message(message)
+                        analyzer.update(message)
+                        formatted_line = format_message(message, my_id)
+                        if formatted_line is not None:
+                            formatted_messages.append(formatted_line)
+                        # Resume after the last processed message if the iteration is interrupted
+                        request = {'min_id': message.id}
+                break
+            except FloodWaitError as e:
+                attempt += 1
+                if attempt > max_flood_retries:
+                    raise
+                await asyncio.sleep(e.seconds)
+
+        if not analyzer.seen_messages:
+            continue
 
-        gemini_wrapper = GeminiWrapper()
+        emitted += 1
+        yield dialog, analyzer.result(), formatted_messages
+
+
+def create_gemini_wrapper(settings: TelegramScrapingSettings, model_factory: Callable = None) -> GeminiWrapper:
+    cache = None
+    if settings.gemini_cache_path:
+        cache = LLMResultCache(settings.gemini_cache_path,
+                               ttl=timedelta(days=settings.gemini_cache_ttl_days),
+                               max_entries=settings.gemini_cache_max_entries)
+
+    chunker = None
+    if settings.llm_max_prompt_tokens:
+        chunker = ConversationChunker(settings.llm_max_prompt_tokens,
+                                      settings.llm_chunk_overlap_tokens,
+                                      settings.llm_chunk_strategy)
+
+    scheduler = ModelScheduler(settings.gemini_models, max_attempts=settings.gemini_max_attempts,
+                               api_key=settings.gemini_key)
+    if model_factory:
+        scheduler.model_factory = model_factory
+
+    prefilter = PromisePrefilter() if settings.promise_prefilter else None
+    compressor = ConversationCompressor(settings.llm_max_message_chars) if settings.prompt_compression else None
+
+    return GeminiWrapper(settings.gemini_max_concurrency,
+                         settings.gemini_requests_per_minute,
+                         settings.gemini_combined_analysis,
+                         cache,
+                         chunker,
+                         scheduler,
+                         prefilter,
+                         compressor)
+
+
+async def collect_analytics(client: TelegramClient,
+                            settings: TelegramScrapingSettings,
+                            gemini_wrapper: GeminiWrapper,
+                            aggregate: ResponseAggregate = None,
+                            now: datetime = None) -> Dict[str, Dict]:
+    """
+    Fetches recent chats, then analyzes all of them in one batch.
+
+    Args:
+        aggregate: Response times of all chats are added to it during the analysis
+        now: Reference time recent chats are selected by, defaults to the current time
+
+    Returns:
+        Dictionary where key is client name and value is the chat analytics
+    """
+    # Get manager's ID
+    me = await client.get_me()
+    my_id = me.id
+
+    # Get recent chats
+    store = MessageStore(settings.message_store_path) if settings.message_store_path else None
+    client_chats = await get_recent_client_chats(client, chat_limit=settings.chat_limit,
+                                                 concurrency=settings.fetch_concurrency, store=store, now=now)
+    if store:
+        store.close()
+
+    all_analytics = {}
+    conversations = {}
+
+    # Perform manager performance analysis of all chats in one vectorized pass
+    with instrumentation.stage('performance_analysis'):
+        performance_by_dialog = analyze_chats(
+            ((dialog.id, messages) for dialog, messages in client_chats), my_id,
+            BusinessCalendar.from_settings(settings), aggregate
+        )
 
-        for dialog, messages in client_chats:
-            # Convert messages to text for AI analysis
+    for dialog, messages in client_chats:
+        # Convert messages to text for AI analysis
+        with instrumentation.stage('formatting'):
             formatted_messages = format_conversation_to_strings(dialog, messages, my_id)
-            text = "\n".join(formatted_messages)
 
-            # Perform manager performance analysis
-            analyzer = ManagerPerformanceAnalyzer(messages, my_id)
-            performance_metrics = analyzer.analyze()
+        client_name = dialog.name or f"Client_{dialog.id}"
+        conversations[client_name] = "\n".join(formatted_messages)
+        all_analytics[client_name] = {
+            'performance': performance_by_dialog[dialog.id]
+        }
+
+    # Run AI analysis of all chats concurrently without blocking the Telegram client
+    ai_analytics = await gemini_wrapper.async_analyze_conversations(conversations)
+    for client_name, analysis in ai_analytics.items():
+        all_analytics[client_name].update(analysis)
+
+    return all_analytics
+
+
+async def stream_analytics(client: TelegramClient,
+                           settings: TelegramScrapingSettings,
+                           gemini_wrapper: GeminiWrapper,
+                           aggregate: ResponseAggregate = None,
+                           now: datetime = None) -> Dict[str, Dict]:
+    """
+    Same result as `collect_analytics`, but chats are analyzed as they are streamed.
+
+    AI analysis of a chat starts as soon as its history is read, after which only
+    the metrics and the pending analysis of the chat are kept. Pending analyses hold the
+    text of their chat, so streaming pauses while twice `gemini_max_concurrency` are pending.
+    """
+    me = await client.get_me()
+    my_id = me.id
 
+    all_analytics = {}
+    ai_tasks = {}
+    pending = asyncio.Semaphore(max(1, settings.gemini_max_concurrency) * 2)
+
+    chats = stream_client_chats(client, my_id, settings.chat_limit,
+                                calendar=BusinessCalendar.from_settings(settings), aggregate=aggregate, now=now)
+    try:
+        async for dialog, performance_metrics, formatted_messages in chats:
             client_name = dialog.name or f"Client_{dialog.id}"
             all_analytics[client_name] = {
-                'performance': performance_metrics,
-                'has_unfinished_promises': gemini_wrapper.check_unfinished_promises(text),
-                'quality_analysis': gemini_wrapper.analyze_conversation_quality(text)
+                'performance': performance_metrics
             }
+            await pending.acquire()
+            task = asyncio.create_task(gemini_wrapper.async_analyze_conversation("\n".join(formatted_messages)))
+            task.add_done_callback(lambda _: pending.release())
+            ai_tasks[client_name] = task
+    except BaseException:
+        # Don't leave analyses of the chats streamed so far running
+        for task in ai_tasks.values():
+            task.cancel()
+        raise
+
+    results = await asyncio.gather(*ai_tasks.values(), return_exceptions=True)
+    # A chat whose requests failed even after retries must not abort the whole run
+    for client_name, result in zip(ai_tasks, results):
+        if isinstance(result, Exception):
+            result = gemini_wrapper.analysis_error(result)
+        all_analytics[client_name].update(result)
+
+    return all_analytics
+
+
+def print_summary(all_analytics: Dict[str, Dict]):
+    print("\n=== Manager Performance Analysis ===")
+    for client_name, analytics in all_analytics.items():
+        print(f"\nChat with {client_name}:")
+        print(analytics['performance']['summary'])
+        if analytics['has_unfinished_promises']:
+            print("⚠️ Has unfinished promises")
+        if analytics['quality_analysis']['has_issues']:
+            print("⚠️ Has quality issues:", analytics['quality_analysis']['issues_found'])
+        print("-" * 50)
+
+
+def print_rollup(rollup: TeamRollup, history: List = ()):
+    print("\n=== Response Times (minutes) ===")
+    groups = [("Team", rollup.team)]
+    if len(rollup.managers) > 1:
+        groups += sorted(rollup.managers.items())
+    for name, aggregate in groups:
+        summary = aggregate.summary()
+        print(f"{name}: {summary['responses']} responses, p50 {summary['p50']:.1f}, "
+              f"p90 {summary['p90']:.1f}, p99 {summary['p99']:.1f}")
+
+    runs = trend(history)
+    if len(runs) > 1:
+        previous = runs[-2]
+        print(f"Previous run ({previous['run_at']:%Y-%m-%d %H:%M}): p50 {previous['p50']:.1f}, "
+              f"p90 {previous['p90']:.1f}, p99 {previous['p99']:.1f}")
+
+
+def report_results(all_analytics: Dict[str, Dict],
+                   settings: TelegramScrapingSettings = None,
+                   rollup: TeamRollup = None,
+                   record_history: bool = True):
+    """
+    Prints and writes the reports
+
+    Args:
+        rollup: Response time aggregates of the run, written to aggregates.json
+        record_history: Whether to append the rollup to the run history for trends
+    """
+    settings = settings or TelegramScrapingSettings()
+
+    # Print summary report
+    print_summary(all_analytics)
 
-        # Print summary report
-        print("\n=== Manager Performance Analysis ===")
-        for client_name, analytics in all_analytics.items():
-            print(f"\nChat with {client_name}:")
-            print(analytics['performance']['summary'])
-            if analytics['has_unfinished_promises']:
-                print("⚠️ Has unfinished promises")
-            if analytics['quality_analysis']['has_issues']:
-                print("⚠️ Has quality issues:", analytics['quality_analysis']['issues_found'])
-            print("-" * 50)
-
-        # Generate reports
-        reporter = PerformanceReporter(all_analytics)
+    # Generate reports
+    reporter = PerformanceReporter(all_analytics,
+                                   formats=settings.report_formats,
+                                   chunk_size=settings.report_chunk_size)
+    with instrumentation.stage('report_writing'):
         reporter.save_reports()
-        
-        print("\nReports generated in 'reports' directory:")
-        print("- summary.html/.csv")
-        print("- detailed_metrics.html/.csv")
+        history = []
+        if rollup is not None:
+            rollup.save(reporter.output_dir)
+            if record_history and settings.aggregate_history_path:
+                append_history(settings.aggregate_history_path, rollup)
+                history = load_history(settings.aggregate_history_path)
+    instrumentation.export(reporter.output_dir)
+
+    if rollup is not None:
+        print_rollup(rollup, history)
+
+    print("\nReports generated in 'reports' directory:")
+    print("- report.parquet")
+    print("- summary.html/.csv")
+    print("- detailed_metrics.html/.csv")
+    if rollup is not None:
+        print("- aggregates.json")
+    print("- metrics.json/.prom")
+
+
+async def main_func(record_dir: str = None, replay_dir: str = None):
+    """
+    Main function that handles the Telegram client connection
+
+    Args:
+        record_dir: Directory to record Telegram and Gemini responses of this run to
+        replay_dir: Directory with a recording to replay instead of using the network
+    """
+    settings = TelegramScrapingSettings()
+    model_factory = None
+    # Reference time of recent chats, a replay uses the one of its recording
+    now = None
+
+    if record_dir or replay_dir:
+        # Local stores would hide requests from the recording or the replay
+        settings = settings.model_copy(update={'message_store_path': "", 'gemini_cache_path': ""})
+
+    if replay_dir:
+        client = FakeTelegramClient.from_recording(os.path.join(replay_dir, "telegram.json"))
+        now = client.now
+        model_factory = lambda name: ReplayGenerativeModel(os.path.join(replay_dir, "gemini.jsonl"),
+                                                           model_name=name)
+    else:
+        client = await create_client(settings)
+
+    if record_dir:
+        client = RecordingTelegramClient(client, os.path.join(record_dir, "telegram.json"), now)
+        now = client.now
+        genai = configure_gemini(settings.gemini_key)
+        model_factory = lambda name: RecordingGenerativeModel(genai.GenerativeModel(name),
+                                                              os.path.join(record_dir, "gemini.jsonl"))
+
+    gemini_wrapper = create_gemini_wrapper(settings, model_factory)
+    rollup = TeamRollup()
+    aggregate = rollup.aggregate(settings.client_name)
+
+    with profiling(settings.profile_mode, "reports"):
+        async with client:
+            if settings.streaming_analysis:
+                all_analytics = await stream_analytics(client, settings, gemini_wrapper, aggregate, now)
+            else:
+                all_analytics = await collect_analytics(client, settings, gemini_wrapper, aggregate, now)
+
+        if record_dir:
+            client.save()
+
+        report_results(all_analytics, settings, rollup)
+
+    if gemini_wrapper.cache:
+        stats = gemini_wrapper.cache.stats()
+        print(f"\nGemini cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size']} entries")
+        gemini_wrapper.cache.close()
+
+    scheduler_metrics = gemini_wrapper.scheduler.metrics
+    print(f"Gemini requests: {scheduler_metrics['requests']}, retries: {scheduler_metrics['retries']}, "
+          f"fallbacks: {scheduler_metrics['fallbacks']}, failed: {scheduler_metrics['failures']}")
+
+    prefilter = gemini_wrapper.prefilter
+    if prefilter:
+        # In combined mode a skipped check makes the request smaller, otherwise it saves a request
+        print(f"Promise pre-filter: {prefilter.skipped} of {prefilter.checked} promise checks skipped locally")
+
+    compressor = gemini_wrapper.compressor
+    if compressor and compressor.tokens_before:
+        print(f"Prompt compression: {compressor.tokens_before} -> {compressor.tokens_after} estimated tokens "
+              f"in {compressor.conversations} conversations "
+              f"({compressor.tokens_saved / compressor.tokens_before:.0%} saved)")
+
+
+async def daemon_main():
+    """
+    Keeps running and updates the reports as new messages arrive
+    """
+    settings = TelegramScrapingSettings()
+    client = await create_client(settings)
+    gemini_wrapper = create_gemini_wrapper(settings)
+    daemon = LiveMetricsDaemon(client, settings, gemini_wrapper,
+                               debounce=settings.daemon_debounce_seconds,
+                               report_interval=settings.daemon_report_interval_seconds)
+
+    try:
+        async with client:
+            await daemon.run()
+    finally:
+        if gemini_wrapper.cache:
+            gemini_wrapper.cache.close()
+
+
+def multi_account_main(sessions: List[str]):
+    """
+    Analyzes several manager accounts in parallel processes and writes one combined report
+    """
+    settings = TelegramScrapingSettings()
+    rollup = TeamRollup()
+    failed = {}
+    all_analytics = analyze_accounts(settings, sessions, settings.account_workers, rollup, failed)
+    for session_name, error in failed.items():
+        print(f"⚠️ Account {session_name} could not be analyzed: {error}")
+    if len(failed) == len(sessions):
+        raise RuntimeError("No account could be analyzed")
+    report_results(all_analytics, settings, rollup)
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Telegram manager performance analyzer")
+    parser.add_argument("--sessions", nargs="+", metavar="SESSION",
+                        help="Telethon session names of several manager accounts to analyze in parallel "
+                             "(defaults to SESSIONS from settings)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="DIR",
+                      help="record Telegram and Gemini responses of this run for offline replay")
+    mode.add_argument("--replay", metavar="DIR",
+                      help="run offline on a recording made with --record")
+    mode.add_argument("--daemon", action="store_true",
+                      help="keep running, update metrics on new messages and rewrite the reports periodically")
+    args = parser.parse_args(argv)
+    if args.sessions and (args.record or args.replay or args.daemon):
+        parser.error("--sessions can't be combined with --record, --replay or --daemon")
+    return args
 
 
 if __name__ == "__main__":
-    asyncio.run(main_func())
\ No newline at end of file
+    args = parse_args()
+    if args.daemon:
+        asyncio.run(daemon_main())
+    elif args.record or args.replay:
+        # Single-account modes, SESSIONS from settings don't apply to them
+        asyncio.run(main_func(args.record, args.replay))
+    else:
+        sessions = args.sessions or TelegramScrapingSettings().sessions
+        if sessions:
+            multi_account_main(sessions)
+        else:
+            asyncio.run(main_func())
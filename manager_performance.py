@@ -1,22 +1,37 @@
+import html
 import statistics
-from typing import List, Dict
+from typing import TYPE_CHECKING, Callable, Iterator, List, Dict, Sequence
 
-from telethon.tl.types import Message
-import pandas as pd
+import numpy as np
 import os
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+from business_calendar import DEFAULT_CALENDAR, BusinessCalendar
+from message_record import MessageRecord
+from response_aggregates import ResponseAggregate
+
 
 class ManagerPerformanceAnalyzer:
-    def __init__(self, messages: List[Message], manager_id: int):
+    def __init__(self,
+                 messages: List[MessageRecord],
+                 manager_id: int,
+                 calendar: BusinessCalendar = None,
+                 aggregate: ResponseAggregate = None):
         """
-        Initialize analyzer with Telethon Message objects and manager's ID
+        Initialize analyzer with message records and manager's ID
         
         Args:
-            messages: List of Telethon Message objects
+            messages: Chronologically ordered message records of one chat
             manager_id: Telegram user ID of the manager
+            calendar: Working time of the manager, defaults to Mon-Fri 9:00-18:00 UTC
+            aggregate: Response times and client messages of the chat are added to it by `analyze`
         """
         self.messages = messages
         self.manager_id = manager_id
+        self.calendar = calendar or DEFAULT_CALENDAR
+        self.aggregate = aggregate
 
     def analyze(self) -> Dict:
         """Perform comprehensive analysis of manager performance"""
@@ -28,22 +43,20 @@ class ManagerPerformanceAnalyzer:
             }
 
         # Filter out empty messages and classify by role
-        valid_messages = [m for m in self.messages if m.message]  # Only messages with text
+        valid_messages = [m for m in self.messages if m.text]  # Only messages with text
         manager_messages = [m for m in valid_messages 
-                          if m.from_id and hasattr(m.from_id, 'user_id') 
-                          and m.from_id.user_id == self.manager_id]
+                          if m.sender_id is not None and m.sender_id == self.manager_id]
         client_messages = [m for m in valid_messages 
-                         if m.from_id and hasattr(m.from_id, 'user_id') 
-                         and m.from_id.user_id != self.manager_id]
+                         if m.sender_id is not None and m.sender_id != self.manager_id]
 
         # Calculate response times
         response_times = []
+        request_dates = []  # when the client message being answered was sent
+        response_dates = []
         last_client_msg = None
         for msg in valid_messages:
-            is_client = (msg.from_id and hasattr(msg.from_id, 'user_id') 
-                        and msg.from_id.user_id != self.manager_id)
-            is_manager = (msg.from_id and hasattr(msg.from_id, 'user_id') 
-                         and msg.from_id.user_id == self.manager_id)
+            is_client = msg.sender_id is not None and msg.sender_id != self.manager_id
+            is_manager = msg.sender_id is not None and msg.sender_id == self.manager_id
             
             if is_client:
                 last_client_msg = msg
@@ -51,6 +64,8 @@ class ManagerPerformanceAnalyzer:
                 time_diff = (msg.date - last_client_msg.date).total_seconds() / 60  # in minutes
                 if 0 <= time_diff <= 24 * 60:  # Only count responses within 24 hours
                     response_times.append(time_diff)
+                    request_dates.append(last_client_msg.date)
+                    response_dates.append(msg.date)
 
         # Calculate basic metrics
         metrics = {
@@ -61,16 +76,25 @@ class ManagerPerformanceAnalyzer:
             'avg_response_time': statistics.mean(response_times) if response_times else 0,
             'max_response_time': max(response_times) if response_times else 0,
             'initiated_by_manager': 1 if valid_messages and 
-                                     valid_messages[0].from_id and 
-                                     hasattr(valid_messages[0].from_id, 'user_id') and 
-                                     valid_messages[0].from_id.user_id == self.manager_id else 0
+                                     valid_messages[0].sender_id is not None and 
+                                     valid_messages[0].sender_id == self.manager_id else 0
         }
 
-        # Calculate working hours response times (9:00 - 18:00)
-        working_hours_responses = [
-            t for t in response_times
-            if 9 <= t.hour < 18 and t.weekday() < 5  # Monday to Friday, 9 AM to 6 PM
-        ]
+        # Calculate response times to client messages sent in working hours
+        request_timestamps = np.array([int(d.timestamp()) for d in request_dates], dtype=np.int64)
+        response_timestamps = np.array([int(d.timestamp()) for d in response_dates], dtype=np.int64)
+        asked_in_working_hours = self.calendar.is_working_array(request_timestamps)
+        working_hours_responses = [t for t, working in zip(response_times, asked_in_working_hours) if working]
+        # Working time that passed until the response, nights and weekends don't count
+        business_response_times = self.calendar.working_minutes_array(request_timestamps, response_timestamps)
+        manager_timestamps = np.array([int(m.date.timestamp()) for m in manager_messages], dtype=np.int64)
+
+        if self.aggregate is not None:
+            self.aggregate.add_responses(request_timestamps, np.array(response_times, dtype=np.float64),
+                                         self.calendar)
+            self.aggregate.add_client_messages(
+                np.array([int(m.date.timestamp()) for m in client_messages], dtype=np.int64), self.calendar
+            )
 
         # Add detailed analysis
         detailed = {
@@ -80,10 +104,10 @@ class ManagerPerformanceAnalyzer:
             'working_hours_avg_response': (
                 statistics.mean(working_hours_responses) if working_hours_responses else 0
             ),
-            'out_of_hours_messages': sum(
-                1 for m in manager_messages
-                if m.date.hour < 9 or m.date.hour >= 18 or m.date.weekday() >= 5
-            )
+            'business_avg_response': (
+                float(business_response_times.mean()) if len(business_response_times) else 0
+            ),
+            'out_of_hours_messages': int((~self.calendar.is_working_array(manager_timestamps)).sum())
         }
 
         # Generate performance summary
@@ -95,7 +119,8 @@ class ManagerPerformanceAnalyzer:
             'summary': summary
         }
 
-    def _generate_summary(self, metrics: Dict, detailed: Dict) -> str:
+    @staticmethod
+    def _generate_summary(metrics: Dict, detailed: Dict) -> str:
         """Generate a human-readable summary of the analysis"""
         response_time_rating = "Excellent" if metrics['avg_response_time'] < 5 else \
                              "Good" if metrics['avg_response_time'] < 15 else \
@@ -107,64 +132,285 @@ class ManagerPerformanceAnalyzer:
             f"- Response Rate: {metrics['response_rate']:.2f} responses per client message\n"
             f"- Average Response Time: {metrics['avg_response_time']:.1f} minutes ({response_time_rating})\n"
             f"- Working Hours Avg Response: {detailed['working_hours_avg_response']:.1f} minutes\n"
+            f"- Business Time Avg Response: {detailed['business_avg_response']:.1f} minutes\n"
             f"- Quick Responses (<5min): {detailed['quick_responses']}\n"
             f"- Slow Responses (>30min): {detailed['slow_responses']}\n"
             f"- Out of Hours Messages: {detailed['out_of_hours_messages']}\n"
             f"- Conversation Initiative: {'Yes' if metrics['initiated_by_manager'] else 'No'}"
         )
 
+class IncrementalPerformanceAnalyzer:
+    """
+    Computes the same metrics as ManagerPerformanceAnalyzer while messages arrive one by one.
+
+    Only running counters are kept, so memory does not depend on the history size.
+    Messages must be fed in chronological order.
+    """
+
+    def __init__(self, manager_id: int, calendar: BusinessCalendar = None, aggregate: ResponseAggregate = None):
+        self.manager_id = manager_id
+        self.calendar = calendar or DEFAULT_CALENDAR
+        self.aggregate = aggregate
+        self.seen_messages = 0
+        self.total_messages = 0
+        self.manager_messages = 0
+        self.client_messages = 0
+        self.initiated_by_manager = None
+        self.last_client_date = None
+        self.response_count = 0
+        self.response_sum = 0.0
+        self.response_max = 0
+        self.quick_responses = 0
+        self.slow_responses = 0
+        self.working_hours_count = 0
+        self.working_hours_sum = 0.0
+        self.business_sum = 0.0
+        self.out_of_hours_messages = 0
+
+    def update(self, message: MessageRecord):
+        self.seen_messages += 1
+        if not message.text:
+            return
+
+        self.total_messages += 1
+        user_id = message.sender_id
+        is_manager = user_id is not None and user_id == self.manager_id
+        is_client = user_id is not None and user_id != self.manager_id
+
+        if self.initiated_by_manager is None:
+            self.initiated_by_manager = 1 if is_manager else 0
+
+        if is_client:
+            self.client_messages += 1
+            self.last_client_date = message.date
+            if self.aggregate is not None:
+                self.aggregate.add_client_message(message.date, self.calendar)
+        elif is_manager:
+            self.manager_messages += 1
+            if not self.calendar.is_working(message.date):
+                self.out_of_hours_messages += 1
+            if self.last_client_date:
+                self._add_response(message.date, self.last_client_date)
+
+    def _add_response(self, answered_at, asked_at):
+        time_diff = (answered_at - asked_at).total_seconds() / 60  # in minutes
+        if not 0 <= time_diff <= 24 * 60:  # Only count responses within 24 hours
+            return
+
+        self.response_count += 1
+        self.response_sum += time_diff
+        self.response_max = max(self.response_max, time_diff)
+        if time_diff < 5:
+            self.quick_responses += 1
+        if time_diff > 30:
+            self.slow_responses += 1
+        self.business_sum += self.calendar.working_minutes(asked_at, answered_at)
+        if self.aggregate is not None:
+            self.aggregate.add_response(asked_at, time_diff, self.calendar)
+        if self.calendar.is_working(asked_at):
+            self.working_hours_count += 1
+            self.working_hours_sum += time_diff
+
+    def result(self) -> Dict:
+        """Returns the metrics of the messages seen so far, same structure as ManagerPerformanceAnalyzer.analyze"""
+        if not self.seen_messages:
+            return {
+                'total_messages': 0,
+                'metrics': {},
+                'summary': "No messages to analyze"
+            }
+
+        metrics = {
+            'total_messages': self.total_messages,
+            'manager_messages': self.manager_messages,
+            'client_messages': self.client_messages,
+            'response_rate': self.manager_messages / self.client_messages if self.client_messages else 0,
+            'avg_response_time': self.response_sum / self.response_count if self.response_count else 0,
+            'max_response_time': self.response_max,
+            'initiated_by_manager': self.initiated_by_manager or 0
+        }
+        detailed = {
+            'quick_responses': self.quick_responses,
+            'slow_responses': self.slow_responses,
+            'messages_per_conversation': self.total_messages,
+            'working_hours_avg_response': (
+                self.working_hours_sum / self.working_hours_count if self.working_hours_count else 0
+            ),
+            'business_avg_response': self.business_sum / self.response_count if self.response_count else 0,
+            'out_of_hours_messages': self.out_of_hours_messages
+        }
+
+        return {
+            'total_messages': metrics['total_messages'],
+            'metrics': {**metrics, **detailed},
+            'summary': ManagerPerformanceAnalyzer._generate_summary(metrics, detailed)
+        }
+
+
+# Typed columns of the report model, the manager column is present only for multi-account runs
+REPORT_COLUMNS = {
+    'manager': 'string',
+    'client': 'string',
+    'total_messages': 'int64',
+    'manager_messages': 'int64',
+    'client_messages': 'int64',
+    'response_rate': 'float64',
+    'avg_response_time': 'float64',
+    'working_hours_avg_response': 'float64',
+    'business_avg_response': 'float64',
+    'out_of_hours_messages': 'int64',
+    'quick_responses': 'int64',
+    'slow_responses': 'int64',
+    'has_issues': 'bool',
+    'severity': 'string',
+    'has_unfinished_promises': 'bool',
+}
+
+REPORT_FORMATS = ("parquet", "csv", "html")
+
+
 class PerformanceReporter:
-    def __init__(self, analytics_data: Dict[str, Dict]):
+    def __init__(self,
+                 analytics_data: Dict[str, Dict],
+                 output_dir: str = "reports",
+                 formats: Sequence[str] = REPORT_FORMATS,
+                 chunk_size: int = 10000):
+        """
+        Args:
+            analytics_data: Chat analytics keyed by client name
+            output_dir: Directory the reports are written to
+            formats: Any of "parquet" (typed report model), "csv" and "html" (formatted tables)
+            chunk_size: Number of rows formatted and written at a time to CSV and HTML
+        """
+        unknown = set(formats) - set(REPORT_FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown report formats: {sorted(unknown)}")
         self.analytics_data = analytics_data
-        self.output_dir = "reports"
+        self.output_dir = output_dir
+        self.formats = formats
+        self.chunk_size = max(1, chunk_size)
+        self._report = None
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def generate_summary_table(self) -> pd.DataFrame:
-        """Create summary DataFrame from analytics data"""
-        data = []
+    @property
+    def report(self) -> 'pd.DataFrame':
+        """Typed columnar model of all chats, built once in a single pass"""
+        if self._report is None:
+            self._report = self._build_report()
+        return self._report
+
+    def _build_report(self) -> 'pd.DataFrame':
+        import pandas as pd
+
+        columns = {name: [] for name in REPORT_COLUMNS}
         for client, analytics in self.analytics_data.items():
             metrics = analytics['performance']['metrics']
             quality = analytics['quality_analysis']
-            
-            data.append({
-                'Client': client,
-                'Total Messages': metrics['total_messages'],
-                'Manager/Client Messages': f"{metrics['manager_messages']}/{metrics['client_messages']}",
-                'Response Rate': f"{metrics['response_rate']:.2f}",
-                'Avg Response (min)': f"{metrics['avg_response_time']:.1f}",
-                'Quick/Slow Responses': f"{metrics['quick_responses']}/{metrics['slow_responses']}",
-                'Has Issues': '✓' if quality['has_issues'] else '',
-                'Unfinished Promises': '✓' if analytics['has_unfinished_promises'] else ''
-            })
-        
-        return pd.DataFrame(data)
+            columns['manager'].append(analytics.get('manager'))
+            columns['client'].append(analytics.get('client', client))
+            for name in ('total_messages', 'manager_messages', 'client_messages', 'response_rate',
+                         'avg_response_time', 'working_hours_avg_response', 'business_avg_response',
+                         'out_of_hours_messages',
+                         'quick_responses', 'slow_responses'):
+                columns[name].append(metrics.get(name, 0))
+            columns['has_issues'].append(bool(quality['has_issues']))
+            columns['severity'].append(quality.get('severity'))
+            columns['has_unfinished_promises'].append(bool(analytics['has_unfinished_promises']))
+
+        if not any(manager is not None for manager in columns['manager']):
+            del columns['manager']
+        return pd.DataFrame({name: pd.array(values, dtype=REPORT_COLUMNS[name])
+                             for name, values in columns.items()})
+
+    def _chunks(self) -> Iterator['pd.DataFrame']:
+        report = self.report
+        for start in range(0, len(report), self.chunk_size):
+            yield report.iloc[start:start + self.chunk_size]
 
-    def generate_detailed_metrics(self) -> pd.DataFrame:
+    @staticmethod
+    def _client_columns(report: 'pd.DataFrame') -> Dict:
+        columns = {'Manager': report['manager']} if 'manager' in report else {}
+        columns['Client'] = report['client']
+        return columns
+
+    @staticmethod
+    def _ratio(first: 'pd.Series', second: 'pd.Series') -> 'pd.Series':
+        return first.astype(str) + "/" + second.astype(str)
+
+    @staticmethod
+    def _check_mark(flags: 'pd.Series') -> 'pd.Series':
+        return flags.map({True: '✓', False: ''})
+
+    def _summary_view(self, report: 'pd.DataFrame') -> 'pd.DataFrame':
+        import pandas as pd
+
+        return pd.DataFrame({
+            **self._client_columns(report),
+            'Total Messages': report['total_messages'],
+            'Manager/Client Messages': self._ratio(report['manager_messages'], report['client_messages']),
+            'Response Rate': report['response_rate'].map("{:.2f}".format),
+            'Avg Response (min)': report['avg_response_time'].map("{:.1f}".format),
+            'Quick/Slow Responses': self._ratio(report['quick_responses'], report['slow_responses']),
+            'Has Issues': self._check_mark(report['has_issues']),
+            'Unfinished Promises': self._check_mark(report['has_unfinished_promises'])
+        })
+
+    def _detailed_view(self, report: 'pd.DataFrame') -> 'pd.DataFrame':
+        import pandas as pd
+
+        return pd.DataFrame({
+            **self._client_columns(report),
+            'Avg Response Time': report['avg_response_time'].map("{:.1f}".format),
+            'Working Hours Avg': report['working_hours_avg_response'].map("{:.1f}".format),
+            'Business Time Avg': report['business_avg_response'].map("{:.1f}".format),
+            'Out of Hours Messages': report['out_of_hours_messages'],
+            'Quick Responses': report['quick_responses'],
+            'Slow Responses': report['slow_responses'],
+            'Response Rate': report['response_rate'].map("{:.2f}".format)
+        })
+
+    def generate_summary_table(self) -> 'pd.DataFrame':
+        """Create summary DataFrame from analytics data"""
+        return self._summary_view(self.report)
+
+    def generate_detailed_metrics(self) -> 'pd.DataFrame':
         """Create detailed metrics DataFrame"""
-        data = []
-        for client, analytics in self.analytics_data.items():
-            metrics = analytics['performance']['metrics']
-            
-            data.append({
-                'Client': client,
-                'Avg Response Time': f"{metrics['avg_response_time']:.1f}",
-                'Working Hours Avg': f"{metrics.get('working_hours_avg_response', 0):.1f}",
-                'Out of Hours Messages': metrics.get('out_of_hours_messages', 0),
-                'Quick Responses': metrics['quick_responses'],
-                'Slow Responses': metrics['slow_responses'],
-                'Response Rate': f"{metrics['response_rate']:.2f}"
-            })
-        
-        return pd.DataFrame(data)
+        return self._detailed_view(self.report)
+
+    def _write_csv(self, path: str, view: Callable[['pd.DataFrame'], 'pd.DataFrame']):
+        """Formats and appends the report chunk by chunk"""
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            header = True
+            for chunk in self._chunks():
+                view(chunk).to_csv(file, header=header)
+                header = False
+            if header:
+                view(self.report).to_csv(file)
+
+    def _write_html(self, path: str, view: Callable[['pd.DataFrame'], 'pd.DataFrame']):
+        """Renders the same table as DataFrame.to_html, chunk by chunk"""
+        with open(path, "w", encoding="utf-8") as file:
+            columns = view(self.report.iloc[:0]).columns
+            file.write('<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n'
+                       '      <th></th>\n')
+            for column in columns:
+                file.write(f"      <th>{html.escape(str(column))}</th>\n")
+            file.write("    </tr>\n  </thead>\n  <tbody>\n")
+            for chunk in self._chunks():
+                rows = []
+                for index, row in zip(chunk.index, view(chunk).itertuples(index=False)):
+                    cells = "".join(f"      <td>{html.escape(str(value))}</td>\n" for value in row)
+                    rows.append(f"    <tr>\n      <th>{index}</th>\n{cells}    </tr>\n")
+                file.write("".join(rows))
+            file.write("  </tbody>\n</table>")
 
     def save_reports(self):
         """Generate and save all reports"""
-        # Generate summary table
-        summary_df = self.generate_summary_table()
-        summary_df.to_html(os.path.join(self.output_dir, 'summary.html'))
-        summary_df.to_csv(os.path.join(self.output_dir, 'summary.csv'))
-
-        # Generate detailed metrics
-        detailed_df = self.generate_detailed_metrics()
-        detailed_df.to_html(os.path.join(self.output_dir, 'detailed_metrics.html'))
-        detailed_df.to_csv(os.path.join(self.output_dir, 'detailed_metrics.csv'))
\ No newline at end of file
+        if "parquet" in self.formats:
+            self.report.to_parquet(os.path.join(self.output_dir, 'report.parquet'), index=False)
+
+        for name, view in (('summary', self._summary_view), ('detailed_metrics', self._detailed_view)):
+            if "csv" in self.formats:
+                self._write_csv(os.path.join(self.output_dir, f'{name}.csv'), view)
+            if "html" in self.formats:
+                self._write_html(os.path.join(self.output_dir, f'{name}.html'), view)
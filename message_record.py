@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+
+class MessageRecord:
+    """
+    The part of a Telegram message the analysis uses.
+
+    Full Telethon Message objects carry media, entities and raw TL payloads, so messages
+    are converted to records as soon as they are fetched.
+    """
+    __slots__ = ('id', 'date', 'sender_id', 'text')
+
+    def __init__(self, id: int, date: datetime, sender_id: Optional[int], text: str):
+        self.id = id
+        self.date = date
+        self.sender_id = sender_id  # None for messages without a known sender
+        self.text = text
+
+    @classmethod
+    def from_message(cls, message) -> 'MessageRecord':
+        """Converts a Telethon Message"""
+        # Incoming private messages come without from_id, Telethon's sender_id fills in the chat's user
+        return cls(message.id, message.date, message.sender_id, message.message or "")
+
+    def __eq__(self, other):
+        if not isinstance(other, MessageRecord):
+            return NotImplemented
+        return (self.id, self.date, self.sender_id, self.text) == \
+            (other.id, other.date, other.sender_id, other.text)
+
+    def __repr__(self):
+        return f"MessageRecord(id={self.id}, date={self.date!r}, sender_id={self.sender_id}, text={self.text!r})"
+
+
+def to_records(messages: Iterable) -> List[MessageRecord]:
+    return [MessageRecord.from_message(message) for message in messages]
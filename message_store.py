@@ -0,0 +1,139 @@
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from telethon.tl.types import User
+
+from message_record import MessageRecord
+
+
+@dataclass
+class StoredDialog:
+    """
+    Private dialog restored from the store.
+
+    Telethon accepts it wherever a dialog is expected, since its `entity` carries the access hash.
+    """
+    id: int
+    name: str
+    date: datetime
+    entity: User
+    pinned: bool = False
+    is_user: bool = True
+
+
+class MessageStore:
+    """
+    Local SQLite store of already downloaded dialog messages.
+
+    Keeps only the fields used by the analysis (id, date, sender id and text),
+    so a scheduled run needs to download only messages newer than the last stored one.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "dialog_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "date INTEGER NOT NULL, "
+            "sender_id INTEGER, "
+            "text TEXT NOT NULL, "
+            "PRIMARY KEY (dialog_id, message_id))"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS dialogs ("
+            "dialog_id INTEGER PRIMARY KEY, "
+            "name TEXT NOT NULL, "
+            "date INTEGER NOT NULL, "
+            "access_hash INTEGER)"
+        )
+        self._connection.commit()
+
+    def last_message(self, dialog_id: int) -> Optional[Tuple[int, datetime]]:
+        """Returns (message id, date) of the newest stored message of the dialog"""
+        row = self._connection.execute(
+            "SELECT message_id, date FROM messages WHERE dialog_id = ? ORDER BY message_id DESC LIMIT 1",
+            (dialog_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], datetime.fromtimestamp(row[1], timezone.utc)
+
+    def save_messages(self, dialog_id: int, messages: List[MessageRecord]):
+        rows = [
+            (dialog_id, message.id, int(message.date.timestamp()), message.sender_id, message.text)
+            for message in messages
+        ]
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO messages (dialog_id, message_id, date, sender_id, text) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        self._connection.commit()
+
+    def load_messages(self, dialog_id: int, since_date: datetime) -> List[MessageRecord]:
+        """Returns stored messages of the dialog newer than `since_date`, oldest first"""
+        rows = self._connection.execute(
+            "SELECT message_id, date, sender_id, text FROM messages "
+            "WHERE dialog_id = ? AND date >= ? ORDER BY message_id",
+            (dialog_id, int(since_date.timestamp()))
+        ).fetchall()
+        return [
+            MessageRecord(message_id, datetime.fromtimestamp(date, timezone.utc), sender_id, text)
+            for message_id, date, sender_id, text in rows
+        ]
+
+    def prune(self, before_date: datetime):
+        """Deletes messages older than `before_date`"""
+        self._connection.execute("DELETE FROM messages WHERE date < ?", (int(before_date.timestamp()),))
+        self._connection.commit()
+
+    def newest_dialog_date(self) -> Optional[datetime]:
+        """Returns the date of the most recently active stored dialog"""
+        row = self._connection.execute("SELECT MAX(date) FROM dialogs").fetchone()
+        if row[0] is None:
+            return None
+        return datetime.fromtimestamp(row[0], timezone.utc)
+
+    def save_dialogs(self, dialogs: List):
+        """Stores private non-bot dialogs, replacing older versions of the same dialogs"""
+        rows = [
+            (dialog.id, dialog.name or "", int(dialog.date.timestamp()), dialog.entity.access_hash)
+            for dialog in dialogs
+        ]
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO dialogs (dialog_id, name, date, access_hash) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self._connection.commit()
+
+    def load_dialogs(self, since_date: datetime) -> List[StoredDialog]:
+        """Returns stored dialogs active since `since_date`, most recently active first"""
+        rows = self._connection.execute(
+            "SELECT dialog_id, name, date, access_hash FROM dialogs WHERE date >= ? ORDER BY date DESC",
+            (int(since_date.timestamp()),)
+        ).fetchall()
+        return [
+            StoredDialog(
+                id=dialog_id,
+                name=name,
+                date=datetime.fromtimestamp(date, timezone.utc),
+                entity=User(id=dialog_id, access_hash=access_hash, bot=False, first_name=name)
+            )
+            for dialog_id, name, date, access_hash in rows
+        ]
+
+    def prune_dialogs(self, before_date: datetime):
+        """Deletes dialogs without activity since `before_date`"""
+        self._connection.execute("DELETE FROM dialogs WHERE date < ?", (int(before_date.timestamp()),))
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
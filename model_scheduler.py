@@ -0,0 +1,273 @@
+import asyncio
+import random
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from conversation_chunking import estimate_tokens
+from instrumentation import instrumentation
+
+# Transient errors: the same model is retried after a backoff
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServerError,
+    google_exceptions.Aborted,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+# Errors no other model or retry can fix
+FATAL_ERRORS = (
+    google_exceptions.Unauthenticated,
+    google_exceptions.Unauthorized,
+    google_exceptions.PermissionDenied,
+    google_exceptions.Forbidden,
+)
+
+
+def configure_gemini(api_key: str = None):
+    """
+    Imports the Google SDK, configured with `api_key` if given.
+
+    The SDK takes most of the startup time, so it is imported only once a real model is needed.
+    """
+    import google.generativeai as genai
+
+    if api_key:
+        genai.configure(api_key=api_key)
+    return genai
+
+
+class BackoffPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0, multiplier: float = 2.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a model after `failure_threshold` consecutive failures.
+
+    After `cooldown` seconds requests are let through again (half-open state),
+    a success closes the circuit and another failure opens it for a new cooldown.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    def allows_request(self) -> bool:
+        return self.opened_at is None or time.monotonic() - self.opened_at >= self.cooldown
+
+    def remaining_cooldown(self) -> float:
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened the circuit"""
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            was_open = self.opened_at is not None
+            self.opened_at = time.monotonic()
+            return not was_open
+        return False
+
+
+class ModelScheduler:
+    """
+    Sends generation requests along an ordered chain of models.
+
+    Transient errors are retried with exponential backoff, a model whose circuit is open
+    or that rejects the request is skipped in favour of the next model of the chain.
+    Models discovered with `genai.list_models` are appended to the configured chain once,
+    the first time the configured models are not enough.
+    """
+
+    def __init__(self,
+                 model_names: List[str],
+                 model_factory: Callable = None,
+                 max_attempts: int = 6,
+                 backoff: BackoffPolicy = None,
+                 failure_threshold: int = 5,
+                 cooldown: float = 60.0,
+                 discover_models: bool = True,
+                 api_key: str = None):
+        """
+        Args:
+            model_factory: Creates a model from its name, defaults to genai.GenerativeModel
+            api_key: Gemini API key the SDK is configured with when it is first used
+        """
+        self.model_names = list(model_names)
+        self.model_factory = model_factory
+        self.max_attempts = max_attempts
+        self.backoff = backoff or BackoffPolicy()
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.discover_models = discover_models
+        self.api_key = api_key
+        self._genai = None
+        self.metrics = Counter()
+        self._models: Dict[str, object] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._discovered = False
+
+    @property
+    def primary_model_name(self) -> str:
+        return self.model_names[0]
+
+    def genai(self):
+        if self._genai is None:
+            self._genai = configure_gemini(self.api_key)
+        return self._genai
+
+    def model(self, name: str):
+        if name not in self._models:
+            factory = self.model_factory or self.genai().GenerativeModel
+            self._models[name] = factory(name)
+        return self._models[name]
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self._breakers[name]
+
+    def _discover(self):
+        """Appends every model supporting generateContent to the chain, the model list is fetched only once"""
+        if self._discovered or not self.discover_models:
+            return
+        self._discovered = True
+        try:
+            models = self.genai().list_models()
+            for model in models:
+                if 'generateContent' in model.supported_generation_methods and model.name not in self.model_names:
+                    self.model_names.append(model.name)
+        except Exception:
+            self.metrics['discovery_failures'] += 1
+
+    def _pick(self, excluded: set) -> Optional[str]:
+        for name in self.model_names:
+            if name not in excluded and self.breaker(name).allows_request():
+                return name
+        if not self._discovered and self.discover_models:
+            self._discover()
+            return self._pick(excluded)
+        return None
+
+    def _next_step(self, attempt: int, excluded: set) -> tuple:
+        """Returns (model name, None) to send a request or (None, seconds) to wait first"""
+        name = self._pick(excluded)
+        if name is not None:
+            return name, None
+        # Every model is rejected or cooling down
+        waits = [self.breaker(n).remaining_cooldown() for n in self.model_names if n not in excluded]
+        if not waits:
+            return None, None
+        return None, min(min(waits), self.backoff.max_delay) or self.backoff.delay(attempt)
+
+    def _on_error(self, name: str, error: Exception, excluded: set) -> bool:
+        """Updates state after a failed request, returns True if the request should be retried after a backoff"""
+        if isinstance(error, FATAL_ERRORS):
+            raise error
+        if self.breaker(name).record_failure():
+            self.metrics['circuit_opens'] += 1
+        if isinstance(error, RETRYABLE_ERRORS):
+            self.metrics['retries'] += 1
+            return True
+        # The model can't serve this request (e.g. unknown model, prompt too long), try the next one
+        self.metrics['fallbacks'] += 1
+        excluded.add(name)
+        return False
+
+    def generate(self, prompt: str, generation_config: dict = None) -> str:
+        excluded = set()
+        last_error = None
+        self.metrics['requests'] += 1
+        for attempt in range(self.max_attempts):
+            name, wait = self._next_step(attempt, excluded)
+            if name is None:
+                if wait is None:
+                    break
+                time.sleep(wait)
+                continue
+            try:
+                _count_request(prompt)
+                with instrumentation.stage('gemini_request'):
+                    response = self.model(name).generate_content(prompt, generation_config=generation_config)
+                    text = response.text
+            except Exception as e:
+                last_error = e
+                if self._on_error(name, e, excluded):
+                    time.sleep(self.backoff.delay(attempt))
+                continue
+            self.breaker(name).record_success()
+            self.metrics[f'success:{name}'] += 1
+            return text
+
+        self.metrics['failures'] += 1
+        raise last_error or RuntimeError("No Gemini model available")
+
+    async def generate_async(self, prompt: str, generation_config: dict = None, slot: Callable = None) -> str:
+        """
+        Async version of `generate`.
+
+        Args:
+            slot: Factory of an async context manager every attempt is made in, e.g. a
+                concurrency and rate limit. Backoff sleeps happen outside of it.
+        """
+        slot = slot or _no_slot
+        excluded = set()
+        last_error = None
+        self.metrics['requests'] += 1
+        for attempt in range(self.max_attempts):
+            name, wait = self._next_step(attempt, excluded)
+            if name is None:
+                if wait is None:
+                    break
+                await asyncio.sleep(wait)
+                continue
+            try:
+                async with slot():
+                    _count_request(prompt)
+                    with instrumentation.stage('gemini_request'):
+                        response = await self.model(name).generate_content_async(
+                            prompt, generation_config=generation_config
+                        )
+                        text = response.text
+            except Exception as e:
+                last_error = e
+                if self._on_error(name, e, excluded):
+                    await asyncio.sleep(self.backoff.delay(attempt))
+                continue
+            self.breaker(name).record_success()
+            self.metrics[f'success:{name}'] += 1
+            return text
+
+        self.metrics['failures'] += 1
+        raise last_error or RuntimeError("No Gemini model available")
+
+
+def _count_request(prompt: str):
+    instrumentation.count('gemini_requests')
+    instrumentation.count('gemini_prompt_tokens', estimate_tokens(prompt))
+
+
+@asynccontextmanager
+async def _no_slot():
+    yield
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from instrumentation import instrumentation
+from response_aggregates import ResponseAggregate, TeamRollup
+from settings import TelegramScrapingSettings
+
+
+def account_settings(settings: TelegramScrapingSettings, session_name: str, workers: int) -> TelegramScrapingSettings:
+    """
+    Derives the settings of one account worker.
+
+    Each account gets its own message store, since dialog and message ids are per account,
+    and an equal share of the Gemini request budget, since all workers use the same key.
+    """
+    message_store_path = settings.message_store_path
+    if message_store_path:
+        root, extension = os.path.splitext(message_store_path)
+        message_store_path = f"{root}_{session_name}{extension}"
+
+    return settings.model_copy(update={
+        'client_name': session_name,
+        'sessions': [],
+        'message_store_path': message_store_path,
+        'business_timezone': settings.manager_timezones.get(session_name, settings.business_timezone),
+        'gemini_requests_per_minute': max(1, settings.gemini_requests_per_minute // workers)
+        if settings.gemini_requests_per_minute else 0,
+    })
+
+
+async def _analyze_account(settings: TelegramScrapingSettings) -> Tuple[str, Dict[str, Dict], ResponseAggregate]:
+    from main import collect_analytics, create_client, create_gemini_wrapper, stream_analytics
+
+    client = await create_client(settings)
+    gemini_wrapper = create_gemini_wrapper(settings)
+    aggregate = ResponseAggregate()
+
+    await client.connect()
+    try:
+        # Workers can't ask for a login code, sessions must be authorized by a single-account run first
+        if not await client.is_user_authorized():
+            raise RuntimeError(f"Telegram session '{settings.client_name}' is not authorized, "
+                               f"run main.py with CLIENT_NAME={settings.client_name} once to log in")
+
+        me = await client.get_me()
+        manager = me.username or " ".join(filter(None, [me.first_name, me.last_name])) or settings.client_name
+
+        if settings.streaming_analysis:
+            analytics = await stream_analytics(client, settings, gemini_wrapper, aggregate)
+        else:
+            analytics = await collect_analytics(client, settings, gemini_wrapper, aggregate)
+    finally:
+        await client.disconnect()
+        if gemini_wrapper.cache:
+            gemini_wrapper.cache.close()
+
+    return manager, analytics, aggregate
+
+
+def analyze_account(settings: TelegramScrapingSettings) -> Tuple[str, Dict[str, Dict], ResponseAggregate, Dict]:
+    """
+    Runs fetch and analysis of one account, entry point of a worker process.
+
+    Returns:
+        Manager name, chat analytics, response time aggregate and the instrumentation of the account
+    """
+    # Worker processes are reused for further accounts
+    instrumentation.reset()
+    manager, analytics, aggregate = asyncio.run(_analyze_account(settings))
+    return manager, analytics, aggregate, instrumentation.to_dict()
+
+
+def merge_account_analytics(results: List[Tuple[str, Dict[str, Dict]]]) -> Dict[str, Dict]:
+    """
+    Merges per-manager analytics into one dictionary for PerformanceReporter.
+
+    Keys become "manager / client" and every entry gets 'manager' and 'client' fields.
+    """
+    merged = {}
+    for manager, analytics in results:
+        for client_name, client_analytics in analytics.items():
+            merged[f"{manager} / {client_name}"] = {
+                **client_analytics,
+                'manager': manager,
+                'client': client_name
+            }
+    return merged
+
+
+def analyze_accounts(settings: TelegramScrapingSettings,
+                     sessions: List[str],
+                     max_workers: int = 0,
+                     rollup: TeamRollup = None,
+                     failed: Dict[str, Exception] = None,
+                     worker: Callable = analyze_account) -> Dict[str, Dict]:
+    """
+    Analyzes several manager accounts in parallel worker processes.
+
+    An account whose worker fails is left out of the results, the other accounts are still analyzed.
+    The instrumentation of every account is merged into the one of this process.
+
+    Args:
+        settings: Base settings shared by all accounts
+        sessions: Telethon session names, one per manager account
+        max_workers: Number of worker processes, 0 uses one per CPU core
+        rollup: Receives the response time aggregate of every manager
+        failed: Receives the error of every session that couldn't be analyzed
+        worker: Analyzes one account in a worker process, like `analyze_account`
+    """
+    workers = min(len(sessions), max_workers or os.cpu_count() or 1)
+    per_account = [account_settings(settings, session_name, workers) for session_name in sessions]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {session_name: executor.submit(worker, account)
+                   for session_name, account in zip(sessions, per_account)}
+        for session_name, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                if failed is not None:
+                    failed[session_name] = e
+
+    for manager, _, aggregate, metrics in results:
+        instrumentation.merge(metrics)
+        if rollup is not None:
+            rollup.add(manager, aggregate)
+    return merge_account_analytics([(manager, analytics) for manager, analytics, _, _ in results])
@@ -0,0 +1,73 @@
+import re
+from typing import Iterable
+
+from conversation_chunking import MESSAGE_PREFIX, group_messages
+
+# Wording of commitments in manager messages. Matching too much only costs an LLM call,
+# so the patterns are broad: first person future forms, "let me", deadlines.
+PROMISE_PATTERNS = [
+    # English
+    r"\bi\s*(?:'ll|will|shall|am going to|'m going to|can)\b",
+    r"\bwe\s*(?:'ll|will|shall|are going to|'re going to)\b",
+    r"\blet me\b",
+    r"\bpromise",
+    r"\b(?:today|tonight|tomorrow|asap|eod|end of (?:the )?day|by \w+day|later|soon|shortly)\b",
+    r"\b(?:get back|follow up|send|call|check|prepare|confirm|update|forward)\b",
+    r"\b(?:getting back|coming back|checking|looking into|working on)\b",
+    # Russian
+    r"\b(?:сделаю|сделаем|отправлю|отправим|пришлю|пришлём|пришлем|вышлю|вышлем|скину|скинем|перезвоню|перезвоним"
+    r"|напишу|напишем|проверю|проверим|уточню|уточним|узнаю|узнаем|подготовлю|подготовим|посмотрю|посмотрим"
+    r"|сообщу|сообщим|свяжусь|свяжемся|вернусь|решу|решим|передам|оформлю|оформим|согласую|согласуем)\b",
+    r"\b(?:обещаю|обещаем|постараюсь|постараемся|сейчас|сегодня|завтра|вечером|позже|скоро|до конца дня)\b",
+    r"\b(?:буду|будем|будет готов\w*)\b",
+    # Agreement to a request is a commitment as well
+    r"\b(?:sure|ok|okay|will do|no problem|deal|agreed|done|of course|absolutely|certainly|on it)\b",
+    r"\b(?:хорошо|ок|окей|договорились|конечно|без проблем|принято|сделаем|будет сделано|да)\b",
+    # Deadlines given as a time, e.g. "by 5pm", "до 17:00"
+    r"\b(?:by|before|until|до|к)\s+\d",
+    r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm)\b",
+]
+
+# Client wording asking the manager to do something. Whatever the manager answers to it,
+# even "Sure" or "👍", may be a commitment.
+REQUEST_PATTERNS = [
+    r"\b(?:can|could|would|will) you\b",
+    r"\b(?:please|pls|plz|asap|need|want|when|let me know|i'd like|send)\b",
+    r"\b(?:можете|можно|сможете|пришлите|отправьте|скиньте|пожалуйста|нужно|надо|хочу|когда|подскажите"
+    r"|сделайте|перезвоните|позвоните|напишите)\b",
+]
+
+
+class PromisePrefilter:
+    """
+    Local check whether a manager could have promised anything in a conversation.
+
+    Works on the output of `format_conversation_to_strings`. A conversation can only be
+    free of unfinished promises for sure if no manager message matches PROMISE_PATTERNS and
+    the manager never answered a client message matching REQUEST_PATTERNS, since any answer
+    to a request may be an agreement. Only then the LLM promise check is skipped. Multi-line
+    messages are matched as a whole.
+    """
+
+    def __init__(self,
+                 patterns: Iterable[str] = PROMISE_PATTERNS,
+                 request_patterns: Iterable[str] = REQUEST_PATTERNS):
+        self._pattern = re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+        self._request = re.compile("|".join(f"(?:{pattern})" for pattern in request_patterns), re.IGNORECASE)
+        self.checked = 0
+        self.skipped = 0
+
+    def may_contain_promise(self, conversation_text: str) -> bool:
+        self.checked += 1
+        requested = False
+        for message in group_messages(conversation_text.splitlines()):
+            match = MESSAGE_PREFIX.match(message)
+            if not match:
+                continue
+            role, text = match.group(2), message[match.end():]
+            if role == "Client":
+                requested = requested or bool(self._request.search(text))
+            elif requested or self._pattern.search(text):
+                return True
+        self.skipped += 1
+        return False
@@ -0,0 +1,159 @@
+import re
+from collections import deque
+from typing import FrozenSet, Iterable, List, Optional
+
+from conversation_chunking import estimate_tokens
+
+# "[MM/DD HH:MM] Role: " prefix written by format_message
+MESSAGE_PREFIX = re.compile(r"^\[([^\]]*)\] (Manager|Client): ")
+WORD = re.compile(r"\w+")
+
+# Client messages consisting only of these carry nothing the analyses could use. Manager messages
+# are always kept: "ok" in reply to a request is the commitment itself.
+ACKNOWLEDGEMENTS = frozenset({
+    "ok", "okay", "k", "kk", "ok thanks", "ok thank you", "thanks", "thank you", "thx", "ty", "np",
+    "ок", "окей", "ок спасибо", "спасибо", "спс", "благодарю", "ага", "угу",
+})
+
+# Long messages sharing this share of word trigrams with an earlier one are replaced by a reference
+SIMILARITY_THRESHOLD = 0.8
+# Shorter messages are only collapsed when repeated back to back
+MIN_SIMILAR_CHARS = 200
+# Earlier long messages compared with each new one
+MAX_SIMILARITY_CANDIDATES = 100
+
+
+class _Message:
+    __slots__ = ('prefix', 'timestamp', 'role', 'text', 'normalized', 'repeats')
+
+    def __init__(self, prefix: str, timestamp: str, role: str, text: str):
+        self.prefix = prefix
+        self.timestamp = timestamp
+        self.role = role
+        self.text = text
+        self.normalized = ""
+        self.repeats = 1
+
+    def render(self) -> str:
+        suffix = f" (×{self.repeats})" if self.repeats > 1 else ""
+        return f"{self.prefix}{self.text}{suffix}"
+
+
+def _parse(conversation_text: str) -> List[_Message]:
+    """Splits formatted lines into messages, lines without a prefix continue the previous message"""
+    messages = []
+    for line in conversation_text.splitlines():
+        match = MESSAGE_PREFIX.match(line)
+        if match:
+            messages.append(_Message(match.group(0), match.group(1), match.group(2), line[match.end():]))
+        elif messages:
+            messages[-1].text += "\n" + line
+        else:
+            messages.append(_Message("", "", "", line))
+    for message in messages:
+        message.normalized = " ".join(WORD.findall(message.text.lower()))
+    return messages
+
+
+def _trigrams(normalized: str) -> FrozenSet:
+    words = normalized.split()
+    return frozenset(zip(words, words[1:], words[2:])) if len(words) >= 3 else frozenset([tuple(words)])
+
+
+class ConversationCompressor:
+    """
+    Shrinks formatted conversations before they are sent to the LLM.
+
+    Works on the output of `format_conversation_to_strings`, every kept message keeps its
+    timestamp and role:
+        - client messages without words (emoji, punctuation) and bare client acknowledgements are dropped,
+          manager messages are kept since a short agreement to a request is a promise
+        - back to back repeats of a message by the same role are collapsed, e.g. "Hello (×3)"
+        - long messages similar to an earlier one (pasted price lists, forwarded boilerplate)
+          are replaced by a reference to its timestamp
+        - messages longer than `max_message_chars` keep only their beginning and end
+    """
+
+    def __init__(self,
+                 max_message_chars: int = 1500,
+                 similarity_threshold: float = SIMILARITY_THRESHOLD,
+                 acknowledgements: Iterable[str] = ACKNOWLEDGEMENTS):
+        """
+        Args:
+            max_message_chars: Longest message text kept whole, 0 keeps all messages whole
+            similarity_threshold: Jaccard similarity of word trigrams above which long messages are near-duplicates
+            acknowledgements: Normalized texts of client messages that are dropped
+        """
+        self.max_message_chars = max_message_chars
+        self.similarity_threshold = similarity_threshold
+        self.acknowledgements = frozenset(acknowledgements)
+        self.conversations = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def _is_informative(self, message: _Message) -> bool:
+        if message.role != "Client":
+            return True
+        return bool(message.normalized) and message.normalized not in self.acknowledgements
+
+    def _truncate(self, text: str) -> str:
+        if not self.max_message_chars or len(text) <= self.max_message_chars:
+            return text
+        # The end of a long message often holds the question or the commitment
+        head = self.max_message_chars * 2 // 3
+        tail = self.max_message_chars - head
+        return f"{text[:head]} […] {text[-tail:]}"
+
+    def compress_messages(self, conversation_text: str) -> List[str]:
+        """Compressed formatted lines of a conversation"""
+        kept: List[_Message] = []
+        seen_long = {}  # normalized text to the first message with it
+        candidates = deque(maxlen=MAX_SIMILARITY_CANDIDATES)  # (trigrams, message) of earlier long messages
+
+        for message in _parse(conversation_text):
+            if not self._is_informative(message):
+                continue
+
+            previous = kept[-1] if kept else None
+            if previous and previous.role == message.role and previous.normalized == message.normalized:
+                previous.repeats += 1
+                continue
+
+            if len(message.text) >= MIN_SIMILAR_CHARS:
+                original = seen_long.get(message.normalized)
+                if original is None:
+                    trigrams = _trigrams(message.normalized)
+                    original = self._similar(trigrams, candidates)
+                    if original is None:
+                        seen_long[message.normalized] = message
+                        candidates.append((trigrams, message))
+                if original is not None:
+                    message.text = f"[same as the message of {original.timestamp}]"
+
+            message.text = self._truncate(message.text)
+            kept.append(message)
+
+        return [message.render() for message in kept]
+
+    def _similar(self, trigrams: FrozenSet, candidates: Iterable) -> Optional[_Message]:
+        for candidate_trigrams, candidate in candidates:
+            # Jaccard similarity can't reach the threshold if the sizes differ too much
+            smaller, larger = sorted((len(trigrams), len(candidate_trigrams)))
+            if smaller < self.similarity_threshold * larger:
+                continue
+            shared = len(trigrams & candidate_trigrams)
+            if shared >= self.similarity_threshold * (len(trigrams) + len(candidate_trigrams) - shared):
+                return candidate
+        return None
+
+    def compress(self, conversation_text: str) -> str:
+        """Compressed conversation text, the estimated token counts before and after are added up"""
+        compressed = "\n".join(self.compress_messages(conversation_text))
+        self.conversations += 1
+        self.tokens_before += estimate_tokens(conversation_text)
+        self.tokens_after += estimate_tokens(compressed)
+        return compressed
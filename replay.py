@@ -0,0 +1,415 @@
+"""
+Offline stand-ins for TelegramClient and genai.GenerativeModel.
+
+Fake objects generate synthetic data, recording wrappers capture what the real
+services returned, and replay objects serve such recordings without network access.
+All of them support an artificial latency and error injection.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Message, PeerUser, User
+
+from message_record import MessageRecord
+
+
+def make_random_chat(rng: random.Random, client_id: int, count: int, manager_id: int = 1) -> List[MessageRecord]:
+    """
+    Generates a chat with irregular gaps, empty texts and messages without a user sender,
+    to exercise the edge cases of the analyzers.
+    """
+    date = datetime(2024, 6, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randint(0, 10000))
+    messages = []
+    for message_id in range(1, count + 1):
+        date += timedelta(minutes=rng.choice([0, 1, 3, 10, 45, 200, 2000]))
+        sender = rng.choice([manager_id, client_id, None])
+        text = rng.choice(["hello", "", "price?"])
+        messages.append(MessageRecord(message_id, date, sender, text))
+    return messages
+
+
+@dataclass
+class FakeDialog:
+    id: int
+    name: str
+    date: datetime
+    entity: User
+    pinned: bool = False
+
+    @property
+    def is_user(self) -> bool:
+        return isinstance(self.entity, User)
+
+
+def _message_to_dict(message: Message) -> dict:
+    return {
+        'id': message.id,
+        'date': int(message.date.timestamp()),
+        'sender_id': message.sender_id,
+        'text': message.message or ""
+    }
+
+
+def _message_from_dict(dialog_id: int, data: dict) -> Message:
+    return Message(
+        id=data['id'],
+        peer_id=PeerUser(dialog_id),
+        date=datetime.fromtimestamp(data['date'], timezone.utc),
+        message=data['text'],
+        from_id=PeerUser(data['sender_id']) if data['sender_id'] is not None else None
+    )
+
+
+class FakeTelegramClient:
+    """
+    Minimal stand-in for TelegramClient with a configurable per-request latency.
+
+    Only the calls used by main.py and the daemon are implemented. With `error_rate` every
+    request fails with that probability with a zero-second FloodWaitError. `emit` delivers
+    an event to the registered event handlers.
+    """
+
+    def __init__(self,
+                 dialog_count: int = 100,
+                 messages_per_dialog: int = 50,
+                 latency: float = 0.05,
+                 manager_id: int = 1,
+                 seed: int = 0,
+                 error_rate: float = 0.0):
+        self.latency = latency
+        self.manager_id = manager_id
+        self.error_rate = error_rate
+        self.requests = 0
+        self.connected = True
+        self.event_handlers: List[Callable] = []
+        self._rng = random.Random(seed)
+        # Reference time of a replayed recording, None for generated accounts
+        self.now: Optional[datetime] = None
+
+        # Telegram dates have a one second resolution
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.dialogs: List[FakeDialog] = []
+        self.histories: Dict[int, List[Message]] = {}
+        for index in range(dialog_count):
+            client_id = 1000 + index
+            dialog_date = now - timedelta(minutes=index)
+            history = self._make_history(client_id, dialog_date, messages_per_dialog)
+            self.histories[client_id] = history
+            self.dialogs.append(FakeDialog(
+                id=client_id,
+                name=f"Client {client_id}",
+                # A dialog's date is the date of its newest message
+                date=history[-1].date if history else dialog_date,
+                entity=User(id=client_id, bot=False, first_name=f"Client {client_id}"),
+            ))
+        # Telegram lists dialogs from the most recently active one
+        self.dialogs.sort(key=lambda dialog: dialog.date, reverse=True)
+
+    @classmethod
+    def from_recording(cls, path: str, latency: float = 0.0, error_rate: float = 0.0) -> 'FakeTelegramClient':
+        """Replays the account recorded by RecordingTelegramClient"""
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+
+        client = cls(dialog_count=0, latency=latency, manager_id=data['manager_id'], error_rate=error_rate)
+        if 'now' in data:
+            client.now = datetime.fromtimestamp(data['now'], timezone.utc)
+        for dialog in data['dialogs']:
+            client.dialogs.append(FakeDialog(
+                id=dialog['id'],
+                name=dialog['name'],
+                date=datetime.fromtimestamp(dialog['date'], timezone.utc),
+                entity=User(id=dialog['id'], bot=dialog['bot'], first_name=dialog['name']),
+                pinned=dialog.get('pinned', False),
+            ))
+            client.histories[dialog['id']] = [
+                _message_from_dict(dialog['id'], message) for message in data['histories'].get(str(dialog['id']), [])
+            ]
+        return client
+
+    def _make_history(self, client_id: int, last_date: datetime, count: int) -> List[Message]:
+        messages = []
+        date = last_date - timedelta(minutes=10 * count)
+        for message_id in range(1, count + 1):
+            date += timedelta(minutes=self._rng.randint(1, 20))
+            sender = self.manager_id if self._rng.random() < 0.5 else client_id
+            messages.append(Message(
+                id=message_id,
+                peer_id=PeerUser(client_id),
+                date=date,
+                message=f"message {message_id}",
+                from_id=PeerUser(sender),
+            ))
+        return messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def _round_trip(self):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise FloodWaitError(request=None, capture=0)
+
+    async def get_me(self):
+        await self._round_trip()
+        return User(id=self.manager_id, is_self=True, first_name="Manager")
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def add_event_handler(self, callback: Callable, event=None):
+        self.event_handlers.append(callback)
+
+    def remove_event_handler(self, callback: Callable, event=None):
+        self.event_handlers.remove(callback)
+
+    async def emit(self, event):
+        for handler in list(self.event_handlers):
+            await handler(event)
+
+    async def get_dialogs(self, limit: int = None):
+        await self._round_trip()
+        return self.dialogs[:limit]
+
+    def iter_dialogs(self, limit: int = None, **kwargs):
+        # Pinned dialogs come first, then the others from the most recently active one
+        dialogs = sorted(self.dialogs, key=lambda dialog: (not dialog.pinned, -dialog.date.timestamp()))
+        return _PagedIterator(dialogs[:limit], self._round_trip)
+
+    async def get_messages(self, dialog, limit=None, offset_date=None, reverse=False, min_id=0, **kwargs):
+        await self._round_trip()
+        messages = [m for m in self.histories.get(dialog.id, []) if m.id > min_id]
+        if offset_date is not None:
+            messages = [m for m in messages if m.date >= offset_date]
+        if not reverse:
+            messages = list(reversed(messages))
+        return messages[:limit]
+
+    async def iter_messages(self, dialog, limit=None, offset_date=None, reverse=False, min_id=0, **kwargs):
+        # Telethon requests history in pages of 100 messages
+        messages = await self.get_messages(dialog, limit=limit, offset_date=offset_date,
+                                           reverse=reverse, min_id=min_id)
+        for index, message in enumerate(messages):
+            if index and index % 100 == 0:
+                await self._round_trip()
+            yield message
+
+
+class _PagedIterator:
+    """Async iterator making a round trip per page of 100 items, like Telethon's request iterators"""
+
+    def __init__(self, items: List, round_trip: Callable):
+        self.items = items
+        self.round_trip = round_trip
+        self.index = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.index >= len(self.items):
+            raise StopAsyncIteration
+        if self.index % 100 == 0:
+            await self.round_trip()
+        self.index += 1
+        return self.items[self.index - 1]
+
+
+class RecordingTelegramClient:
+    """
+    Wraps a connected TelegramClient and records the dialogs and histories it returns.
+
+    Call `save` afterwards and replay the file with FakeTelegramClient.from_recording.
+    Only the fields used by the analysis are recorded, together with `now`, the reference
+    time the run selects dialogs and messages by, so that a later replay selects the same ones.
+    """
+
+    def __init__(self, client, path: str, now: datetime = None):
+        self.client = client
+        self.path = path
+        self.now = now or datetime.now(timezone.utc)
+        self.manager_id = None
+        self.dialogs = {}
+        self.histories: Dict[int, Dict[int, dict]] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def __aenter__(self):
+        await self.client.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.client.__aexit__(*args)
+
+    async def get_me(self):
+        me = await self.client.get_me()
+        self.manager_id = me.id
+        return me
+
+    async def get_dialogs(self, *args, **kwargs):
+        dialogs = await self.client.get_dialogs(*args, **kwargs)
+        for dialog in dialogs:
+            self._record_dialog(dialog)
+        return dialogs
+
+    async def iter_dialogs(self, *args, **kwargs):
+        async for dialog in self.client.iter_dialogs(*args, **kwargs):
+            self._record_dialog(dialog)
+            yield dialog
+
+    def _record_dialog(self, dialog):
+        if isinstance(dialog.entity, User):
+            self.dialogs[dialog.id] = {
+                'id': dialog.id,
+                'name': dialog.name,
+                'date': int(dialog.date.timestamp()),
+                'bot': bool(dialog.entity.bot),
+                'pinned': bool(getattr(dialog, 'pinned', False))
+            }
+
+    async def get_messages(self, dialog, *args, **kwargs):
+        messages = await self.client.get_messages(dialog, *args, **kwargs)
+        self._record(dialog.id, messages)
+        return messages
+
+    async def iter_messages(self, dialog, *args, **kwargs):
+        async for message in self.client.iter_messages(dialog, *args, **kwargs):
+            self._record(dialog.id, [message])
+            yield message
+
+    def _record(self, dialog_id: int, messages: List[Message]):
+        history = self.histories.setdefault(dialog_id, {})
+        for message in messages:
+            history[message.id] = _message_to_dict(message)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {
+            'manager_id': self.manager_id,
+            'now': self.now.timestamp(),
+            'dialogs': list(self.dialogs.values()),
+            'histories': {
+                str(dialog_id): sorted(history.values(), key=lambda message: message['id'])
+                for dialog_id, history in self.histories.items()
+            }
+        }
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+
+
+def default_responder(prompt: str) -> str:
+    """Answers every prompt of GeminiWrapper with a valid, issue-free verdict"""
+    quality = {"has_issues": False, "issues_found": [], "severity": "low", "summary": "No issues found"}
+    if '"has_unfinished_promises"' in prompt:
+        return json.dumps({"has_unfinished_promises": False, "quality_analysis": quality})
+    if "JSON" in prompt:
+        return json.dumps(quality)
+    return "false"
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel answering with `responder(prompt)`.
+
+    With `error_rate` requests fail with ResourceExhausted, like a rate limited API.
+    """
+
+    def __init__(self,
+                 model_name: str = "models/fake",
+                 responder: Callable[[str], str] = default_responder,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 seed: int = 0):
+        self.model_name = model_name
+        self.responder = responder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def _respond(self, prompt: str):
+        self.calls += 1
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise google_exceptions.ResourceExhausted("Injected rate limit error")
+        return SimpleNamespace(text=self.responder(prompt))
+
+    def generate_content(self, prompt: str, generation_config: dict = None):
+        time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt: str, generation_config: dict = None):
+        await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class RecordingGenerativeModel:
+    """Wraps a real GenerativeModel and appends every prompt hash and response text to a JSON lines file"""
+
+    def __init__(self, model, path: str):
+        self.model = model
+        self.model_name = model.model_name
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _record(self, prompt: str, text: str):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({'prompt': prompt_key(prompt), 'text': text}, ensure_ascii=False) + "\n")
+
+    def generate_content(self, prompt: str, generation_config: dict = None):
+        response = self.model.generate_content(prompt, generation_config=generation_config)
+        self._record(prompt, response.text)
+        return response
+
+    async def generate_content_async(self, prompt: str, generation_config: dict = None):
+        response = await self.model.generate_content_async(prompt, generation_config=generation_config)
+        self._record(prompt, response.text)
+        return response
+
+
+class ReplayGenerativeModel(FakeGenerativeModel):
+    """
+    Answers prompts recorded by RecordingGenerativeModel.
+
+    Unknown prompts are answered by `fallback`, or raise LookupError without one.
+    """
+
+    def __init__(self, path: str, fallback: Optional[Callable[[str], str]] = None, **kwargs):
+        self.responses = {}
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record['prompt']] = record['text']
+        self.fallback = fallback
+        super().__init__(responder=self._lookup, **kwargs)
+
+    def _lookup(self, prompt: str) -> str:
+        text = self.responses.get(prompt_key(prompt))
+        if text is not None:
+            return text
+        if self.fallback is None:
+            raise LookupError("Prompt was not recorded")
+        return self.fallback(prompt)
@@ -0,0 +1,305 @@
+import json
+import math
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from business_calendar import BusinessCalendar
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Response times up to this many minutes are counted together, they can't be told apart anyway
+MIN_SKETCH_VALUE = 1 / 60
+REPORTED_QUANTILES = {'p50': 0.5, 'p90': 0.9, 'p99': 0.99}
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with a relative accuracy guarantee (DDSketch).
+
+    Values are counted in logarithmic buckets, bucket i covering (gamma^(i-1), gamma^i], so every
+    quantile is estimated within `relative_accuracy` of the true value. Memory depends on the range
+    of the values and not on their count, and sketches are merged by adding bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0  # values up to MIN_SKETCH_VALUE
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        if value <= MIN_SKETCH_VALUE:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_array(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+
+        positive = values[values > MIN_SKETCH_VALUE]
+        self.zero_count += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """Adds the values of `other` to this sketch"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Can't merge sketches with relative accuracy "
+                             f"{self.relative_accuracy} and {other.relative_accuracy}")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Estimated value at quantile `q` (0 to 1), 0 without values"""
+        if not self.count:
+            return 0
+        # The extremes are known exactly
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return self.min
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                estimate = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(key): count for key, count in sorted(self.buckets.items())},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'QuantileSketch':
+        sketch = cls(data['relative_accuracy'])
+        sketch.buckets = {int(key): count for key, count in data['buckets'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+
+class ResponseAggregate:
+    """
+    Response time statistics of any number of chats, mergeable across chats, managers and runs.
+
+    Holds a quantile sketch of the response times, the number and total time of responses per
+    local hour of the client message being answered, and the client message load per local
+    weekday and hour. Local time is the timezone of the calendar passed with the messages.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.response_times = QuantileSketch(relative_accuracy)
+        self.hourly_responses = np.zeros(24, dtype=np.int64)
+        self.hourly_response_minutes = np.zeros(24, dtype=np.float64)
+        self.load = np.zeros((7, 24), dtype=np.int64)  # client messages per weekday (0 is Monday) and hour
+
+    def add_responses(self, request_timestamps: np.ndarray, response_minutes: np.ndarray, calendar: BusinessCalendar):
+        """
+        Args:
+            request_timestamps: Unix times of the answered client messages
+            response_minutes: Response time to each of them
+            calendar: Calendar of the manager, for the local time
+        """
+        self.response_times.add_array(response_minutes)
+        _, hours = calendar.local_weekday_hour_array(request_timestamps)
+        self.hourly_responses += np.bincount(hours, minlength=24)
+        self.hourly_response_minutes += np.bincount(hours, weights=response_minutes, minlength=24)
+
+    def add_client_messages(self, timestamps: np.ndarray, calendar: BusinessCalendar):
+        weekdays, hours = calendar.local_weekday_hour_array(timestamps)
+        self.load += np.bincount(weekdays * 24 + hours, minlength=7 * 24).reshape(7, 24)
+
+    def add_response(self, asked_at: datetime, minutes: float, calendar: BusinessCalendar):
+        """Single response version of `add_responses`, for messages analyzed one by one"""
+        self.response_times.add(minutes)
+        hour = asked_at.astimezone(calendar.timezone).hour
+        self.hourly_responses[hour] += 1
+        self.hourly_response_minutes[hour] += minutes
+
+    def add_client_message(self, date: datetime, calendar: BusinessCalendar):
+        local = date.astimezone(calendar.timezone)
+        self.load[local.weekday(), local.hour] += 1
+
+    def merge(self, other: 'ResponseAggregate') -> 'ResponseAggregate':
+        """Adds the statistics of `other` to this aggregate"""
+        self.response_times.merge(other.response_times)
+        self.hourly_responses += other.hourly_responses
+        self.hourly_response_minutes += other.hourly_response_minutes
+        self.load += other.load
+        return self
+
+    @classmethod
+    def merged(cls, aggregates: Iterable['ResponseAggregate'],
+               relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> 'ResponseAggregate':
+        """New aggregate of all `aggregates`, which are left unchanged"""
+        result = cls(relative_accuracy)
+        for aggregate in aggregates:
+            result.merge(aggregate)
+        return result
+
+    def summary(self) -> Dict:
+        sketch = self.response_times
+        return {
+            'responses': sketch.count,
+            'avg_response_time': sketch.sum / sketch.count if sketch.count else 0,
+            **{name: sketch.quantile(q) for name, q in REPORTED_QUANTILES.items()},
+            'max_response_time': sketch.max if sketch.count else 0,
+        }
+
+    def to_dict(self) -> Dict:
+        hourly_avg = np.divide(self.hourly_response_minutes, self.hourly_responses,
+                               out=np.zeros(24), where=self.hourly_responses > 0)
+        return {
+            'summary': self.summary(),
+            'hourly_responses': self.hourly_responses.tolist(),
+            'hourly_avg_response_time': hourly_avg.tolist(),
+            'hourly_response_minutes': self.hourly_response_minutes.tolist(),
+            'load': self.load.tolist(),
+            'sketch': self.response_times.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ResponseAggregate':
+        aggregate = cls()
+        aggregate.response_times = QuantileSketch.from_dict(data['sketch'])
+        aggregate.hourly_responses = np.array(data['hourly_responses'], dtype=np.int64)
+        aggregate.hourly_response_minutes = np.array(data['hourly_response_minutes'], dtype=np.float64)
+        aggregate.load = np.array(data['load'], dtype=np.int64)
+        return aggregate
+
+
+class TeamRollup:
+    """Response aggregates of every manager, rolled up into one of the whole team"""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.managers: Dict[str, ResponseAggregate] = {}
+
+    def aggregate(self, manager: str) -> ResponseAggregate:
+        """Aggregate of `manager`, for the analyzers to add the manager's chats to"""
+        if manager not in self.managers:
+            self.managers[manager] = ResponseAggregate(self.relative_accuracy)
+        return self.managers[manager]
+
+    def add(self, manager: str, aggregate: ResponseAggregate):
+        self.aggregate(manager).merge(aggregate)
+
+    def merge(self, other: 'TeamRollup') -> 'TeamRollup':
+        for manager, aggregate in other.managers.items():
+            self.add(manager, aggregate)
+        return self
+
+    @property
+    def team(self) -> ResponseAggregate:
+        return ResponseAggregate.merged(self.managers.values(), self.relative_accuracy)
+
+    def to_dict(self) -> Dict:
+        return {
+            'team': self.team.to_dict(),
+            'managers': {manager: aggregate.to_dict() for manager, aggregate in self.managers.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TeamRollup':
+        rollup = cls()
+        for manager, aggregate in data['managers'].items():
+            rollup.managers[manager] = ResponseAggregate.from_dict(aggregate)
+        if rollup.managers:
+            rollup.relative_accuracy = next(iter(rollup.managers.values())).response_times.relative_accuracy
+        return rollup
+
+    def save(self, output_dir: str) -> str:
+        path = os.path.join(output_dir, 'aggregates.json')
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+        return path
+
+
+def append_history(path: str, rollup: TeamRollup, run_at: datetime = None):
+    """Appends the rollup of a run to a JSON lines history file"""
+    run_at = run_at or datetime.now(timezone.utc)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps({'run_at': run_at.isoformat(), **rollup.to_dict()}, ensure_ascii=False) + "\n")
+
+
+def load_history(path: str) -> List[Tuple[datetime, TeamRollup]]:
+    """Rollups of the previous runs, oldest first"""
+    if not os.path.exists(path):
+        return []
+    history = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                data = json.loads(line)
+                history.append((datetime.fromisoformat(data['run_at']), TeamRollup.from_dict(data)))
+    return history
+
+
+def merge_history(history: Iterable[Tuple[datetime, TeamRollup]], since: datetime = None) -> TeamRollup:
+    """
+    Merges the rollups of runs from `since` on.
+
+    Every run covers its own look-back window, so this is meant for runs over disjoint periods.
+    """
+    merged = TeamRollup()
+    for run_at, rollup in history:
+        if since is None or run_at >= since:
+            merged.merge(rollup)
+    return merged
+
+
+def trend(history: Iterable[Tuple[datetime, TeamRollup]], manager: str = None) -> List[Dict]:
+    """Summary of the team, or of one manager, in every run"""
+    rows = []
+    for run_at, rollup in history:
+        if manager is None:
+            aggregate = rollup.team
+        elif manager in rollup.managers:
+            aggregate = rollup.managers[manager]
+        else:
+            continue
+        rows.append({'run_at': run_at, **aggregate.summary()})
+    return rows
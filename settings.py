@@ -1,3 +1,6 @@
+from datetime import date
+from typing import Dict, List
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -7,3 +10,38 @@ class TelegramScrapingSettings(BaseSettings):
     api_hash: str
     client_name: str
     gemini_key: str
+    chat_limit: int = 10
+    fetch_concurrency: int = 8
+    gemini_models: List[str] = ["gemini-1.5-flash-latest"]
+    gemini_max_attempts: int = 6
+    gemini_max_concurrency: int = 4
+    gemini_requests_per_minute: int = 15
+    gemini_combined_analysis: bool = True
+    promise_prefilter: bool = True
+    prompt_compression: bool = True
+    # Longer messages are cut to their beginning and end before prompting, 0 keeps them whole
+    llm_max_message_chars: int = 1500
+    gemini_cache_path: str = "cache/gemini_results.sqlite"
+    gemini_cache_ttl_days: int = 7
+    gemini_cache_max_entries: int = 50000
+    llm_max_prompt_tokens: int = 8000
+    llm_chunk_overlap_tokens: int = 500
+    llm_chunk_strategy: str = "windows"
+    message_store_path: str = "cache/messages.sqlite"
+    streaming_analysis: bool = False
+    business_timezone: str = "UTC"
+    business_days: List[int] = [0, 1, 2, 3, 4]
+    business_shifts: List[str] = ["09:00-18:00"]
+    business_holidays: List[date] = []
+    # Session name to timezone of managers working outside business_timezone
+    manager_timezones: Dict[str, str] = {}
+    sessions: List[str] = []
+    account_workers: int = 0
+    # "cprofile" or "tracemalloc" to write a profile of the run next to the reports
+    profile_mode: str = ""
+    report_formats: List[str] = ["parquet", "csv", "html"]
+    report_chunk_size: int = 10000
+    # JSON lines file the response time aggregates of every run are appended to, empty to disable
+    aggregate_history_path: str = "reports/history.jsonl"
+    daemon_debounce_seconds: float = 60.0
+    daemon_report_interval_seconds: float = 300.0
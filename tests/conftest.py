@@ -1,8 +1,28 @@
 import pytest
 
 from gemini_wrapper import GeminiWrapper
+from model_scheduler import BackoffPolicy, ModelScheduler
+from settings import TelegramScrapingSettings
 
 
 @pytest.fixture
 def gemini() -> GeminiWrapper:
     return GeminiWrapper()
+
+
+@pytest.fixture
+def offline_settings() -> TelegramScrapingSettings:
+    """Settings without local stores, for runs against replay.FakeTelegramClient"""
+    return TelegramScrapingSettings(api_id=1, api_hash="x", client_name="offline", gemini_key="x",
+                                    message_store_path="", gemini_cache_path="")
+
+
+@pytest.fixture
+def offline_gemini():
+    """Builds a GeminiWrapper around a fake model, retrying without backoff"""
+    def build(model) -> GeminiWrapper:
+        scheduler = ModelScheduler(["models/fake"], model_factory=lambda name: model,
+                                   backoff=BackoffPolicy(base_delay=0, max_delay=0), discover_models=False,
+                                   max_attempts=20, failure_threshold=1000)
+        return GeminiWrapper(requests_per_minute=0, scheduler=scheduler)
+    return build
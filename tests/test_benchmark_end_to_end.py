@@ -0,0 +1,31 @@
+"""
+End-to-end throughput of the offline pipeline, run with pytest-benchmark:
+
+    python -m pytest tests/test_benchmark_end_to_end.py --benchmark-only
+"""
+import asyncio
+
+import pytest
+
+from main import collect_analytics, stream_analytics
+from replay import FakeGenerativeModel, FakeTelegramClient
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.mark.parametrize("chats", [10, 100, 1000])
+@pytest.mark.parametrize("analyze", [collect_analytics, stream_analytics])
+def test_end_to_end_throughput(benchmark, analyze, chats, offline_settings, offline_gemini):
+    benchmark.group = f"end_to_end_{chats}_chats"
+    settings = offline_settings.model_copy(update={'chat_limit': chats, 'fetch_concurrency': 16})
+
+    def setup():
+        client = FakeTelegramClient(dialog_count=chats, messages_per_dialog=50, latency=0)
+        gemini = offline_gemini(FakeGenerativeModel())
+        return (client, gemini), {}
+
+    def run(client, gemini):
+        return asyncio.run(analyze(client, settings, gemini))
+
+    all_analytics = benchmark.pedantic(run, setup=setup, rounds=3)
+    assert len(all_analytics) == chats
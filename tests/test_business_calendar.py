@@ -0,0 +1,106 @@
+import random
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+from business_calendar import BusinessCalendar, parse_shifts
+from manager_performance import IncrementalPerformanceAnalyzer, ManagerPerformanceAnalyzer
+from replay import make_random_chat
+from vectorized_performance import analyze_chats
+
+MANAGER_ID = 1
+
+
+def test_default_calendar_is_weekdays_nine_to_six_utc():
+    rng = np.random.default_rng(0)
+    timestamps = rng.integers(1_600_000_000, 1_800_000_000, size=100_000)
+
+    hours = (timestamps // 3600) % 24
+    weekdays = (timestamps // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+    expected = (hours >= 9) & (hours < 18) & (weekdays < 5)
+
+    assert np.array_equal(BusinessCalendar().is_working_array(timestamps), expected)
+
+
+def test_working_minutes_skip_nights_weekends_and_holidays():
+    calendar = BusinessCalendar(holidays=[date(2024, 6, 10)])
+    friday_evening = datetime(2024, 6, 7, 17, 30, tzinfo=timezone.utc)
+    tuesday_morning = datetime(2024, 6, 11, 9, 15, tzinfo=timezone.utc)
+
+    # 30 minutes on Friday, the weekend and the Monday holiday don't count, 15 minutes on Tuesday
+    assert calendar.working_minutes(friday_evening, tuesday_morning) == 45
+    assert calendar.working_minutes(friday_evening, friday_evening + timedelta(seconds=90)) == 1.5
+    assert not calendar.is_working(datetime(2024, 6, 10, 12, tzinfo=timezone.utc))
+
+
+def test_shifts_follow_the_local_timezone_across_dst():
+    calendar = BusinessCalendar("Europe/Berlin")
+    berlin = ZoneInfo("Europe/Berlin")
+
+    # 9:00 local time is 7:00 UTC in summer and 8:00 UTC in winter
+    assert calendar.is_working(datetime(2024, 7, 1, 9, tzinfo=berlin))
+    assert not calendar.is_working(datetime(2024, 7, 1, 6, 59, tzinfo=timezone.utc))
+    assert calendar.is_working(datetime(2024, 12, 2, 8, tzinfo=timezone.utc))
+    assert not calendar.is_working(datetime(2024, 12, 2, 7, 59, tzinfo=timezone.utc))
+
+
+def test_overnight_shift_ends_on_the_next_day():
+    calendar = BusinessCalendar(shifts=parse_shifts([0], ["22:00-06:00"]))
+    monday_night = datetime(2024, 6, 3, 22, tzinfo=timezone.utc)
+
+    assert calendar.is_working(monday_night + timedelta(hours=7))
+    assert not calendar.is_working(monday_night + timedelta(hours=8))
+    assert calendar.working_minutes(monday_night, monday_night + timedelta(days=1)) == 8 * 60
+
+
+def test_tables_grow_to_cover_new_dates():
+    calendar = BusinessCalendar()
+    first = datetime(2020, 1, 6, 10, tzinfo=timezone.utc)
+    later = datetime(2024, 1, 8, 10, tzinfo=timezone.utc)
+
+    assert calendar.is_working(first)
+    assert calendar.is_working(later)
+    assert calendar.working_minutes(first, first + timedelta(days=7)) == 5 * 9 * 60
+
+
+def test_analyzers_agree_on_a_custom_calendar():
+    calendar = BusinessCalendar("Asia/Tokyo", parse_shifts(range(6), ["10:00-14:00", "15:00-19:00"]))
+    rng = random.Random(11)
+    chats = [(index, make_random_chat(rng, 100 + index, rng.randint(0, 80), MANAGER_ID)) for index in range(20)]
+
+    vectorized = analyze_chats(chats, MANAGER_ID, calendar)
+    for key, messages in chats:
+        expected = ManagerPerformanceAnalyzer(messages, MANAGER_ID, calendar).analyze()
+        incremental = IncrementalPerformanceAnalyzer(MANAGER_ID, calendar)
+        for message in messages:
+            incremental.update(message)
+
+        assert vectorized[key]['metrics'] == pytest.approx(expected['metrics'])
+        assert incremental.result()['metrics'] == pytest.approx(expected['metrics'])
+
+
+def test_settings_build_the_calendar(offline_settings):
+    settings = offline_settings.model_copy(update={
+        'business_timezone': "America/New_York",
+        'business_shifts': ["08:00-12:00"],
+        'business_holidays': [date(2024, 7, 4)],
+    })
+    calendar = BusinessCalendar.from_settings(settings)
+
+    assert calendar.shifts[4] == [(time(8), time(12))]
+    assert 5 not in calendar.shifts
+    assert not calendar.is_working(datetime(2024, 7, 4, 9, tzinfo=ZoneInfo("America/New_York")))
+    assert calendar.is_working(datetime(2024, 7, 5, 9, tzinfo=ZoneInfo("America/New_York")))
+
+
+def test_local_weekday_and_hour_follow_offsets_off_the_hour():
+    timestamps = np.random.default_rng(3).integers(1_600_000_000, 1_800_000_000, size=5_000)
+    calendar = BusinessCalendar("Asia/Kathmandu")  # UTC+5:45
+
+    weekdays, hours = calendar.local_weekday_hour_array(timestamps)
+
+    local = [datetime.fromtimestamp(int(timestamp), calendar.timezone) for timestamp in timestamps]
+    assert weekdays.tolist() == [moment.weekday() for moment in local]
+    assert hours.tolist() == [moment.hour for moment in local]
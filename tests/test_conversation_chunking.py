@@ -0,0 +1,91 @@
+import pytest
+
+from conversation_chunking import ConversationChunker, estimate_tokens, group_messages, merge_window_analyses
+
+
+def make_lines(count: int):
+    return [f"[06/10 10:{index % 60:02d}] Client: message number {index} with some text" for index in range(count)]
+
+
+def test_short_conversation_is_one_window():
+    lines = make_lines(5)
+    chunker = ConversationChunker(max_tokens=1000)
+    assert chunker.fits("\n".join(lines))
+    assert chunker.split(lines) == [lines]
+
+
+def test_windows_respect_budget_overlap_and_cover_everything():
+    lines = make_lines(200)
+    chunker = ConversationChunker(max_tokens=300, overlap_tokens=50)
+    windows = chunker.split(lines)
+
+    assert len(windows) > 1
+    for window in windows:
+        assert estimate_tokens("\n".join(window)) <= 300
+    for previous, current in zip(windows, windows[1:]):
+        assert previous[-1] in current
+    assert windows[0][0] == lines[0]
+    assert windows[-1][-1] == lines[-1]
+    assert set(line for window in windows for line in window) == set(lines)
+
+
+def test_tail_strategy_keeps_latest_messages():
+    lines = make_lines(200)
+    windows = ConversationChunker(max_tokens=300, strategy="tail").split(lines)
+    assert len(windows) == 1
+    assert windows[0][-1] == lines[-1]
+    assert estimate_tokens("\n".join(windows[0])) <= 300
+
+
+def test_oversized_line_is_truncated():
+    windows = ConversationChunker(max_tokens=50).split(["x" * 10000, "short"])
+    assert all(estimate_tokens("\n".join(window)) <= 50 for window in windows)
+
+
+def test_merge_reports_any_issue_and_highest_severity():
+    merged = merge_window_analyses([
+        {'has_unfinished_promises': False,
+         'quality_analysis': {'has_issues': True, 'issues_found': ["rude"], 'severity': "medium", 'summary': "a"}},
+        {'has_unfinished_promises': True,
+         'quality_analysis': {'has_issues': False, 'issues_found': ["rude", "slow"], 'severity': "low",
+                              'summary': "b"}},
+    ])
+    assert merged['has_unfinished_promises'] is True
+    assert merged['quality_analysis'] == {'has_issues': True, 'issues_found': ["rude", "slow"],
+                                          'severity': "medium", 'summary': "a b"}
+
+
+def test_promise_fulfilled_in_a_later_window_is_not_reported():
+    quality = {'has_issues': False, 'issues_found': [], 'severity': "none", 'summary': ""}
+    merged = merge_window_analyses([
+        {'has_unfinished_promises': True, 'fulfills_promise': False, 'quality_analysis': quality},
+        {'has_unfinished_promises': False, 'fulfills_promise': True, 'quality_analysis': quality},
+    ])
+    assert merged['has_unfinished_promises'] is False
+
+
+def test_promise_is_open_until_a_later_window_fulfills_it():
+    quality = {'has_issues': False, 'issues_found': [], 'severity': "none", 'summary': ""}
+    merged = merge_window_analyses([
+        {'has_unfinished_promises': True, 'fulfills_promise': False, 'quality_analysis': quality},
+        {'has_unfinished_promises': False, 'fulfills_promise': False, 'quality_analysis': quality},
+    ])
+    assert merged['has_unfinished_promises'] is True
+
+
+def test_windows_keep_multi_line_messages_whole():
+    text = "\n".join(f"[06/10 10:{index % 60:02d}] Client: question {index}\nsecond line\nthird line"
+                     for index in range(60))
+    messages = group_messages(text.splitlines())
+    windows = ConversationChunker(max_tokens=200, overlap_tokens=20).split(messages)
+
+    assert len(messages) == 60
+    assert len(windows) > 1
+    for window in windows:
+        assert all(message.endswith("second line\nthird line") for message in window)
+        assert "\n".join(window).startswith("[06/10 ")
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        ConversationChunker(strategy="middle")
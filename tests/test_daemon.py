@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from telethon import events
+from telethon.tl.types import Message, PeerUser
+
+from daemon import LiveMetricsDaemon
+from main import collect_analytics, stream_analytics
+from manager_performance import IncrementalPerformanceAnalyzer
+from replay import FakeGenerativeModel, FakeTelegramClient
+
+
+def next_message(previous: Message, out: bool, minutes: int = 1, manager_id: int = 1) -> Message:
+    # Like real private messages, only outgoing ones name their sender
+    return Message(id=previous.id + 1, peer_id=previous.peer_id, date=previous.date + timedelta(minutes=minutes),
+                   message="new", out=out, from_id=PeerUser(manager_id) if out else None)
+
+
+def without_incoming_senders(client: FakeTelegramClient):
+    for dialog_id, history in client.histories.items():
+        client.histories[dialog_id] = [
+            Message(id=message.id, peer_id=message.peer_id, date=message.date, message=message.message,
+                    out=message.from_id.user_id == client.manager_id,
+                    from_id=message.from_id if message.from_id.user_id == client.manager_id else None)
+            for message in history
+        ]
+
+
+@pytest.mark.asyncio
+async def test_new_messages_update_metrics_and_debounce_analysis(offline_settings, offline_gemini):
+    client = FakeTelegramClient(dialog_count=12, latency=0)
+    model = FakeGenerativeModel()
+    daemon = LiveMetricsDaemon(client, offline_settings, offline_gemini(model), debounce=0.05)
+
+    await daemon.bootstrap()
+    await daemon.wait_for_analyses()
+    assert len(daemon.snapshot()) == 10
+    assert model.calls == 10
+
+    dialog = client.dialogs[0]
+    chat = daemon.chats[dialog.id]
+    before = chat.analyzer.result()['metrics']
+    question = next_message(client.histories[dialog.id][-1], out=False)
+    answer = next_message(question, out=True, minutes=2)
+    daemon.handle_message(dialog.id, dialog.name, question)
+    daemon.handle_message(dialog.id, dialog.name, answer)
+
+    after = daemon.snapshot()[dialog.name]['performance']['metrics']
+    assert after['client_messages'] == before['client_messages'] + 1
+    assert after['manager_messages'] == before['manager_messages'] + 1
+    assert after['max_response_time'] >= 2
+
+    # Both messages are analyzed together once the chat is quiet
+    await asyncio.sleep(0.1)
+    await daemon.wait_for_analyses()
+    assert model.calls == 11
+    assert chat.analyzed_version == chat.version
+
+
+@pytest.mark.asyncio
+async def test_messages_of_new_chats_are_tracked(offline_settings, offline_gemini):
+    client = FakeTelegramClient(dialog_count=0, latency=0)
+    daemon = LiveMetricsDaemon(client, offline_settings, offline_gemini(FakeGenerativeModel()), debounce=0)
+    await daemon.bootstrap()
+
+    first = Message(id=1, peer_id=PeerUser(5000), date=datetime(2024, 6, 3, 10, tzinfo=timezone.utc),
+                    message="hello", out=False)
+    daemon.handle_message(5000, "New client", first)
+    await asyncio.sleep(0.01)
+    await daemon.wait_for_analyses()
+
+    assert daemon.snapshot()["New client"]['performance']['metrics']['client_messages'] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_streaming_and_daemon_agree_on_private_senders(offline_settings, offline_gemini):
+    client = FakeTelegramClient(dialog_count=5, latency=0)
+    without_incoming_senders(client)
+    gemini = offline_gemini(FakeGenerativeModel())
+    daemon = LiveMetricsDaemon(client, offline_settings, gemini, debounce=0)
+
+    batch = await collect_analytics(client, offline_settings, gemini)
+    streamed = await stream_analytics(client, offline_settings, gemini)
+    await daemon.bootstrap()
+    await daemon.wait_for_analyses()
+    live = daemon.snapshot()
+
+    for name, analytics in batch.items():
+        metrics = analytics['performance']['metrics']
+        assert metrics['client_messages'] > 0
+        assert metrics['manager_messages'] > 0
+        assert streamed[name]['performance']['metrics'] == metrics
+        assert live[name]['performance']['metrics'] == metrics
+
+
+@pytest.mark.asyncio
+async def test_messages_older_than_the_history_depth_are_forgotten(offline_settings, offline_gemini):
+    client = FakeTelegramClient(dialog_count=3, latency=0)
+    daemon = LiveMetricsDaemon(client, offline_settings, offline_gemini(FakeGenerativeModel()), debounce=0,
+                               history_depth=timedelta(hours=2))
+    await daemon.bootstrap()
+    await daemon.wait_for_analyses()
+    before = {dialog_id: chat.analyzer.result()['total_messages'] for dialog_id, chat in daemon.chats.items()}
+
+    now = datetime.now(timezone.utc) + timedelta(hours=1)
+    daemon.prune(now)
+
+    for dialog_id, chat in daemon.chats.items():
+        assert 0 < len(chat.messages) == len(chat.lines) < before[dialog_id]
+        assert chat.messages[0].date >= now - timedelta(hours=2)
+        expected = IncrementalPerformanceAnalyzer(daemon.manager_id, daemon.calendar)
+        for message in chat.messages:
+            expected.update(message)
+        assert chat.analyzer.result() == expected.result()
+
+    daemon.prune(now + timedelta(days=1))
+    assert daemon.chats == {}
+
+
+@pytest.mark.asyncio
+async def test_messages_sent_during_the_bootstrap_are_buffered(offline_settings, offline_gemini, tmp_path,
+                                                               monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeTelegramClient(dialog_count=3, latency=0.02)
+    gemini = offline_gemini(FakeGenerativeModel())
+    reference = LiveMetricsDaemon(client, offline_settings, gemini)
+    await reference.bootstrap()
+    await reference.wait_for_analyses()
+    daemon = LiveMetricsDaemon(client, offline_settings, gemini, debounce=0, report_interval=0.01)
+
+    run = asyncio.create_task(daemon.run())
+    await asyncio.sleep(0.01)
+    assert client.event_handlers and not daemon.chats
+    dialog = client.dialogs[0]
+    fetched = client.histories[dialog.id][-1]
+    await client.emit(events.NewMessage.Event(fetched))
+    await client.emit(events.NewMessage.Event(next_message(fetched, out=False)))
+
+    while daemon._pending_events is not None:
+        await asyncio.sleep(0.01)
+    client.connected = False
+    await run
+    await daemon.wait_for_analyses()
+
+    metrics = daemon.chats[dialog.id].analyzer.result()['metrics']
+    expected = reference.chats[dialog.id].analyzer.result()['metrics']
+    assert metrics['client_messages'] == expected['client_messages'] + 1
+    assert metrics['total_messages'] == expected['total_messages'] + 1
+    assert client.event_handlers == []
+
+
+@pytest.mark.asyncio
+async def test_failed_analyses_are_retried(offline_settings, offline_gemini, caplog):
+    client = FakeTelegramClient(dialog_count=2, latency=0)
+    model = FakeGenerativeModel(error_rate=1.0)
+    daemon = LiveMetricsDaemon(client, offline_settings, offline_gemini(model), debounce=0, report_interval=0.05)
+
+    with caplog.at_level(logging.ERROR, logger="daemon"):
+        await daemon.bootstrap()
+        await daemon.wait_for_analyses()
+    assert daemon.snapshot() == {}
+    assert set(daemon._timers) == set(daemon.chats)
+    assert "Analysis of Client" in caplog.text
+
+    model.error_rate = 0
+    await asyncio.sleep(0.1)
+    await daemon.wait_for_analyses()
+    assert len(daemon.snapshot()) == 2
+    assert daemon._timers == {}
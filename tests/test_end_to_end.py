@@ -0,0 +1,102 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+from main import collect_analytics, parse_args, stream_analytics
+from manager_performance import PerformanceReporter
+from replay import (FakeGenerativeModel, FakeTelegramClient, RecordingGenerativeModel, RecordingTelegramClient,
+                    ReplayGenerativeModel)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("analyze", [collect_analytics, stream_analytics])
+async def test_offline_run_produces_reports(analyze, offline_settings, offline_gemini, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeTelegramClient(dialog_count=12, latency=0)
+
+    all_analytics = await analyze(client, offline_settings, offline_gemini(FakeGenerativeModel()))
+
+    assert len(all_analytics) == 10
+    for analytics in all_analytics.values():
+        assert analytics['performance']['total_messages'] == 50
+        assert analytics['has_unfinished_promises'] is False
+        assert analytics['quality_analysis']['has_issues'] is False
+
+    PerformanceReporter(all_analytics).save_reports()
+    assert (tmp_path / "reports" / "summary.csv").exists()
+    assert (tmp_path / "reports" / "detailed_metrics.html").exists()
+
+
+@pytest.mark.asyncio
+async def test_injected_errors_are_survived(offline_settings, offline_gemini):
+    client = FakeTelegramClient(dialog_count=12, latency=0, error_rate=0.2, seed=3)
+    model = FakeGenerativeModel(error_rate=0.3)
+
+    all_analytics = await collect_analytics(client, offline_settings, offline_gemini(model))
+
+    assert len(all_analytics) == 10
+    assert all(not analytics['quality_analysis']['summary'].startswith("Error")
+               for analytics in all_analytics.values())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("analyze", [collect_analytics, stream_analytics])
+async def test_failed_chat_analyses_fall_back_per_chat(analyze, offline_settings, offline_gemini):
+    client = FakeTelegramClient(dialog_count=12, latency=0)
+
+    all_analytics = await analyze(client, offline_settings, offline_gemini(FakeGenerativeModel(error_rate=1.0)))
+
+    assert len(all_analytics) == 10
+    for analytics in all_analytics.values():
+        assert analytics['performance']['total_messages'] == 50
+        assert analytics['has_unfinished_promises'] is False
+        assert analytics['quality_analysis']['summary'].startswith("Error analyzing conversation")
+
+
+@pytest.mark.asyncio
+async def test_record_and_replay_round_trip(offline_settings, offline_gemini, tmp_path):
+    live_client = FakeTelegramClient(dialog_count=5, latency=0)
+    recording_client = RecordingTelegramClient(live_client, str(tmp_path / "telegram.json"))
+    recording_model = RecordingGenerativeModel(FakeGenerativeModel(), str(tmp_path / "gemini.jsonl"))
+
+    recorded = await collect_analytics(recording_client, offline_settings, offline_gemini(recording_model))
+    recording_client.save()
+
+    replay_client = FakeTelegramClient.from_recording(str(tmp_path / "telegram.json"))
+    replay_model = ReplayGenerativeModel(str(tmp_path / "gemini.jsonl"))
+    replayed = await collect_analytics(replay_client, offline_settings, offline_gemini(replay_model),
+                                       now=replay_client.now)
+
+    assert json.dumps(replayed, sort_keys=True) == json.dumps(recorded, sort_keys=True)
+    assert replay_model.calls == 5
+
+
+@pytest.mark.asyncio
+async def test_replay_selects_messages_by_the_recorded_time(offline_settings, offline_gemini, tmp_path):
+    live_client = FakeTelegramClient(dialog_count=5, latency=0)
+    # The 30 day history window of this reference time starts in the middle of the generated histories,
+    # like a run replayed long after it was recorded
+    recorded_now = live_client.dialogs[0].date + timedelta(days=30, hours=-4)
+    recording_client = RecordingTelegramClient(live_client, str(tmp_path / "telegram.json"), recorded_now)
+    recording_model = RecordingGenerativeModel(FakeGenerativeModel(), str(tmp_path / "gemini.jsonl"))
+
+    recorded = await collect_analytics(recording_client, offline_settings, offline_gemini(recording_model),
+                                       now=recording_client.now)
+    recording_client.save()
+
+    replay_client = FakeTelegramClient.from_recording(str(tmp_path / "telegram.json"))
+    replayed = await collect_analytics(replay_client, offline_settings,
+                                       offline_gemini(ReplayGenerativeModel(str(tmp_path / "gemini.jsonl"))),
+                                       now=replay_client.now)
+
+    assert replay_client.now == recorded_now.replace(microsecond=0)
+    assert all(analytics['performance']['total_messages'] < 50 for analytics in recorded.values())
+    assert json.dumps(replayed, sort_keys=True) == json.dumps(recorded, sort_keys=True)
+
+
+@pytest.mark.parametrize("mode", [["--record", "recordings"], ["--replay", "recordings"], ["--daemon"]])
+def test_sessions_are_rejected_with_single_account_modes(mode):
+    assert parse_args(mode).sessions is None
+    with pytest.raises(SystemExit):
+        parse_args(["--sessions", "anna", "boris", *mode])
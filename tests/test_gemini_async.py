@@ -0,0 +1,169 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from conversation_chunking import ConversationChunker
+from gemini_wrapper import GeminiWrapper, RequestRateLimiter
+from llm_cache import LLMResultCache
+from model_scheduler import ModelScheduler
+
+
+class SlowModel:
+    model_name = "models/fake"
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        quality = {"has_issues": False, "issues_found": [], "severity": "low", "summary": "ok"}
+        if "has_unfinished_promises" in prompt:
+            text = json.dumps({"has_unfinished_promises": True, "quality_analysis": quality})
+        elif "JSON" in prompt:
+            text = json.dumps(quality)
+        else:
+            text = "true"
+        return SimpleNamespace(text=text)
+
+
+def make_gemini(model, **kwargs) -> GeminiWrapper:
+    scheduler = ModelScheduler(["models/fake"], model_factory=lambda name: model, discover_models=False)
+    return GeminiWrapper(scheduler=scheduler, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_async_analyze_conversations_respects_concurrency_cap():
+    model = SlowModel()
+    gemini = make_gemini(model, max_concurrency=3, requests_per_minute=0, combined_analysis=False)
+
+    results = await gemini.async_analyze_conversations({f"client {i}": "text" for i in range(10)})
+
+    assert len(results) == 10
+    assert model.calls == 20
+    assert model.max_in_flight == 3
+    assert results["client 0"]["has_unfinished_promises"] is True
+    assert results["client 0"]["quality_analysis"]["has_issues"] is False
+
+
+@pytest.mark.asyncio
+async def test_combined_analysis_uses_one_call_per_conversation():
+    separate_model = SlowModel()
+    separate = make_gemini(separate_model, requests_per_minute=0, combined_analysis=False)
+    combined_model = SlowModel()
+    combined = make_gemini(combined_model, requests_per_minute=0, combined_analysis=True)
+
+    conversations = {f"client {i}": "text" for i in range(5)}
+    assert await combined.async_analyze_conversations(conversations) == \
+        await separate.async_analyze_conversations(conversations)
+    assert combined_model.calls == 5
+    assert separate_model.calls == 10
+
+
+@pytest.mark.asyncio
+async def test_combined_analysis_falls_back_on_malformed_output():
+    model = SlowModel()
+    gemini = make_gemini(model, requests_per_minute=0, combined_analysis=True)
+    responses = iter(["not json", "false", json.dumps({"has_issues": True, "issues_found": ["rude"],
+                                                      "severity": "high", "summary": "bad"})])
+
+    async def generate_content_async(prompt, generation_config=None):
+        return SimpleNamespace(text=next(responses))
+
+    model.generate_content_async = generate_content_async
+    result = await gemini.async_analyze_conversation("text")
+    assert result["has_unfinished_promises"] is False
+    assert result["quality_analysis"]["has_issues"] is True
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_delays_requests_over_budget(mocker):
+    sleep = mocker.patch("gemini_wrapper.asyncio.sleep", side_effect=asyncio.CancelledError)
+    limiter = RequestRateLimiter(requests_per_minute=2)
+
+    await limiter.acquire()
+    await limiter.acquire()
+    with pytest.raises(asyncio.CancelledError):
+        await limiter.acquire()
+    assert sleep.call_args.args[0] > 59
+
+
+@pytest.mark.asyncio
+async def test_cached_results_skip_model_calls(tmp_path):
+    model = SlowModel()
+    gemini = make_gemini(model, requests_per_minute=0, cache=LLMResultCache(str(tmp_path / "cache.sqlite")))
+
+    first = await gemini.async_analyze_conversations({"client": "text"})
+    second = await gemini.async_analyze_conversations({"client": "text"})
+
+    assert first == second
+    assert model.calls == 1
+    assert gemini.cache.stats()['hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_long_conversation_is_analyzed_in_windows():
+    model = SlowModel()
+    gemini = make_gemini(model, requests_per_minute=0, chunker=ConversationChunker(max_tokens=200, overlap_tokens=20))
+    text = "\n".join(f"[06/10 10:00] Client: message {index}" for index in range(100))
+
+    result = await gemini.async_analyze_conversation(text)
+
+    assert model.calls > 1
+    assert model.max_in_flight > 1
+    assert result["has_unfinished_promises"] is True
+
+
+class PromiseModel(SlowModel):
+    """Sees the invoice promised in windows that don't show it sent, and fulfilled in those that do"""
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await super().generate_content_async(prompt, generation_config)
+        quality = {"has_issues": False, "issues_found": [], "severity": "none", "summary": ""}
+        if '"fulfills_promise"' not in prompt:
+            return SimpleNamespace(text=json.dumps(quality))
+        self.promise_prompts.append(prompt)
+        sent = "Here is the invoice" in prompt
+        data = {"has_unfinished_promises": "I'll send the invoice" in prompt and not sent, "fulfills_promise": sent}
+        if '"quality_analysis"' in prompt:
+            data["quality_analysis"] = quality
+        return SimpleNamespace(text=json.dumps(data))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("combined_analysis", [True, False])
+@pytest.mark.parametrize("fulfilled", [True, False])
+async def test_promise_fulfilled_in_a_later_window_is_not_reported(fulfilled, combined_analysis):
+    model = PromiseModel()
+    model.promise_prompts = []
+    gemini = make_gemini(model, requests_per_minute=0, combined_analysis=combined_analysis,
+                         chunker=ConversationChunker(max_tokens=200, overlap_tokens=20))
+    lines = ["[06/10 10:00] Manager: I'll send the invoice tonight"]
+    lines += [f"[06/10 10:01] Client: message {index}" for index in range(100)]
+    if fulfilled:
+        lines.append("[06/10 18:00] Manager: Here is the invoice")
+
+    result = await gemini.async_analyze_conversation("\n".join(lines))
+
+    assert len(model.promise_prompts) > 2
+    # Windows are still analyzed concurrently
+    assert model.max_in_flight > 1
+    assert result["has_unfinished_promises"] is not fulfilled
+
+
+def test_windows_start_with_a_message():
+    gemini = make_gemini(SlowModel(), requests_per_minute=0, chunker=ConversationChunker(max_tokens=200, overlap_tokens=20))
+    text = "\n".join(f"[06/10 10:00] Manager: offer {index}\nline two\nline three" for index in range(60))
+
+    windows = gemini._split(text)
+
+    assert len(windows) > 1
+    assert all(window.startswith("[06/10 10:00] Manager: offer ") for window in windows)
+    assert all(window.endswith("line three") for window in windows)
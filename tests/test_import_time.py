@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+from model_scheduler import ModelScheduler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generous enough for slow CI machines, yet well below importing the Gemini SDK and pandas eagerly
+IMPORT_BUDGET_SECONDS = 1.5
+HEAVY_MODULES = ("google.generativeai", "pandas")
+
+
+def run_python(code: str) -> str:
+    """Runs `code` in a fresh interpreter without the credentials settings are read from"""
+    env = {name: value for name, value in os.environ.items()
+           if name not in ("API_ID", "API_HASH", "CLIENT_NAME", "GEMINI_KEY")}
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_cli_import_skips_heavy_dependencies_and_settings():
+    output = run_python(
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    seconds, loaded = output.splitlines()
+
+    assert loaded == ""
+    assert float(seconds) < IMPORT_BUDGET_SECONDS
+
+
+def test_help_does_not_need_credentials():
+    output = run_python("import runpy, sys\n"
+                        "sys.argv = ['main.py', '--help']\n"
+                        "try:\n"
+                        "    runpy.run_path('main.py', run_name='__main__')\n"
+                        "except SystemExit:\n"
+                        "    pass\n")
+
+    assert "--daemon" in output
+
+
+def test_sdk_is_configured_on_first_real_model():
+    scheduler = ModelScheduler(["models/fake"], model_factory=lambda name: name, discover_models=False)
+
+    assert scheduler.model("models/fake") == "models/fake"
+    assert scheduler._genai is None
@@ -0,0 +1,91 @@
+import json
+import pstats
+
+import pytest
+
+from instrumentation import Instrumentation, instrumentation, profiling
+from main import collect_analytics
+from replay import FakeGenerativeModel, FakeTelegramClient
+
+
+def test_stage_latencies_are_bucketed():
+    metrics = Instrumentation()
+    metrics.observe("fetch", 0.003)
+    metrics.observe("fetch", 0.3)
+    with metrics.stage("format"):
+        pass
+
+    fetch = metrics.to_dict()['stages']['fetch']
+    assert fetch['count'] == 2
+    assert fetch['max_seconds'] == 0.3
+    assert fetch['buckets']['0.005'] == 1
+    assert fetch['buckets']['0.5'] == 1
+    assert metrics.stages['format'].count == 1
+
+
+def test_export_writes_json_and_prometheus(tmp_path):
+    metrics = Instrumentation()
+    metrics.observe("fetch", 0.02)
+    metrics.count("telegram_requests", 3)
+
+    metrics.export(str(tmp_path))
+
+    data = json.loads((tmp_path / "metrics.json").read_text())
+    assert data['counters'] == {'telegram_requests': 3}
+    assert data['peak_memory_bytes'] > 0
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert "analyzer_telegram_requests_total 3" in prometheus
+    assert 'analyzer_stage_duration_seconds_bucket{stage="fetch",le="0.025"} 1' in prometheus
+    assert 'analyzer_stage_duration_seconds_bucket{stage="fetch",le="+Inf"} 1' in prometheus
+    assert 'analyzer_stage_duration_seconds_count{stage="fetch"} 1' in prometheus
+
+
+def test_metrics_of_other_processes_are_merged():
+    metrics = Instrumentation()
+    metrics.count("gemini_requests")
+    metrics.observe("fetch", 0.003)
+    worker = Instrumentation()
+    worker.count("gemini_requests", 2)
+    worker.observe("fetch", 0.3)
+    worker.observe("format", 100)
+
+    metrics.merge(json.loads(json.dumps(worker.to_dict())))
+
+    data = metrics.to_dict()
+    assert data['counters'] == {'gemini_requests': 3}
+    assert data['stages']['fetch']['count'] == 2
+    assert data['stages']['fetch']['max_seconds'] == 0.3
+    assert data['stages']['fetch']['buckets']['0.5'] == 1
+    assert data['stages']['format']['buckets']['+Inf'] == 1
+
+
+@pytest.mark.asyncio
+async def test_offline_run_records_every_stage(offline_settings, offline_gemini):
+    instrumentation.reset()
+    client = FakeTelegramClient(dialog_count=12, latency=0)
+
+    await collect_analytics(client, offline_settings, offline_gemini(FakeGenerativeModel()))
+
+    assert {'dialog_discovery', 'get_messages', 'formatting', 'performance_analysis', 'gemini_request'} \
+        <= set(instrumentation.stages)
+    # get_me and the page of dialogs are not counted
+    assert instrumentation.counters['telegram_requests'] == client.requests - 2
+    assert instrumentation.counters['dialogs_scanned'] == 12
+    assert instrumentation.counters['gemini_requests'] == 10
+    assert instrumentation.counters['gemini_prompt_tokens'] > 0
+
+
+@pytest.mark.parametrize("mode, file_name", [("cprofile", "profile.pstats"), ("tracemalloc", "tracemalloc.txt")])
+def test_profiling_modes_write_a_profile(mode, file_name, tmp_path):
+    with profiling(mode, str(tmp_path)):
+        sorted(range(1000), key=lambda value: -value)
+
+    assert (tmp_path / file_name).exists()
+    if mode == "cprofile":
+        assert pstats.Stats(str(tmp_path / file_name)).total_calls > 0
+
+
+def test_unknown_profile_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        with profiling("perf", str(tmp_path)):
+            pass
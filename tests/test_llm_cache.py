@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from llm_cache import LLMResultCache
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "cache.sqlite"))
+    key = cache.make_key("template", "models/gemini", "conversation")
+
+    assert cache.get(key) is None
+    cache.set(key, "true")
+    assert cache.get(key) == "true"
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_cache_key_depends_on_all_parts():
+    keys = {
+        LLMResultCache.make_key("template", "model", "conversation"),
+        LLMResultCache.make_key("template2", "model", "conversation"),
+        LLMResultCache.make_key("template", "model2", "conversation"),
+        LLMResultCache.make_key("template", "model", "conversation2"),
+    }
+    assert len(keys) == 4
+
+
+def test_cache_persists_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    LLMResultCache(path).set("key", "value")
+    assert LLMResultCache(path).get("key") == "value"
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "cache.sqlite"), ttl=timedelta(seconds=-1))
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMResultCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()['size'] == 2
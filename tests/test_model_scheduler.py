@@ -0,0 +1,101 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from model_scheduler import BackoffPolicy, ModelScheduler
+
+NO_BACKOFF = BackoffPolicy(base_delay=0, max_delay=0)
+
+
+class ScriptedModel:
+    """Raises the scripted errors in order, then answers with its name"""
+
+    def __init__(self, name, errors=()):
+        self.name = name
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return SimpleNamespace(text=self.name)
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        return self.generate_content(prompt, generation_config)
+
+
+def make_scheduler(models, **kwargs) -> ModelScheduler:
+    return ModelScheduler(list(models), model_factory=models.__getitem__, backoff=NO_BACKOFF,
+                          discover_models=False, **kwargs)
+
+
+def test_rate_limit_is_retried_on_the_same_model():
+    models = {"a": ScriptedModel("a", [google_exceptions.ResourceExhausted("quota")] * 2), "b": ScriptedModel("b")}
+    scheduler = make_scheduler(models)
+
+    assert scheduler.generate("prompt") == "a"
+    assert models["a"].calls == 3
+    assert scheduler.metrics['retries'] == 2
+
+
+def test_rejected_request_falls_back_to_next_model():
+    models = {"a": ScriptedModel("a", [google_exceptions.NotFound("no such model")]), "b": ScriptedModel("b")}
+    scheduler = make_scheduler(models)
+
+    assert scheduler.generate("prompt") == "b"
+    assert scheduler.metrics['fallbacks'] == 1
+
+
+def test_open_circuit_skips_model():
+    models = {"a": ScriptedModel("a", [google_exceptions.ServiceUnavailable("down")] * 10), "b": ScriptedModel("b")}
+    scheduler = make_scheduler(models, failure_threshold=2, cooldown=60)
+
+    assert scheduler.generate("prompt") == "b"
+    assert scheduler.generate("prompt") == "b"
+    assert models["a"].calls == 2
+    assert scheduler.metrics['circuit_opens'] == 1
+
+
+def test_authentication_errors_are_not_retried():
+    models = {"a": ScriptedModel("a", [google_exceptions.Unauthenticated("bad key")]), "b": ScriptedModel("b")}
+    with pytest.raises(google_exceptions.Unauthenticated):
+        make_scheduler(models).generate("prompt")
+
+
+def test_gives_up_after_max_attempts():
+    models = {"a": ScriptedModel("a", [google_exceptions.ResourceExhausted("quota")] * 10)}
+    scheduler = make_scheduler(models, max_attempts=3, failure_threshold=100)
+    with pytest.raises(google_exceptions.ResourceExhausted):
+        scheduler.generate("prompt")
+    assert scheduler.metrics['failures'] == 1
+
+
+def test_backoff_grows_and_is_capped():
+    policy = BackoffPolicy(base_delay=1, max_delay=10)
+    random.seed(0)
+    assert all(0 <= policy.delay(0) <= 1 for _ in range(100))
+    assert all(0 <= policy.delay(10) <= 10 for _ in range(100))
+
+
+@pytest.mark.asyncio
+async def test_batch_finishes_under_quota_pressure():
+    rng = random.Random(1)
+
+    class FlakyModel:
+        async def generate_content_async(self, prompt, generation_config=None):
+            await asyncio.sleep(0)
+            if rng.random() < 0.3:
+                raise google_exceptions.ResourceExhausted("quota")
+            return SimpleNamespace(text="ok")
+
+    model = FlakyModel()
+    scheduler = ModelScheduler(["a"], model_factory=lambda name: model, backoff=NO_BACKOFF,
+                               discover_models=False, max_attempts=10, failure_threshold=1000)
+
+    results = await asyncio.gather(*(scheduler.generate_async("prompt") for _ in range(200)))
+    assert results == ["ok"] * 200
+    assert scheduler.metrics['retries'] > 0
@@ -0,0 +1,72 @@
+from instrumentation import Instrumentation, instrumentation
+from multi_account import account_settings, analyze_accounts, merge_account_analytics
+from manager_performance import PerformanceReporter
+from response_aggregates import ResponseAggregate, TeamRollup
+from settings import TelegramScrapingSettings
+
+
+def make_analytics(avg_response_time: float) -> dict:
+    return {
+        'performance': {
+            'metrics': {
+                'total_messages': 4, 'manager_messages': 2, 'client_messages': 2, 'response_rate': 1.0,
+                'avg_response_time': avg_response_time, 'quick_responses': 1, 'slow_responses': 0,
+                'working_hours_avg_response': avg_response_time, 'out_of_hours_messages': 0
+            }
+        },
+        'has_unfinished_promises': False,
+        'quality_analysis': {'has_issues': False, 'issues_found': [], 'severity': "low", 'summary': ""}
+    }
+
+
+def test_merged_report_has_manager_column(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    merged = merge_account_analytics([
+        ("alice", {"Client A": make_analytics(1.0)}),
+        ("bob", {"Client A": make_analytics(2.0), "Client B": make_analytics(3.0)}),
+    ])
+    assert list(merged) == ["alice / Client A", "bob / Client A", "bob / Client B"]
+
+    summary = PerformanceReporter(merged).generate_summary_table()
+    assert list(summary['Manager']) == ["alice", "bob", "bob"]
+    assert list(summary['Client']) == ["Client A", "Client A", "Client B"]
+
+
+def test_account_settings_split_store_and_rate_limit():
+    settings = TelegramScrapingSettings(api_id=1, api_hash="x", client_name="main", gemini_key="x",
+                                        gemini_requests_per_minute=15, sessions=["alice", "bob"])
+    derived = account_settings(settings, "alice", workers=2)
+
+    assert derived.client_name == "alice"
+    assert derived.message_store_path == "cache/messages_alice.sqlite"
+    assert derived.gemini_requests_per_minute == 7
+    assert derived.sessions == []
+
+
+def offline_account(settings: TelegramScrapingSettings):
+    if settings.client_name == "broken":
+        raise RuntimeError("Telegram session 'broken' is not authorized")
+    aggregate = ResponseAggregate()
+    aggregate.response_times.add(1.0)
+    metrics = Instrumentation()
+    metrics.count("gemini_requests", 2)
+    metrics.observe("get_messages", 0.02)
+    return settings.client_name, {"Client A": make_analytics(1.0)}, aggregate, metrics.to_dict()
+
+
+def test_failed_accounts_are_reported_without_aborting():
+    instrumentation.reset()
+    settings = TelegramScrapingSettings(api_id=1, api_hash="x", client_name="main", gemini_key="x")
+    rollup = TeamRollup()
+    failed = {}
+
+    merged = analyze_accounts(settings, ["alice", "broken", "bob"], max_workers=2, rollup=rollup, failed=failed,
+                              worker=offline_account)
+
+    assert list(merged) == ["alice / Client A", "bob / Client A"]
+    assert set(rollup.managers) == {"alice", "bob"}
+    assert list(failed) == ["broken"]
+    assert "not authorized" in str(failed["broken"])
+    # Instrumentation of the worker processes is merged into the exported one
+    assert instrumentation.counters['gemini_requests'] == 4
+    assert instrumentation.stages['get_messages'].count == 2
@@ -0,0 +1,78 @@
+import pytest
+
+from gemini_wrapper import GeminiWrapper
+from model_scheduler import ModelScheduler
+from promise_prefilter import PromisePrefilter
+from replay import FakeGenerativeModel, default_responder
+
+
+@pytest.mark.parametrize("manager_text", [
+    "I'll send the invoice tonight",
+    "Let me check with the warehouse",
+    "We will call you back",
+    "Отправлю счёт до конца дня",
+    "Перезвоню завтра",
+    "Уточню и напишу",
+])
+def test_commitments_are_passed_to_the_llm(manager_text):
+    conversation = f"[06/10 10:00] Client: Hi\n[06/10 10:01] Manager: {manager_text}"
+    assert PromisePrefilter().may_contain_promise(conversation)
+
+
+@pytest.mark.parametrize("reply", ["Sure", "Ok", "Will do", "Yes, no problem", "Done by 5pm", "Хорошо",
+                                   "Договорились", "ок", "👍"])
+def test_any_answer_to_a_request_is_passed_to_the_llm(reply):
+    conversation = f"[06/10 10:00] Client: Can you send the invoice today?\n[06/10 10:01] Manager: {reply}"
+    assert PromisePrefilter().may_contain_promise(conversation)
+
+
+def test_later_lines_of_a_manager_message_are_matched():
+    conversation = "[06/10 10:00] Client: Hi\n[06/10 10:01] Manager: Hello!\nI'll send you the invoice tomorrow"
+    assert PromisePrefilter().may_contain_promise(conversation)
+
+
+def test_later_lines_of_a_client_request_are_matched():
+    conversation = "[06/10 10:00] Client: Hi\nI need the price list\n[06/10 10:01] Manager: 👍"
+    assert PromisePrefilter().may_contain_promise(conversation)
+
+
+@pytest.mark.parametrize("reply", ["Sure", "Done by 5pm", "Договорились"])
+def test_agreements_count_as_commitments(reply):
+    conversation = f"[06/10 10:00] Client: The invoice is wrong\n[06/10 10:01] Manager: {reply}"
+    assert PromisePrefilter().may_contain_promise(conversation)
+
+
+@pytest.mark.parametrize("conversation", [
+    "[06/10 10:00] Client: Hi\n[06/10 10:01] Manager: The price is 20 euros",
+    "[06/10 10:00] Client: Здравствуйте\n[06/10 10:01] Manager: Доставка стоит 300 рублей",
+    # Only manager lines count
+    "[06/10 10:00] Client: I'll call you tomorrow\n[06/10 10:01] Manager: Thanks",
+    "",
+])
+def test_conversations_without_commitments_are_skipped(conversation):
+    prefilter = PromisePrefilter()
+    assert not prefilter.may_contain_promise(conversation)
+    assert prefilter.skipped == prefilter.checked == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("combined_analysis", [True, False])
+async def test_skipped_check_uses_the_quality_prompt_only(combined_analysis):
+    prompts = []
+
+    def responder(prompt):
+        prompts.append(prompt)
+        return default_responder(prompt)
+
+    scheduler = ModelScheduler(["models/fake"], model_factory=lambda name: FakeGenerativeModel(responder=responder),
+                               discover_models=False)
+    gemini = GeminiWrapper(requests_per_minute=0, combined_analysis=combined_analysis, scheduler=scheduler,
+                           prefilter=PromisePrefilter())
+
+    result = await gemini.async_analyze_conversation("[06/10 10:01] Manager: The price is 20 euros")
+
+    assert result['has_unfinished_promises'] is False
+    assert result['quality_analysis']['has_issues'] is False
+    assert len(prompts) == 1
+    assert "has_unfinished_promises" not in prompts[0]
+    assert gemini.prefilter.skipped == 1
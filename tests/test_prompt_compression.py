@@ -0,0 +1,106 @@
+import pytest
+
+from gemini_wrapper import GeminiWrapper
+from model_scheduler import ModelScheduler
+from prompt_compression import ConversationCompressor
+from replay import FakeGenerativeModel, default_responder
+
+PRICE_LIST = "\n".join(f"Item {index}: premium widget model {index}, {10 + index} euros per unit"
+                       for index in range(20))
+
+
+def test_non_informative_messages_are_dropped():
+    conversation = "\n".join([
+        "[06/10 10:00] Client: Hi, what does delivery cost?",
+        "[06/10 10:01] Client: 👍👍",
+        "[06/10 10:02] Manager: Delivery is 5 euros",
+        "[06/10 10:03] Client: Ok, thanks!",
+        "[06/10 10:04] Client: Спасибо",
+        "[06/10 10:05] Client: ...",
+    ])
+
+    assert ConversationCompressor().compress_messages(conversation) == [
+        "[06/10 10:00] Client: Hi, what does delivery cost?",
+        "[06/10 10:02] Manager: Delivery is 5 euros",
+    ]
+
+
+@pytest.mark.parametrize("reply", ["ok", "ок", "Ok, thanks", "👍"])
+def test_manager_acknowledgements_are_kept(reply):
+    conversation = ("[06/10 10:00] Client: Can you send the invoice by end of day?\n"
+                    f"[06/10 10:01] Manager: {reply}")
+
+    assert ConversationCompressor().compress_messages(conversation) == conversation.splitlines()
+
+
+def test_back_to_back_repeats_are_collapsed():
+    conversation = "\n".join([
+        "[06/10 10:00] Client: Hello?",
+        "[06/10 10:05] Client: hello",
+        "[06/10 10:10] Client: HELLO!!",
+        "[06/10 10:11] Manager: Hello",
+        "[06/10 10:12] Client: Hello?",
+    ])
+
+    assert ConversationCompressor().compress_messages(conversation) == [
+        "[06/10 10:00] Client: Hello? (×3)",
+        "[06/10 10:11] Manager: Hello",
+        "[06/10 10:12] Client: Hello?",
+    ]
+
+
+def test_repeated_long_messages_reference_the_first_one():
+    edited = PRICE_LIST.replace("Item 7: premium widget model 7, 17", "Item 7: premium widget model 7, 15")
+    conversation = "\n".join([
+        f"[06/10 10:00] Manager: {PRICE_LIST}",
+        "[06/10 10:01] Client: Too expensive",
+        f"[06/11 09:00] Manager: {edited}",
+        "[06/11 09:30] Manager: Here is a completely different offer for you, " + "with a discount " * 20,
+    ])
+
+    compressed = ConversationCompressor().compress_messages(conversation)
+
+    assert compressed[0] == f"[06/10 10:00] Manager: {PRICE_LIST}"
+    assert compressed[2] == "[06/11 09:00] Manager: [same as the message of 06/10 10:00]"
+    assert compressed[3].startswith("[06/11 09:30] Manager: Here is a completely different offer")
+
+
+def test_long_messages_keep_their_beginning_and_end():
+    text = "Question first. " + "x" * 5000 + " Will you send it today?"
+    compressed = ConversationCompressor(max_message_chars=300).compress_messages(f"[06/10 10:00] Client: {text}")[0]
+
+    assert compressed.startswith("[06/10 10:00] Client: Question first.")
+    assert compressed.endswith("Will you send it today?")
+    assert len(compressed) < 350
+
+
+def test_token_reduction_is_reported():
+    compressor = ConversationCompressor()
+    conversation = "\n".join(f"[06/{day:02d} 09:00] Client: What are your prices?\n"
+                             f"[06/{day:02d} 10:00] Manager: {PRICE_LIST}" for day in range(1, 11))
+
+    compressed = compressor.compress(conversation)
+
+    assert compressed.count("[same as the message of 06/01 10:00]") == 9
+    assert compressor.conversations == 1
+    assert compressor.tokens_after < compressor.tokens_before / 5
+    assert compressor.tokens_saved == compressor.tokens_before - compressor.tokens_after
+
+
+@pytest.mark.asyncio
+async def test_wrapper_prompts_the_compressed_conversation():
+    prompts = []
+
+    def responder(prompt):
+        prompts.append(prompt)
+        return default_responder(prompt)
+
+    scheduler = ModelScheduler(["models/fake"], model_factory=lambda name: FakeGenerativeModel(responder=responder),
+                               discover_models=False)
+    gemini = GeminiWrapper(requests_per_minute=0, scheduler=scheduler, compressor=ConversationCompressor())
+
+    await gemini.async_analyze_conversation("[06/10 10:00] Client: Price?\n[06/10 10:01] Client: 🙏")
+
+    assert len(prompts) == 1
+    assert "[06/10 10:00] Client: Price?" in prompts[0]
+    assert "🙏" not in prompts[0]
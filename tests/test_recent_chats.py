@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Channel, ChatPhotoEmpty, Message, User
+
+from main import get_candidate_dialogs, get_recent_client_chats
+from message_record import MessageRecord
+from message_store import MessageStore
+from replay import FakeTelegramClient
+
+
+@pytest.mark.asyncio
+async def test_concurrent_fetch_matches_sequential():
+    sequential = await get_recent_client_chats(FakeTelegramClient(dialog_count=30, latency=0), chat_limit=10)
+    concurrent = await get_recent_client_chats(FakeTelegramClient(dialog_count=30, latency=0), chat_limit=10,
+                                               concurrency=4)
+    assert [d.id for d, _ in concurrent] == [d.id for d, _ in sequential]
+    assert len(concurrent) == 10
+
+
+@pytest.mark.asyncio
+async def test_histories_are_converted_to_records(tmp_path):
+    client = FakeTelegramClient(dialog_count=2, latency=0)
+    stored = await get_recent_client_chats(client, chat_limit=2, store=MessageStore(str(tmp_path / "m.sqlite")))
+    fetched = await get_recent_client_chats(client, chat_limit=2)
+
+    assert stored == fetched
+    for dialog, messages in fetched:
+        assert all(isinstance(message, MessageRecord) for message in messages)
+        assert messages == [MessageRecord.from_message(message) for message in client.histories[dialog.id]]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_fetch_skips_empty_histories():
+    client = FakeTelegramClient(dialog_count=30, latency=0)
+    for dialog in client.dialogs[:5]:
+        client.histories[dialog.id] = []
+
+    chats = await get_recent_client_chats(client, chat_limit=10, concurrency=8)
+    assert [d.id for d, _ in chats] == [d.id for d in client.dialogs[5:15]]
+
+
+@pytest.mark.asyncio
+async def test_flood_wait_is_retried():
+    client = FakeTelegramClient(dialog_count=3, latency=0)
+    original = client.get_messages
+    failures = {'left': 1}
+
+    async def flaky_get_messages(*args, **kwargs):
+        if failures['left']:
+            failures['left'] -= 1
+            raise FloodWaitError(request=None, capture=0)
+        return await original(*args, **kwargs)
+
+    client.get_messages = flaky_get_messages
+    chats = await get_recent_client_chats(client, chat_limit=3, concurrency=2)
+    assert len(chats) == 3
+
+
+@pytest.mark.asyncio
+async def test_incremental_sync_fetches_only_new_messages(tmp_path):
+    store = MessageStore(str(tmp_path / "messages.sqlite"))
+    client = FakeTelegramClient(dialog_count=5, latency=0)
+    first = await get_recent_client_chats(client, chat_limit=5, store=store)
+
+    # Unchanged dialogs are served from the store, only the first page of dialogs is requested
+    client.requests = 0
+    second = await get_recent_client_chats(client, chat_limit=5, store=store)
+    assert client.requests == 1
+    assert [[m.id for m in messages] for _, messages in second] == \
+        [[m.id for m in messages] for _, messages in first]
+
+    # A new message in one dialog is fetched with min_id and merged with stored history
+    dialog = client.dialogs[0]
+    last = client.histories[dialog.id][-1]
+    new_message = Message(id=last.id + 1, peer_id=last.peer_id, date=last.date + timedelta(minutes=1),
+                          message="new", from_id=last.from_id)
+    client.histories[dialog.id].append(new_message)
+    dialog.date = new_message.date
+
+    third = await get_recent_client_chats(client, chat_limit=5, store=store)
+    assert [m.id for m in third[0][1]] == [m.id for m in first[0][1]] + [new_message.id]
+    assert third[0][1][-1].text == "new"
+
+
+@pytest.mark.asyncio
+async def test_dialog_discovery_stops_at_old_dialogs():
+    client = FakeTelegramClient(dialog_count=500, messages_per_dialog=1, latency=0)
+    for dialog in client.dialogs[250:]:
+        dialog.date -= timedelta(days=400)
+    # A pinned old dialog is listed first and must not end the iteration
+    client.dialogs[-1].pinned = True
+    client.dialogs[1].entity = User(id=client.dialogs[1].id, bot=True)
+    client.dialogs[2].entity = Channel(id=client.dialogs[2].id, title="news", photo=ChatPhotoEmpty(),
+                                       date=datetime.now(timezone.utc))
+
+    candidates, _ = await get_candidate_dialogs(client, timedelta(days=30), timedelta(days=365))
+
+    assert [d.id for d in candidates] == [d.id for d in client.dialogs[:250] if d not in client.dialogs[1:3]]
+    # Pages of 100 dialogs: the pinned one and 99 recent ones, then up to the first old one
+    assert client.requests == 3
+
+
+@pytest.mark.asyncio
+async def test_stored_dialog_list_is_reused(tmp_path):
+    store = MessageStore(str(tmp_path / "messages.sqlite"))
+    client = FakeTelegramClient(dialog_count=300, messages_per_dialog=1, latency=0)
+    first, _ = await get_candidate_dialogs(client, timedelta(days=30), timedelta(days=365), store)
+
+    # Activity in an older dialog moves it to the top, the others come from the store
+    dialog = client.dialogs[200]
+    dialog.date = client.dialogs[0].date + timedelta(minutes=1)
+    client.requests = 0
+    second, _ = await get_candidate_dialogs(client, timedelta(days=30), timedelta(days=365), store)
+
+    assert client.requests == 1
+    assert second[0].id == dialog.id
+    assert sorted(d.id for d in second) == sorted(d.id for d in first)
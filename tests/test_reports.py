@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from manager_performance import PerformanceReporter
+
+
+def make_analytics(count: int, manager: str = None) -> dict:
+    analytics = {}
+    for index in range(count):
+        entry = {
+            'performance': {'metrics': {
+                'total_messages': 10 + index,
+                'manager_messages': 4,
+                'client_messages': 6 + index,
+                'response_rate': 2 / 3,
+                'avg_response_time': 12.345,
+                'working_hours_avg_response': 7.25,
+                'out_of_hours_messages': 1,
+                'quick_responses': 3,
+                'slow_responses': 1,
+            }},
+            'quality_analysis': {'has_issues': index % 2 == 0, 'issues_found': [], 'severity': "low", 'summary': ""},
+            'has_unfinished_promises': index % 3 == 0,
+        }
+        if manager:
+            entry.update(manager=manager, client=f"<Client {index}>")
+        analytics[f"client {index}"] = entry
+    return analytics
+
+
+def test_report_model_keeps_typed_metrics(tmp_path):
+    reporter = PerformanceReporter(make_analytics(3), output_dir=str(tmp_path))
+
+    reporter.save_reports()
+
+    report = pd.read_parquet(tmp_path / "report.parquet")
+    assert 'manager' not in report
+    assert report['response_rate'].tolist() == [2 / 3] * 3
+    assert report['total_messages'].dtype == "int64"
+    assert report['has_unfinished_promises'].tolist() == [True, False, False]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 10000])
+def test_chunked_files_match_pandas_rendering(chunk_size, tmp_path):
+    reporter = PerformanceReporter(make_analytics(5, manager="alice"), output_dir=str(tmp_path),
+                                   formats=("csv", "html"), chunk_size=chunk_size)
+
+    reporter.save_reports()
+
+    summary = reporter.generate_summary_table()
+    assert summary['Manager'].tolist() == ["alice"] * 5
+    assert summary['Response Rate'][0] == "0.67"
+    assert (tmp_path / "summary.csv").read_text(encoding="utf-8") == summary.to_csv()
+    assert (tmp_path / "summary.html").read_text(encoding="utf-8") == summary.to_html()
+    detailed = reporter.generate_detailed_metrics()
+    assert (tmp_path / "detailed_metrics.html").read_text(encoding="utf-8") == detailed.to_html()
+    assert not (tmp_path / "report.parquet").exists()
+
+
+def test_empty_report_writes_headers(tmp_path):
+    PerformanceReporter({}, output_dir=str(tmp_path), formats=("csv",)).save_reports()
+
+    assert (tmp_path / "summary.csv").read_text().startswith(",Client,Total Messages")
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        PerformanceReporter({}, output_dir=str(tmp_path), formats=("xlsx",))
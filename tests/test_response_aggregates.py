@@ -0,0 +1,124 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from business_calendar import BusinessCalendar
+from main import collect_analytics, report_results, stream_analytics
+from manager_performance import IncrementalPerformanceAnalyzer, ManagerPerformanceAnalyzer
+from replay import FakeGenerativeModel, FakeTelegramClient, make_random_chat
+from response_aggregates import (QuantileSketch, ResponseAggregate, TeamRollup, append_history, load_history,
+                                 merge_history, trend)
+from vectorized_performance import analyze_chats
+
+MANAGER_ID = 1
+
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    values = np.random.default_rng(0).lognormal(mean=2, sigma=1.5, size=50_000)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    sketch.add_array(values)
+
+    for q in (0.5, 0.9, 0.99):
+        expected = np.quantile(values, q, method="lower")
+        assert sketch.quantile(q) == pytest.approx(expected, rel=0.01)
+    assert sketch.quantile(1) == values.max()
+    assert len(sketch.buckets) < 2000
+
+
+def test_merged_sketches_equal_one_sketch_of_all_values():
+    values = np.random.default_rng(1).exponential(20, size=10_000)
+    values[:100] = 0
+    whole = QuantileSketch()
+    whole.add_array(values)
+
+    merged = QuantileSketch()
+    for part in np.array_split(values, 7):
+        sketch = QuantileSketch()
+        for value in part:
+            sketch.add(float(value))
+        merged.merge(sketch)
+
+    assert merged.buckets == whole.buckets
+    assert merged.zero_count == whole.zero_count >= 100
+    assert merged.quantile(0.9) == whole.quantile(0.9)
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+def test_aggregate_round_trips_through_json():
+    aggregate = ResponseAggregate()
+    calendar = BusinessCalendar("Asia/Kolkata")
+    aggregate.add_responses(np.array([1_700_000_000, 1_700_003_600]), np.array([3.0, 45.0]), calendar)
+    aggregate.add_client_messages(np.array([1_700_000_000]), calendar)
+
+    restored = ResponseAggregate.from_dict(json.loads(json.dumps(aggregate.to_dict())))
+
+    assert restored.summary() == aggregate.summary()
+    assert np.array_equal(restored.load, aggregate.load)
+    assert np.array_equal(restored.hourly_responses, aggregate.hourly_responses)
+    # 1_700_000_000 is 22:13 UTC on Tuesday, 03:43 on Wednesday in India
+    assert aggregate.load[2, 3] == 1
+
+
+def test_analyzers_add_the_same_aggregate():
+    calendar = BusinessCalendar("America/New_York")
+    rng = random.Random(5)
+    chats = [(index, make_random_chat(rng, 100 + index, rng.randint(0, 80), MANAGER_ID)) for index in range(25)]
+
+    vectorized = ResponseAggregate()
+    analyze_chats(chats, MANAGER_ID, calendar, vectorized)
+    batch = ResponseAggregate()
+    incremental = ResponseAggregate()
+    for _, messages in chats:
+        ManagerPerformanceAnalyzer(messages, MANAGER_ID, calendar, batch).analyze()
+        analyzer = IncrementalPerformanceAnalyzer(MANAGER_ID, calendar, incremental)
+        for message in messages:
+            analyzer.update(message)
+
+    for aggregate in (batch, incremental):
+        assert aggregate.response_times.buckets == vectorized.response_times.buckets
+        assert aggregate.summary() == pytest.approx(vectorized.summary())
+        assert np.array_equal(aggregate.hourly_responses, vectorized.hourly_responses)
+        assert np.allclose(aggregate.hourly_response_minutes, vectorized.hourly_response_minutes)
+        assert np.array_equal(aggregate.load, vectorized.load)
+    assert vectorized.summary()['responses'] > 0
+
+
+def test_team_rollup_merges_managers_and_runs(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    run_at = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    for run in range(3):
+        rollup = TeamRollup()
+        rollup.aggregate("anna").response_times.add(5 + run)
+        rollup.aggregate("boris").response_times.add(50)
+        append_history(path, rollup, run_at + timedelta(days=run))
+
+    history = load_history(path)
+
+    assert len(history) == 3
+    assert [row['p50'] for row in trend(history, "anna")] == pytest.approx([5, 6, 7], rel=0.01)
+    assert [row['responses'] for row in trend(history)] == [2, 2, 2]
+    merged = merge_history(history, since=run_at + timedelta(days=1))
+    assert merged.team.summary()['responses'] == 4
+    assert merged.managers["boris"].summary()['max_response_time'] == 50
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("analyze", [collect_analytics, stream_analytics])
+async def test_run_writes_aggregates_and_history(analyze, offline_settings, offline_gemini, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeTelegramClient(dialog_count=12, latency=0)
+    rollup = TeamRollup()
+
+    all_analytics = await analyze(client, offline_settings, offline_gemini(FakeGenerativeModel()),
+                                  rollup.aggregate("offline"))
+    report_results(all_analytics, offline_settings, rollup)
+
+    data = json.loads((tmp_path / "reports" / "aggregates.json").read_text())
+    responses = sum(analytics['performance']['metrics']['quick_responses'] for analytics in all_analytics.values())
+    assert data['team']['summary']['responses'] >= responses > 0
+    assert data['managers']['offline']['summary'] == data['team']['summary']
+    assert len(load_history(offline_settings.aggregate_history_path)) == 1
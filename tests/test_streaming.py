@@ -0,0 +1,69 @@
+import asyncio
+import random
+
+import pytest
+
+from main import format_conversation_to_strings, get_recent_client_chats, stream_analytics, stream_client_chats
+from manager_performance import IncrementalPerformanceAnalyzer, ManagerPerformanceAnalyzer
+from replay import FakeGenerativeModel, FakeTelegramClient, make_random_chat
+
+MANAGER_ID = 1
+
+
+def test_incremental_metrics_match_batch_analyzer():
+    rng = random.Random(7)
+    for index in range(30):
+        messages = make_random_chat(rng, 100 + index, rng.randint(0, 60), MANAGER_ID)
+        analyzer = IncrementalPerformanceAnalyzer(MANAGER_ID)
+        for message in messages:
+            analyzer.update(message)
+
+        expected = ManagerPerformanceAnalyzer(messages, MANAGER_ID).analyze()
+        actual = analyzer.result()
+        assert actual['metrics'] == pytest.approx(expected['metrics'])
+        assert actual['summary'] == expected['summary']
+
+
+@pytest.mark.asyncio
+async def test_stream_matches_batch_fetch():
+    batch_client = FakeTelegramClient(dialog_count=20, latency=0)
+    batch_client.histories[batch_client.dialogs[0].id] = []
+    # Same dialogs and dates, they depend on the current time
+    stream_client = FakeTelegramClient(dialog_count=0, latency=0)
+    stream_client.dialogs, stream_client.histories = batch_client.dialogs, batch_client.histories
+
+    batch = await get_recent_client_chats(batch_client, chat_limit=5)
+    streamed = [chat async for chat in stream_client_chats(stream_client, MANAGER_ID, chat_limit=5)]
+
+    assert [dialog.id for dialog, _, _ in streamed] == [dialog.id for dialog in stream_client.dialogs[1:6]]
+    for (dialog, performance, formatted), (_, messages) in zip(streamed, batch):
+        expected = ManagerPerformanceAnalyzer(messages, MANAGER_ID).analyze()
+        assert performance['metrics'] == pytest.approx(expected['metrics'])
+        assert formatted == format_conversation_to_strings(dialog, messages, MANAGER_ID)
+
+
+@pytest.mark.asyncio
+async def test_streaming_pauses_while_analyses_are_pending(offline_settings, offline_gemini):
+    settings = offline_settings.model_copy(update={'chat_limit': 30, 'gemini_max_concurrency': 2})
+    client = FakeTelegramClient(dialog_count=30, latency=0)
+    gemini = offline_gemini(FakeGenerativeModel())
+    analyze = gemini.async_analyze_conversation
+    pending = []
+    max_pending = 0
+
+    async def slow_analysis(text):
+        nonlocal max_pending
+        pending.append(text)
+        max_pending = max(max_pending, len(pending))
+        await asyncio.sleep(0.01)
+        try:
+            return await analyze(text)
+        finally:
+            pending.remove(text)
+
+    gemini.async_analyze_conversation = slow_analysis
+    all_analytics = await stream_analytics(client, settings, gemini)
+
+    assert len(all_analytics) == 30
+    assert all('quality_analysis' in analytics for analytics in all_analytics.values())
+    assert max_pending == 4
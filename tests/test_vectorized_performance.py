@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+from manager_performance import ManagerPerformanceAnalyzer
+from replay import make_random_chat
+from vectorized_performance import analyze_chats
+
+MANAGER_ID = 1
+
+
+def test_vectorized_metrics_match_scalar_analyzer():
+    rng = random.Random(42)
+    chats = [(f"client {i}", make_random_chat(rng, 100 + i, rng.randint(0, 60), MANAGER_ID)) for i in range(40)]
+
+    vectorized = analyze_chats(chats, MANAGER_ID)
+
+    for key, messages in chats:
+        expected = ManagerPerformanceAnalyzer(messages, MANAGER_ID).analyze()
+        actual = vectorized[key]
+        assert actual['total_messages'] == expected['total_messages']
+        assert actual['metrics'] == pytest.approx(expected['metrics'])
+        assert actual['summary'] == expected['summary']
+
+
+def test_empty_input():
+    assert analyze_chats([], MANAGER_ID) == {}
+    assert analyze_chats([("client", [])], MANAGER_ID)["client"]['summary'] == "No messages to analyze"
@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+import numpy as np
+from business_calendar import DEFAULT_CALENDAR, BusinessCalendar
+from manager_performance import ManagerPerformanceAnalyzer
+from message_record import MessageRecord
+from response_aggregates import ResponseAggregate
+
+ROLE_UNKNOWN = -1
+ROLE_CLIENT = 0
+ROLE_MANAGER = 1
+
+
+@dataclass
+class MessageFrame:
+    """
+    Columnar representation of the messages of many chats.
+
+    Messages of one chat are stored contiguously and in chronological order,
+    `chat_codes` indexes into `chat_keys`.
+    """
+    chat_keys: List[Hashable]
+    chat_codes: np.ndarray  # int64, chat index of each message
+    timestamps: np.ndarray  # int64, unix time in seconds
+    roles: np.ndarray  # int8, ROLE_MANAGER / ROLE_CLIENT / ROLE_UNKNOWN
+    text_lengths: np.ndarray  # int32, 0 for messages without text
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+def _role(message: MessageRecord, manager_id: int) -> int:
+    if message.sender_id is None:
+        return ROLE_UNKNOWN
+    return ROLE_MANAGER if message.sender_id == manager_id else ROLE_CLIENT
+
+
+def build_message_frame(chats: Iterable[Tuple[Hashable, List[MessageRecord]]], manager_id: int) -> MessageFrame:
+    """
+    Converts message records of many chats into a single MessageFrame.
+
+    Args:
+        chats: Pairs of chat key and chronologically ordered messages of the chat
+        manager_id: Telegram user ID of the manager
+    """
+    chat_keys = []
+    chat_codes = []
+    timestamps = []
+    roles = []
+    text_lengths = []
+
+    for code, (key, messages) in enumerate(chats):
+        chat_keys.append(key)
+        chat_codes.append(np.full(len(messages), code, dtype=np.int64))
+        timestamps.append(np.fromiter((int(m.date.timestamp()) for m in messages),
+                                      dtype=np.int64, count=len(messages)))
+        roles.append(np.fromiter((_role(m, manager_id) for m in messages),
+                                 dtype=np.int8, count=len(messages)))
+        text_lengths.append(np.fromiter((len(m.text) for m in messages),
+                                        dtype=np.int32, count=len(messages)))
+
+    def concat(parts, dtype):
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    return MessageFrame(
+        chat_keys=chat_keys,
+        chat_codes=concat(chat_codes, np.int64),
+        timestamps=concat(timestamps, np.int64),
+        roles=concat(roles, np.int8),
+        text_lengths=concat(text_lengths, np.int32),
+    )
+
+
+def analyze_frame(frame: MessageFrame,
+                  calendar: BusinessCalendar = None,
+                  aggregate: ResponseAggregate = None) -> Dict[Hashable, Dict]:
+    """
+    Computes ManagerPerformanceAnalyzer metrics for every chat of the frame at once.
+
+    Args:
+        frame: Messages of all chats
+        calendar: Working time of the manager, defaults to Mon-Fri 9:00-18:00 UTC
+        aggregate: Response times and client messages of all chats are added to it
+
+    Returns:
+        Mapping of chat key to the same structure ManagerPerformanceAnalyzer.analyze returns
+    """
+    calendar = calendar or DEFAULT_CALENDAR
+    chat_count = len(frame.chat_keys)
+    raw_counts = np.bincount(frame.chat_codes, minlength=chat_count)
+
+    # Only messages with text take part in the analysis
+    valid = frame.text_lengths > 0
+    chats = frame.chat_codes[valid]
+    timestamps = frame.timestamps[valid]
+    roles = frame.roles[valid]
+
+    is_manager = roles == ROLE_MANAGER
+    is_client = roles == ROLE_CLIENT
+
+    total = np.bincount(chats, minlength=chat_count)
+    manager_count = np.bincount(chats[is_manager], minlength=chat_count)
+    client_count = np.bincount(chats[is_client], minlength=chat_count)
+
+    # Index of the latest client message at or before each message, -1 if none
+    positions = np.arange(len(chats))
+    last_client = np.maximum.accumulate(np.where(is_client, positions, -1))
+
+    # First position of every chat, to ignore client messages of previous chats
+    chat_starts = np.full(chat_count, len(chats), dtype=np.int64)
+    np.minimum.at(chat_starts, chats, positions)
+
+    answered = is_manager & (last_client >= chat_starts[chats])
+    request_times = timestamps[last_client[answered]]
+    answer_times = timestamps[answered]
+    response_times = (answer_times - request_times) / 60  # in minutes
+    in_window = (response_times >= 0) & (response_times <= 24 * 60)  # Only responses within 24 hours
+
+    response_chats = chats[answered][in_window]
+    request_times = request_times[in_window]
+    answer_times = answer_times[in_window]
+    response_times = response_times[in_window]
+
+    response_count = np.bincount(response_chats, minlength=chat_count)
+    response_sum = np.bincount(response_chats, weights=response_times, minlength=chat_count)
+    response_max = np.zeros(chat_count)
+    np.maximum.at(response_max, response_chats, response_times)
+
+    quick = np.bincount(response_chats[response_times < 5], minlength=chat_count)
+    slow = np.bincount(response_chats[response_times > 30], minlength=chat_count)
+
+    working = calendar.is_working_array(request_times)
+    working_count = np.bincount(response_chats[working], minlength=chat_count)
+    working_sum = np.bincount(response_chats[working], weights=response_times[working], minlength=chat_count)
+
+    business_times = calendar.working_minutes_array(request_times, answer_times)
+    business_sum = np.bincount(response_chats, weights=business_times, minlength=chat_count)
+
+    out_of_hours = np.bincount(chats[is_manager & ~calendar.is_working_array(timestamps)], minlength=chat_count)
+
+    if aggregate is not None:
+        aggregate.add_responses(request_times, response_times, calendar)
+        aggregate.add_client_messages(timestamps[is_client], calendar)
+
+    initiated = np.zeros(chat_count, dtype=bool)
+    has_valid = chat_starts < len(chats)
+    initiated[has_valid] = is_manager[chat_starts[has_valid]]
+
+    results = {}
+    for code, key in enumerate(frame.chat_keys):
+        if not raw_counts[code]:
+            results[key] = {
+                'total_messages': 0,
+                'metrics': {},
+                'summary': "No messages to analyze"
+            }
+            continue
+
+        metrics = {
+            'total_messages': int(total[code]),
+            'manager_messages': int(manager_count[code]),
+            'client_messages': int(client_count[code]),
+            'response_rate': float(manager_count[code] / client_count[code]) if client_count[code] else 0,
+            'avg_response_time': float(response_sum[code] / response_count[code]) if response_count[code] else 0,
+            'max_response_time': float(response_max[code]) if response_count[code] else 0,
+            'initiated_by_manager': int(initiated[code])
+        }
+
+        detailed = {
+            'quick_responses': int(quick[code]),
+            'slow_responses': int(slow[code]),
+            'messages_per_conversation': metrics['total_messages'],
+            'working_hours_avg_response': (
+                float(working_sum[code] / working_count[code]) if working_count[code] else 0
+            ),
+            'business_avg_response': (
+                float(business_sum[code] / response_count[code]) if response_count[code] else 0
+            ),
+            'out_of_hours_messages': int(out_of_hours[code])
+        }
+
+        results[key] = {
+            'total_messages': metrics['total_messages'],
+            'metrics': {**metrics, **detailed},
+            'summary': ManagerPerformanceAnalyzer._generate_summary(metrics, detailed)
+        }
+
+    return results
+
+
+def analyze_chats(chats: Iterable[Tuple[Hashable, List[MessageRecord]]],
+                  manager_id: int,
+                  calendar: BusinessCalendar = None,
+                  aggregate: ResponseAggregate = None) -> Dict[Hashable, Dict]:
+    """Vectorized equivalent of running ManagerPerformanceAnalyzer on every chat"""
+    return analyze_frame(build_message_frame(chats, manager_id), calendar, aggregate)